@@ -1,9 +1,34 @@
 import heapq
+import sys
+from argparse import ArgumentParser
 from dataclasses import dataclass
+from enum import Enum
 from functools import total_ordering
-from typing import List, Optional, Tuple, Set, Dict
+from itertools import chain, groupby, repeat
+from pathlib import Path
+from typing import List, Optional, Tuple, Set, Dict, Union, Iterable, Iterator
+
+import numpy as np
+
+from playground.minecraft_mazes.bidirectional_astar import solve_with_bidirectional_a_star
+from playground.minecraft_mazes.compact_astar import FlatGrid, SearchStats, solve_with_compact_a_star
+from playground.minecraft_mazes.jump_point_search import solve_with_jump_point_search
+from playground.minecraft_mazes.map_image import GRID_SUFFIX, IMAGE_SUFFIXES, load_grid, load_map_image
+from playground.minecraft_mazes.maze_input import load_problem
 
 Coord = Tuple[int, int]
+TraversableMap = Union[List[List[bool]], np.ndarray]
+
+
+class Engine(Enum):
+    COMPACT = "compact"
+    REFERENCE = "reference"
+
+
+class Algorithm(Enum):
+    A_STAR = "astar"
+    BIDIRECTIONAL = "bidirectional"
+    JUMP_POINT = "jps"
 
 
 @total_ordering
@@ -29,11 +54,79 @@ class _State:
 
 
 def _main():
-    is_traversable_map, start_position, target = _read_problem_input()
-
-    path = _solve_with_a_star(is_traversable_map, start_position, target)
-
-    _print_problem_output(path)
+    parser = ArgumentParser(description="Solves the Minecraft maze problem read from stdin")
+    parser.add_argument("--engine", choices=[engine.value for engine in Engine], default=Engine.COMPACT.value,
+                        help="search implementation to use (default: compact)")
+    parser.add_argument("--algorithm", choices=[algorithm.value for algorithm in Algorithm],
+                        default=Algorithm.A_STAR.value,
+                        help="search strategy to use, only 'astar' is supported by the reference engine "
+                             "(default: astar)")
+    parser.add_argument("--input", required=False,
+                        help="read the problem from this file instead of stdin. may also be a map image or a saved "
+                             "'.npy' grid, in which case '--start' and '--target' are required")
+    parser.add_argument("--mmap", required=False, action="store_true",
+                        help="memory-map the '--input' file instead of reading it")
+    parser.add_argument("--start", type=int, nargs=2, required=False, metavar=("ROW", "COL"),
+                        help="starting position, for image and grid inputs")
+    parser.add_argument("--target", type=int, nargs=2, required=False, metavar=("ROW", "COL"),
+                        help="ending position, for image and grid inputs")
+    parser.add_argument("--grid-size", type=int, nargs=2, required=False, metavar=("ROWS", "COLS"),
+                        help="number of rows and columns of blocks, for image inputs")
+    parser.add_argument("--crop", type=int, nargs=4, required=False, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="pixel box around the blocks, for image inputs")
+    parser.add_argument("--threshold", type=int, default=128,
+                        help="blocks at least this bright (0-255) are traversable, for image inputs (default: 128)")
+    parser.add_argument("--rle", required=False, action="store_true",
+                        help="run-length encode repeated moves, e.g. 'south x12'")
+    args = parser.parse_args()
+
+    input_suffix = Path(args.input).suffix.lower() if args.input else ""
+    if input_suffix in IMAGE_SUFFIXES or input_suffix == GRID_SUFFIX:
+        if args.start is None or args.target is None:
+            parser.error("'--start' and '--target' are required for image and grid inputs")
+        if input_suffix == GRID_SUFFIX:
+            is_traversable_map = load_grid(args.input)
+        elif args.grid_size is None:
+            parser.error("'--grid-size' is required for image inputs")
+        else:
+            crop = tuple(args.crop) if args.crop else None
+            is_traversable_map = load_map_image(args.input, *args.grid_size, crop=crop, threshold=args.threshold)
+        start_position, target = tuple(args.start), tuple(args.target)
+    else:
+        is_traversable_map, start_position, target = load_problem(args.input, use_mmap=args.mmap)
+
+    path = solve_maze(is_traversable_map, start_position, target, Engine(args.engine), Algorithm(args.algorithm))
+
+    _print_problem_output(path, run_length_encoded=args.rle)
+
+
+def solve_maze(
+        is_traversable_map: TraversableMap, start_position: Coord, target: Coord, engine: Engine = Engine.COMPACT,
+        algorithm: Algorithm = Algorithm.A_STAR, stats: Optional[SearchStats] = None
+) -> List[Coord]:
+    if engine == Engine.REFERENCE:
+        if algorithm != Algorithm.A_STAR:
+            raise ValueError(f"The reference engine only supports '{Algorithm.A_STAR.value}', was '{algorithm.value}'")
+        if isinstance(is_traversable_map, np.ndarray):
+            is_traversable_map = is_traversable_map.tolist()
+        return _solve_with_a_star(is_traversable_map, start_position, target)
+    if engine != Engine.COMPACT:
+        raise ValueError(f"Unknown engine {engine}")
+
+    grid = _to_flat_grid(is_traversable_map)
+    if algorithm == Algorithm.A_STAR:
+        return solve_with_compact_a_star(grid, start_position, target, stats)
+    if algorithm == Algorithm.BIDIRECTIONAL:
+        return solve_with_bidirectional_a_star(grid, start_position, target, stats)
+    if algorithm == Algorithm.JUMP_POINT:
+        return solve_with_jump_point_search(grid, start_position, target, stats)
+    raise ValueError(f"Unknown algorithm {algorithm}")
+
+
+def _to_flat_grid(is_traversable_map: TraversableMap) -> FlatGrid:
+    if isinstance(is_traversable_map, np.ndarray):
+        return FlatGrid.from_array(is_traversable_map)
+    return FlatGrid.from_rows(is_traversable_map)
 
 
 def _solve_with_a_star(is_traversable_map: List[List[bool]], start_position: Coord, target: Coord) -> List[Coord]:
@@ -66,7 +159,34 @@ def _solve_with_a_star(is_traversable_map: List[List[bool]], start_position: Coo
     return path
 
 
-def _print_problem_output(path: List[Coord]) -> None:
+def _print_problem_output(path: List[Coord], run_length_encoded: bool = False) -> None:
+    directions = encode_run_lengths(_iter_directions(path)) if run_length_encoded else _iter_directions(path)
+    # One buffered write instead of a print() per move keeps long paths from turning into one syscall per line
+    sys.stdout.write("\n".join(chain(directions, ["fin"])) + "\n")
+
+
+def format_directions(path: List[Coord]) -> List[str]:
+    directions = list(_iter_directions(path))
+    directions.append("fin")
+    return directions
+
+
+def encode_run_lengths(directions: Iterable[str]) -> Iterator[str]:
+    for direction, repeats in groupby(directions):
+        count = sum(1 for _ in repeats)
+        yield direction if count == 1 else f"{direction} x{count}"
+
+
+def decode_run_lengths(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        direction, _, count = line.partition(" x")
+        if count:
+            yield from repeat(direction, int(count))
+        else:
+            yield line
+
+
+def _iter_directions(path: List[Coord]) -> Iterator[str]:
     _direction_name_by_coord_delta: Dict[Coord, str] = {
         (1, 0): "south",
         (-1, 0): "north",
@@ -78,24 +198,7 @@ def _print_problem_output(path: List[Coord]) -> None:
         curr_pos_row, curr_pos_col = path[index]
         next_pos_row, next_pos_col = path[index + 1]
         position_delta = next_pos_row - curr_pos_row, next_pos_col - curr_pos_col
-        print(_direction_name_by_coord_delta[position_delta])
-    print("fin")
-
-
-def _read_problem_input() -> Tuple[List[List[bool]], Coord, Coord]:
-    num_rows = int(input())
-    num_cols = int(input())
-    is_traversable_map: List[List[bool]] = []
-    for _ in range(num_rows):
-        map_line = input()
-        if len(map_line) != num_cols:
-            raise ValueError(f"Map line did not have expected length. Expected {num_cols}, was {len(map_line)}")
-        is_traversable_map.append([char == "0" for char in map_line])
-    start_input = input().split()
-    start_position = (int(start_input[0]), int(start_input[1]))
-    target_input = input().split()
-    target = (int(target_input[0]), int(target_input[1]))
-    return is_traversable_map, start_position, target
+        yield _direction_name_by_coord_delta[position_delta]
 
 
 def _estimate_remaining(position: Coord, target: Coord) -> float:
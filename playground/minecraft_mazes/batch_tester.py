@@ -0,0 +1,136 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+from typing import List, Optional
+
+from playground.minecraft_mazes.astar_solver import Algorithm, Engine, format_directions, solve_maze
+from playground.minecraft_mazes.maze_input import parse_problem, split_problems
+
+
+@dataclass
+class _Puzzle:
+    name: str
+    problem: bytes
+    expected: Optional[List[str]]
+
+
+@dataclass
+class _PuzzleResult:
+    directions: Optional[List[str]]
+    error: Optional[str]
+    latency_seconds: float
+
+
+def _main() -> None:
+    parser = ArgumentParser(description="Solves many Minecraft maze problems in a persistent worker pool")
+    parser.add_argument("input", help="directory of '*_input.txt' files, or a file holding back to back problems")
+    parser.add_argument("--expected", required=False,
+                        help="file holding back to back expected outputs, used when 'input' is a single file")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="worker process count (default: cpu count)")
+    parser.add_argument("--engine", choices=[engine.value for engine in Engine], default=Engine.COMPACT.value,
+                        help="search implementation to use (default: compact)")
+    parser.add_argument("--algorithm", choices=[algorithm.value for algorithm in Algorithm],
+                        default=Algorithm.A_STAR.value, help="search strategy to use (default: astar)")
+    parser.add_argument("--quiet", required=False, action="store_true", help="only print failures and the summary")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    puzzles = _read_directory(input_path) if input_path.is_dir() else _read_stream(input_path, args.expected)
+    if args.workers <= 0:
+        raise ValueError("Must have at least 1 worker process.")
+
+    passed, failed = 0, 0
+    latencies: List[float] = []
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(_solve_puzzle, puzzle.problem, args.engine, args.algorithm): puzzle
+                   for puzzle in puzzles}
+        for future in as_completed(futures):
+            puzzle = futures[future]
+            result = future.result()
+            latencies.append(result.latency_seconds)
+            if result.error is not None:
+                status = "ERROR"
+            elif puzzle.expected is None:
+                status = "DONE"
+            else:
+                status = "PASS" if result.directions == puzzle.expected else "FAIL"
+            if status in ("PASS", "DONE"):
+                passed += 1
+            else:
+                failed += 1
+            if not args.quiet or status not in ("PASS", "DONE"):
+                detail = f" ({result.error})" if result.error is not None else ""
+                print(f"{status.ljust(5)} {puzzle.name} in {result.latency_seconds * 1000:.2f} ms{detail}")
+    elapsed = perf_counter() - start
+
+    latencies.sort()
+    print("-----")
+    print(f"Solved {len(latencies)} puzzles with {args.workers} workers in {elapsed:.3f} seconds "
+          f"({len(latencies) / elapsed if elapsed else 0:.1f} puzzles/sec), {passed} ok, {failed} failed")
+    if latencies:
+        print("Latency (ms): " + ", ".join(
+            f"p{percentile}={_percentile(latencies, percentile) * 1000:.2f}" for percentile in (50, 90, 99)
+        ) + f", max={latencies[-1] * 1000:.2f}")
+
+
+def _solve_puzzle(problem: bytes, engine: str, algorithm: str) -> _PuzzleResult:
+    start = perf_counter()
+    try:
+        is_traversable_map, start_position, target = parse_problem(problem)
+        path = solve_maze(is_traversable_map, start_position, target, Engine(engine), Algorithm(algorithm))
+        directions, error = format_directions(path), None
+    except ValueError as e:
+        directions, error = None, str(e)
+    except IndexError as e:
+        # A coordinate line missing a number, or a position off the map; fails this puzzle rather than the whole batch
+        directions, error = None, f"IndexError: {e}"
+    return _PuzzleResult(directions, error, perf_counter() - start)
+
+
+def _read_directory(directory: Path) -> List[_Puzzle]:
+    puzzles: List[_Puzzle] = []
+    for input_file in sorted(directory.glob("*_input.txt")):
+        output_file = input_file.with_name(input_file.name[:-len("_input.txt")] + "_output.txt")
+        expected = output_file.read_text("utf8").splitlines() if output_file.exists() else None
+        puzzles.append(_Puzzle(input_file.name, input_file.read_bytes(), expected))
+    return puzzles
+
+
+def _read_stream(input_file: Path, expected_file: Optional[str]) -> List[_Puzzle]:
+    problems = list(split_problems(input_file.read_bytes()))
+    expected_outputs: List[Optional[List[str]]] = [None] * len(problems)
+    if expected_file:
+        expected_outputs = _split_outputs(Path(expected_file).read_text("utf8"))
+        if len(expected_outputs) != len(problems):
+            raise ValueError(f"Expected file did not have one output per problem. Expected {len(problems)}, "
+                             f"was {len(expected_outputs)}")
+    return [
+        _Puzzle(f"{input_file.name}#{index + 1}", problem, expected)
+        for index, (problem, expected) in enumerate(zip(problems, expected_outputs))
+    ]
+
+
+def _split_outputs(text: str) -> List[Optional[List[str]]]:
+    outputs: List[Optional[List[str]]] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if not line and not current:
+            continue
+        current.append(line)
+        if line == "fin":
+            outputs.append(current)
+            current = []
+    return outputs
+
+
+def _percentile(sorted_values: List[float], percentile: int) -> float:
+    rank = max(0, -(-len(sorted_values) * percentile // 100) - 1)
+    return sorted_values[rank]
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,145 @@
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import List, Optional
+
+import numpy as np
+
+from playground.minecraft_mazes.astar_solver import Algorithm, Engine, solve_maze
+from playground.minecraft_mazes.compact_astar import SearchStats
+from playground.minecraft_mazes.hierarchical_astar import HierarchicalMaze
+from playground.minecraft_mazes.maze_generators import GENERATORS
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is reported as null there
+    resource = None
+
+_STRATEGIES = ["reference"] + [algorithm.value for algorithm in Algorithm] + ["hpa"]
+
+
+@dataclass
+class _BenchmarkResult:
+    generator: str
+    size: int
+    seed: int
+    strategy: str
+    outcome: str  # 'solved', 'unreachable', 'timeout' or 'error: ...'
+    path_length: Optional[int] = None
+    wall_seconds: Optional[float] = None
+    nodes_expanded: Optional[int] = None
+    peak_open_size: Optional[int] = None
+    peak_rss_kib: Optional[int] = None
+
+
+def _main() -> None:
+    parser = ArgumentParser(description="Benchmarks the maze solving strategies on reproducible generated mazes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 4000],
+                        help="side lengths of the generated mazes (default: 10 100 1000 4000)")
+    parser.add_argument("--generators", nargs="+", choices=list(GENERATORS), default=list(GENERATORS),
+                        help="maze generators to benchmark (default: all)")
+    parser.add_argument("--strategies", nargs="+", choices=_STRATEGIES, default=_STRATEGIES,
+                        help="solving strategies to benchmark (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the maze generators (default: 0)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="seconds before a single run is abandoned (default: 120)")
+    parser.add_argument("--label", required=False, help="label stored with the results (default: current git commit)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    results: List[_BenchmarkResult] = []
+    with TemporaryDirectory() as maze_directory:
+        for generator in args.generators:
+            for size in args.sizes:
+                maze_path = Path(maze_directory) / f"{generator}_{size}.npz"
+                is_traversable_map, start_position, target = GENERATORS[generator](size, args.seed)
+                np.savez(maze_path, grid=is_traversable_map, start=start_position, target=target)
+                for strategy in args.strategies:
+                    result = _run_isolated(maze_path, generator, size, args.seed, strategy, args.timeout)
+                    results.append(result)
+                    print(f"{generator:>22} {size:>5}  {strategy:>13}  {result.outcome:<12} "
+                          f"{_format(result.wall_seconds, '.4f')} s  {_format(result.nodes_expanded)} nodes  "
+                          f"{_format(result.peak_open_size)} peak heap  {_format(result.peak_rss_kib)} KiB rss")
+
+    report = {
+        "label": args.label or _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": [asdict(result) for result in results],
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2), "utf8")
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+def _run_isolated(
+        maze_path: Path, generator: str, size: int, seed: int, strategy: str, timeout: float
+) -> _BenchmarkResult:
+    # Every run gets a fresh interpreter, so peak RSS belongs to that run alone and a timed out run can be killed
+    context = get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_run_strategy, args=(maze_path, generator, size, seed, strategy, result_queue))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return _BenchmarkResult(generator, size, seed, strategy, "timeout")
+    if result_queue.empty():
+        return _BenchmarkResult(generator, size, seed, strategy, f"error: exit code {process.exitcode}")
+    return result_queue.get()
+
+
+def _run_strategy(maze_path: Path, generator: str, size: int, seed: int, strategy: str, result_queue) -> None:
+    with np.load(maze_path) as maze:
+        is_traversable_map = maze["grid"]
+        start_position, target = tuple(maze["start"].tolist()), tuple(maze["target"].tolist())
+
+    result = _BenchmarkResult(generator, size, seed, strategy, "solved")
+    stats = SearchStats() if strategy in {algorithm.value for algorithm in Algorithm} else None
+    start = perf_counter()
+    try:
+        if strategy == "reference":
+            sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * size * size))  # _State hashing recurses
+            path = solve_maze(is_traversable_map, start_position, target, Engine.REFERENCE)
+        elif strategy == "hpa":
+            path = HierarchicalMaze(is_traversable_map).path(start_position, target)
+        else:
+            path = solve_maze(is_traversable_map, start_position, target, algorithm=Algorithm(strategy), stats=stats)
+        result.path_length = len(path) - 1
+    except ValueError as e:
+        result.outcome = "unreachable" if str(e) == "Could not find path" else f"error: {e}"
+    except (IndexError, RecursionError) as e:
+        result.outcome = f"error: {type(e).__name__}"
+    result.wall_seconds = perf_counter() - start
+
+    if stats is not None:
+        result.nodes_expanded, result.peak_open_size = stats.nodes_expanded, stats.peak_open_size
+    if resource is not None:
+        result.peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result_queue.put(result)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                        cwd=Path(__file__).parent)
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def _format(value, format_spec: str = "") -> str:
+    return "-" if value is None else format(value, format_spec)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,111 @@
+import heapq
+from array import array
+from typing import List, Optional, Tuple
+
+from playground.minecraft_mazes.compact_astar import FlatGrid, Cells, SearchStats
+
+Coord = Tuple[int, int]
+
+_UNSEEN = -1
+
+
+class _Frontier:
+    __slots__ = ("goal_row", "goal_col", "g_cost", "parent", "closed", "open_heap")
+
+    def __init__(self, cell_count: int, origin_index: int, origin: Coord, goal: Coord):
+        self.goal_row, self.goal_col = goal
+        self.g_cost = array("i", [_UNSEEN]) * cell_count
+        self.parent = array("i", [_UNSEEN]) * cell_count
+        self.closed = bytearray(cell_count)
+        self.g_cost[origin_index] = 0
+        origin_row, origin_col = origin
+        self.open_heap = [(abs(self.goal_row - origin_row) + abs(self.goal_col - origin_col), 0, origin_index)]
+
+    def min_estimate(self) -> int:
+        return self.open_heap[0][0]
+
+
+def solve_with_bidirectional_a_star(
+        grid: FlatGrid, start_position: Coord, target: Coord, stats: Optional[SearchStats] = None
+) -> List[Coord]:
+    cells, num_rows, num_cols = grid.cells, grid.num_rows, grid.num_cols
+    start_index = grid.index_of(start_position)
+    target_index = grid.index_of(target)
+    if not cells[start_index] or not cells[target_index]:
+        raise ValueError("Could not find path")
+    if start_index == target_index:
+        return [start_position]
+
+    cell_count = num_rows * num_cols
+    forward = _Frontier(cell_count, start_index, start_position, target)
+    backward = _Frontier(cell_count, target_index, target, start_position)
+    best_cost, meeting_index = cell_count + 1, _UNSEEN
+    peak_open_size = 2
+
+    # Each frontier's smallest f is a lower bound on any start to target path still undiscovered, so once either
+    # bound reaches the best meeting found so far that meeting is optimal.
+    while forward.open_heap and backward.open_heap:
+        if max(forward.min_estimate(), backward.min_estimate()) >= best_cost:
+            break
+        peak_open_size = max(peak_open_size, len(forward.open_heap) + len(backward.open_heap))
+        if len(forward.open_heap) <= len(backward.open_heap):
+            expanding, opposite = forward, backward
+        else:
+            expanding, opposite = backward, forward
+        best_cost, meeting_index = _expand_next(
+            cells, num_cols, cell_count, expanding, opposite, best_cost, meeting_index
+        )
+
+    if stats is not None:
+        stats.record(forward.closed.count(1) + backward.closed.count(1), peak_open_size)
+    if meeting_index == _UNSEEN:
+        raise ValueError("Could not find path")
+
+    path: List[Coord] = []
+    index = meeting_index
+    while index != _UNSEEN:
+        path.append(grid.coord_of(index))
+        index = forward.parent[index]
+    path.reverse()
+    index = backward.parent[meeting_index]
+    while index != _UNSEEN:
+        path.append(grid.coord_of(index))
+        index = backward.parent[index]
+    return path
+
+
+def _expand_next(
+        cells: Cells, num_cols: int, cell_count: int, expanding: _Frontier, opposite: _Frontier,
+        best_cost: int, meeting_index: int
+) -> Tuple[int, int]:
+    _, _, index = heapq.heappop(expanding.open_heap)
+    closed, g_cost, parent, open_heap = expanding.closed, expanding.g_cost, expanding.parent, expanding.open_heap
+    if closed[index]:
+        return best_cost, meeting_index
+    closed[index] = 1
+
+    opposite_g_cost = opposite.g_cost
+    goal_row, goal_col = expanding.goal_row, expanding.goal_col
+    successor_cost = g_cost[index] + 1
+    col = index % num_cols
+    for successor in (
+            index + num_cols if index + num_cols < cell_count else _UNSEEN,
+            index - num_cols,
+            index + 1 if col + 1 < num_cols else _UNSEEN,
+            index - 1 if col > 0 else _UNSEEN,
+    ):
+        if successor < 0 or not cells[successor] or closed[successor]:
+            continue
+        known_cost = g_cost[successor]
+        if known_cost != _UNSEEN and known_cost <= successor_cost:
+            continue
+        g_cost[successor] = successor_cost
+        parent[successor] = index
+        successor_row, successor_col = divmod(successor, num_cols)
+        estimate = successor_cost + abs(goal_row - successor_row) + abs(goal_col - successor_col)
+        heapq.heappush(open_heap, (estimate, -successor_cost, successor))
+
+        opposite_cost = opposite_g_cost[successor]
+        if opposite_cost != _UNSEEN and successor_cost + opposite_cost < best_cost:
+            best_cost, meeting_index = successor_cost + opposite_cost, successor
+    return best_cost, meeting_index
@@ -0,0 +1,125 @@
+import heapq
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union, Sequence
+
+Coord = Tuple[int, int]
+Cells = Union[bytes, bytearray, memoryview]
+
+_UNSEEN = -1
+
+
+@dataclass
+class SearchStats:
+    nodes_expanded: int = 0
+    peak_open_size: int = 0
+
+    def record(self, nodes_expanded: int, peak_open_size: int) -> None:
+        self.nodes_expanded += nodes_expanded
+        self.peak_open_size = max(self.peak_open_size, peak_open_size)
+
+
+@dataclass(frozen=True)
+class FlatGrid:
+    cells: Cells
+    num_rows: int
+    num_cols: int
+
+    @classmethod
+    def from_rows(cls, is_traversable_map: Sequence[Sequence[bool]]) -> "FlatGrid":
+        num_rows = len(is_traversable_map)
+        num_cols = len(is_traversable_map[0]) if num_rows else 0
+        cells = bytearray(num_rows * num_cols)
+        for row_index, row in enumerate(is_traversable_map):
+            if len(row) != num_cols:
+                raise ValueError(f"Map line did not have expected length. Expected {num_cols}, was {len(row)}")
+            cells[row_index * num_cols:(row_index + 1) * num_cols] = bytes(row)
+        return cls(cells, num_rows, num_cols)
+
+    @classmethod
+    def from_array(cls, is_traversable_array) -> "FlatGrid":
+        # Accepts any C-contiguous 2D buffer of one byte per cell (e.g. a NumPy bool/uint8 array) without copying it
+        num_rows, num_cols = is_traversable_array.shape
+        return cls(memoryview(is_traversable_array).cast("B"), num_rows, num_cols)
+
+    def index_of(self, position: Coord) -> int:
+        row, col = position
+        if not (0 <= row < self.num_rows and 0 <= col < self.num_cols):
+            raise ValueError(f"Position {position} is outside of the {self.num_rows}x{self.num_cols} map")
+        return row * self.num_cols + col
+
+    def coord_of(self, index: int) -> Coord:
+        return divmod(index, self.num_cols)
+
+
+def solve_with_compact_a_star(
+        grid: FlatGrid, start_position: Coord, target: Coord, stats: Optional[SearchStats] = None
+) -> List[Coord]:
+    cells, num_rows, num_cols = grid.cells, grid.num_rows, grid.num_cols
+    start_index = grid.index_of(start_position)
+    target_index = grid.index_of(target)
+    if not cells[start_index] or not cells[target_index]:
+        raise ValueError("Could not find path")
+
+    cell_count = num_rows * num_cols
+    g_cost = array("i", [_UNSEEN]) * cell_count
+    parent = array("i", [_UNSEEN]) * cell_count
+    closed = bytearray(cell_count)
+    target_row, target_col = target
+    last_row_start = cell_count - num_cols
+
+    # Heap entries are (f, -g, index): among equal f, deeper states are popped first, which keeps the expansion on
+    # open ground close to a single line instead of flooding every tied cell.
+    g_cost[start_index] = 0
+    start_row, start_col = start_position
+    open_heap = [(abs(target_row - start_row) + abs(target_col - start_col), 0, start_index)]
+    heappush, heappop = heapq.heappush, heapq.heappop
+    nodes_expanded, peak_open_size = 0, 1
+
+    while open_heap:
+        if len(open_heap) > peak_open_size:
+            peak_open_size = len(open_heap)
+        _, _, index = heappop(open_heap)
+        if closed[index]:
+            continue  # Stale entry, a cheaper route to this cell was already expanded
+        if index == target_index:
+            break
+        closed[index] = 1
+        nodes_expanded += 1
+
+        successor_cost = g_cost[index] + 1
+        col = index % num_cols
+        for successor in (
+                index + num_cols if index < last_row_start else _UNSEEN,
+                index - num_cols,
+                index + 1 if col + 1 < num_cols else _UNSEEN,
+                index - 1 if col > 0 else _UNSEEN,
+        ):
+            if successor < 0 or not cells[successor] or closed[successor]:
+                continue
+            known_cost = g_cost[successor]
+            if known_cost != _UNSEEN and known_cost <= successor_cost:
+                continue
+            g_cost[successor] = successor_cost
+            parent[successor] = index
+            successor_row, successor_col = divmod(successor, num_cols)
+            estimate = successor_cost + abs(target_row - successor_row) + abs(target_col - successor_col)
+            heappush(open_heap, (estimate, -successor_cost, successor))
+    else:
+        if stats is not None:
+            stats.record(nodes_expanded, peak_open_size)
+        raise ValueError("Could not find path")
+
+    if stats is not None:
+        stats.record(nodes_expanded, peak_open_size)
+    return _reconstruct_path(grid, parent, target_index)
+
+
+def _reconstruct_path(grid: FlatGrid, parent: array, target_index: int) -> List[Coord]:
+    path: List[Coord] = []
+    index = target_index
+    while index != _UNSEEN:
+        path.append(grid.coord_of(index))
+        index = parent[index]
+    path.reverse()
+    return path
@@ -0,0 +1,235 @@
+import hashlib
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from playground.minecraft_mazes.compact_astar import FlatGrid
+from playground.minecraft_mazes.maze_input import load_problem
+
+Coord = Tuple[int, int]
+
+_UNREACHABLE = -1
+_FIELD_FORMAT_VERSION = 1
+# Frontiers smaller than this are expanded cell by cell, a NumPy round trip costs more than it saves on so few cells
+_VECTORIZE_THRESHOLD = 64
+
+
+# Number of moves from every cell to the nearest of one or more targets (-1 where no target can be reached). Built once
+# with a breadth first search outwards from the targets, after which the shortest path from any start is found by
+# stepping to a neighbour one move closer until a target is reached, without searching again.
+# A field remembers a digest of the grid and targets it was built from, saved along with it, so a saved field is only
+# reused for the maze it describes.
+class DistanceField:
+    def __init__(self, distances: np.ndarray, source_digest: Optional[str] = None):
+        if distances.ndim != 2 or distances.dtype != np.int32:
+            raise ValueError(f"Distance field must be a 2D int32 array, was {distances.ndim}D {distances.dtype}")
+        self._distances = np.ascontiguousarray(distances)
+        self._num_rows, self._num_cols = distances.shape
+        self._flat_distances = memoryview(self._distances.reshape(-1))
+        self._source_digest = source_digest
+
+    @classmethod
+    def build(cls, is_traversable_map: np.ndarray, targets: Iterable[Coord]) -> "DistanceField":
+        targets = list(targets)
+        return cls(compute_distances(is_traversable_map, targets), source_digest(is_traversable_map, targets))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "DistanceField":
+        saved = np.load(path)
+        if isinstance(saved, np.ndarray):
+            raise ValueError(f"'{path}' holds a bare array rather than a saved distance field")
+        with saved:
+            if int(saved["version"]) != _FIELD_FORMAT_VERSION:
+                raise ValueError(f"Distance field format must be version {_FIELD_FORMAT_VERSION}, "
+                                 f"was {int(saved['version'])}")
+            return cls(saved["distances"], str(saved["source_digest"]) or None)
+
+    @classmethod
+    def load_or_build(
+            cls, is_traversable_map: np.ndarray, targets: Iterable[Coord], path: Union[str, Path]
+    ) -> "DistanceField":
+        # The field saved at 'path' if it was built from this grid and these targets, otherwise a new one saved there
+        targets = list(targets)
+        digest = source_digest(is_traversable_map, targets)
+        if Path(path).exists():
+            try:
+                field = cls.load(path)
+            except (OSError, ValueError, KeyError):
+                field = None  # Not a distance field, or saved in an older format
+            if field is not None and field.source_digest == digest and field.shape == is_traversable_map.shape:
+                return field
+        field = cls(compute_distances(is_traversable_map, targets), digest)
+        field.save(path)
+        return field
+
+    def save(self, path: Union[str, Path]) -> None:
+        with open(path, "wb") as field_file:
+            np.savez(field_file, version=_FIELD_FORMAT_VERSION, source_digest=self._source_digest or "",
+                     distances=self._distances)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._num_rows, self._num_cols
+
+    @property
+    def distances(self) -> np.ndarray:
+        return self._distances
+
+    @property
+    def source_digest(self) -> Optional[str]:
+        # None for a field made directly from an array of distances
+        return self._source_digest
+
+    def distance_from(self, start_position: Coord) -> Optional[int]:
+        distance = self._flat_distances[self._index_of(start_position)]
+        return None if distance == _UNREACHABLE else distance
+
+    def path(self, start_position: Coord) -> List[Coord]:
+        flat_distances, num_cols = self._flat_distances, self._num_cols
+        cell_count = self._num_rows * num_cols
+        index = self._index_of(start_position)
+        remaining = flat_distances[index]
+        if remaining == _UNREACHABLE:
+            raise ValueError("Could not find path")
+
+        path = [start_position]
+        while remaining:
+            remaining -= 1
+            col = index % num_cols
+            # Walls and unreachable cells hold -1, so only a traversable neighbour can ever match
+            for successor in (
+                    index + num_cols if index + num_cols < cell_count else _UNREACHABLE,
+                    index - num_cols,
+                    index + 1 if col + 1 < num_cols else _UNREACHABLE,
+                    index - 1 if col > 0 else _UNREACHABLE,
+            ):
+                if successor >= 0 and flat_distances[successor] == remaining:
+                    break
+            else:
+                raise ValueError(f"Distance field is inconsistent at {divmod(index, num_cols)}")
+            index = successor
+            path.append(divmod(index, num_cols))
+        return path
+
+    def paths(self, start_positions: Iterable[Coord]) -> List[Optional[List[Coord]]]:
+        return [
+            self.path(start_position) if self.distance_from(start_position) is not None else None
+            for start_position in start_positions
+        ]
+
+    def _index_of(self, position: Coord) -> int:
+        row, col = position
+        if not (0 <= row < self._num_rows and 0 <= col < self._num_cols):
+            raise ValueError(f"Position {position} is outside of the {self._num_rows}x{self._num_cols} map")
+        return row * self._num_cols + col
+
+
+def source_digest(is_traversable_map: np.ndarray, targets: Iterable[Coord]) -> str:
+    # The shape and dtype too, as grids of the same bytes laid out differently (4x6 and 6x4) are different mazes. Order
+    # and repeats of the targets do not change the field.
+    source_hash = hashlib.sha256(f"{is_traversable_map.shape}{is_traversable_map.dtype.str}".encode())
+    source_hash.update(np.ascontiguousarray(is_traversable_map).tobytes())
+    source_hash.update(repr(sorted({(int(row), int(col)) for row, col in targets})).encode())
+    return source_hash.hexdigest()
+
+
+def compute_distances(is_traversable_map: np.ndarray, targets: Iterable[Coord]) -> np.ndarray:
+    is_traversable_map = np.ascontiguousarray(is_traversable_map, dtype=bool)
+    grid = FlatGrid.from_array(is_traversable_map)
+    cells = is_traversable_map.reshape(-1)
+    distances = np.full(cells.size, _UNREACHABLE, dtype=np.int32)
+    flat_distances = memoryview(distances)
+
+    frontier = sorted({index for index in map(grid.index_of, targets) if cells[index]})
+    distances[frontier] = 0
+    distance = 0
+    # Each round labels the whole next BFS level. Wide levels (open ground, many targets) are expanded with a handful of
+    # array operations, while the long thin levels of corridor mazes fall back to plain Python per cell.
+    while len(frontier):
+        distance += 1
+        if len(frontier) >= _VECTORIZE_THRESHOLD:
+            frontier = _expand_vectorized(cells, distances, np.asarray(frontier), grid.num_cols, distance)
+        else:
+            frontier = _expand_scalar(grid, flat_distances, frontier, distance)
+    return distances.reshape(grid.num_rows, grid.num_cols)
+
+
+def _expand_vectorized(
+        cells: np.ndarray, distances: np.ndarray, frontier: np.ndarray, num_cols: int, distance: int
+) -> np.ndarray:
+    cols = frontier % num_cols
+    candidates = np.concatenate((
+        frontier + num_cols,
+        frontier - num_cols,
+        frontier[cols + 1 < num_cols] + 1,
+        frontier[cols > 0] - 1,
+    ))
+    candidates = candidates[(candidates >= 0) & (candidates < cells.size)]
+    candidates = np.unique(candidates[cells[candidates] & (distances[candidates] == _UNREACHABLE)])
+    distances[candidates] = distance
+    return candidates
+
+
+def _expand_scalar(grid: FlatGrid, flat_distances: memoryview, frontier: Iterable[int], distance: int) -> List[int]:
+    cells, num_cols = grid.cells, grid.num_cols
+    cell_count = grid.num_rows * num_cols
+    next_frontier: List[int] = []
+    for index in (frontier.tolist() if isinstance(frontier, np.ndarray) else frontier):
+        col = index % num_cols
+        for successor in (
+                index + num_cols if index + num_cols < cell_count else _UNREACHABLE,
+                index - num_cols,
+                index + 1 if col + 1 < num_cols else _UNREACHABLE,
+                index - 1 if col > 0 else _UNREACHABLE,
+        ):
+            if successor >= 0 and cells[successor] and flat_distances[successor] == _UNREACHABLE:
+                flat_distances[successor] = distance
+                next_frontier.append(successor)
+    return next_frontier
+
+
+def _main() -> None:
+    parser = ArgumentParser(description="Routes many starts to the nearest of one or more targets through one "
+                                        "precomputed distance field")
+    parser.add_argument("input", help="name of the problem input file")
+    parser.add_argument("--starts", type=int, nargs="+", required=False, metavar="ROW COL",
+                        help="start positions as row/column pairs (default: the start from the problem)")
+    parser.add_argument("--targets", type=int, nargs="+", required=False, metavar="ROW COL",
+                        help="target positions as row/column pairs (default: the target from the problem)")
+    parser.add_argument("--field", required=False,
+                        help="file to load the distance field from, or save it to when it does not exist yet or was "
+                             "built from another grid or other targets")
+    args = parser.parse_args()
+
+    is_traversable_map, start_position, target = load_problem(args.input)
+    start_positions = _pairs(args.starts) if args.starts else [start_position]
+    targets = _pairs(args.targets) if args.targets else [target]
+
+    start = perf_counter()
+    if args.field is not None:
+        field = DistanceField.load_or_build(is_traversable_map, targets, args.field)
+    else:
+        field = DistanceField.build(is_traversable_map, targets)
+    print(f"Distance field ready in {perf_counter() - start:.3f} seconds")
+
+    start = perf_counter()
+    paths = field.paths(start_positions)
+    print(f"Routed {len(paths)} starts in {perf_counter() - start:.3f} seconds")
+    for start_position, path in zip(start_positions, paths):
+        if path is None:
+            print(f"{start_position}: no target reachable")
+        else:
+            print(f"{start_position}: {len(path) - 1} moves to {path[-1]}")
+
+
+def _pairs(values: List[int]) -> List[Coord]:
+    if len(values) % 2:
+        raise ValueError(f"Expected row/column pairs, got an odd number of values ({len(values)})")
+    return list(zip(values[::2], values[1::2]))
+
+
+if __name__ == "__main__":
+    _main()
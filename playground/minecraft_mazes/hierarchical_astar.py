@@ -0,0 +1,337 @@
+import hashlib
+import heapq
+from argparse import ArgumentParser
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from playground.minecraft_mazes.compact_astar import FlatGrid, solve_with_compact_a_star
+from playground.minecraft_mazes.maze_input import load_problem
+
+Coord = Tuple[int, int]
+Bounds = Tuple[int, int, int, int]
+
+_UNSEEN = -1
+_CACHE_FORMAT_VERSION = 1
+# Border openings at least this long get an entrance at each end rather than a single one in the middle
+_LONG_ENTRANCE_LENGTH = 6
+
+
+@dataclass
+class _AbstractGraph:
+    cluster_size: int
+    nodes: np.ndarray  # flat cell index of every entrance node, sorted
+    edge_sources: np.ndarray  # position in 'nodes'
+    edge_targets: np.ndarray  # position in 'nodes'
+    edge_costs: np.ndarray
+
+
+class HierarchicalMaze:
+    def __init__(self, is_traversable_map: np.ndarray, cluster_size: int = 16,
+                 cache_path: Optional[Union[str, Path]] = None):
+        if cluster_size < 2:
+            raise ValueError(f"Cluster size must be at least 2, was {cluster_size}")
+        self._is_traversable_map = np.ascontiguousarray(is_traversable_map, dtype=bool)
+        self._grid = FlatGrid.from_array(self._is_traversable_map)
+        self._graph = _load_or_build_graph(self._is_traversable_map, cluster_size, cache_path)
+        self._node_position = {int(node): position for position, node in enumerate(self._graph.nodes)}
+        self._adjacency: List[List[Tuple[int, int]]] = [[] for _ in range(len(self._graph.nodes))]
+        for source, target, cost in zip(self._graph.edge_sources.tolist(), self._graph.edge_targets.tolist(),
+                                        self._graph.edge_costs.tolist()):
+            self._adjacency[source].append((target, cost))
+
+    @property
+    def cluster_size(self) -> int:
+        return self._graph.cluster_size
+
+    @property
+    def abstract_node_count(self) -> int:
+        return len(self._graph.nodes)
+
+    def path(self, start_position: Coord, target: Coord, exact: bool = False) -> List[Coord]:
+        if exact:
+            return solve_with_compact_a_star(self._grid, start_position, target)
+
+        start_index = self._grid.index_of(start_position)
+        target_index = self._grid.index_of(target)
+        if not self._grid.cells[start_index] or not self._grid.cells[target_index]:
+            raise ValueError("Could not find path")
+        if start_index == target_index:
+            return [start_position]
+
+        # Connect the query endpoints to the entrances of their own clusters, then search the abstract graph
+        start_links = self._local_links(start_index)
+        target_links = {node: cost for node, cost in self._local_links(target_index)}
+        direct_cost = self._direct_cost(start_index, target_index)
+        abstract_path = self._search_abstract(start_index, start_links, target_index, target_links, direct_cost)
+        if abstract_path is None:
+            raise ValueError("Could not find path")
+        return self._refine(abstract_path)
+
+    def _local_links(self, index: int) -> List[Tuple[int, int]]:
+        bounds = _cluster_bounds(self._grid, index, self._graph.cluster_size)
+        cluster_nodes = _nodes_in_bounds(self._graph.nodes, self._grid.num_cols, bounds)
+        return list(_ClusterView(self._grid, bounds).distances_to(index, cluster_nodes).items())
+
+    def _direct_cost(self, start_index: int, target_index: int) -> Optional[int]:
+        bounds = _cluster_bounds(self._grid, start_index, self._graph.cluster_size)
+        if bounds != _cluster_bounds(self._grid, target_index, self._graph.cluster_size):
+            return None
+        return _ClusterView(self._grid, bounds).distances_to(start_index, [target_index]).get(target_index)
+
+    def _search_abstract(
+            self, start_index: int, start_links: List[Tuple[int, int]], target_index: int,
+            target_links: Dict[int, int], direct_cost: Optional[int]
+    ) -> Optional[List[int]]:
+        num_cols = self._grid.num_cols
+        target_row, target_col = divmod(target_index, num_cols)
+
+        def estimate(cell: int) -> int:
+            row, col = divmod(cell, num_cols)
+            return abs(target_row - row) + abs(target_col - col)
+
+        # Heap entries hold flat cell indexes, so the temporary start/target nodes need no slot in the stored graph
+        g_cost: Dict[int, int] = {start_index: 0}
+        parent: Dict[int, int] = {start_index: _UNSEEN}
+        open_heap = [(estimate(start_index), 0, start_index)]
+        closed = set()
+        while open_heap:
+            _, _, cell = heapq.heappop(open_heap)
+            if cell in closed:
+                continue
+            if cell == target_index:
+                break
+            closed.add(cell)
+
+            successors: List[Tuple[int, int]] = []
+            if cell == start_index:
+                successors.extend(start_links)
+                if direct_cost is not None:
+                    successors.append((target_index, direct_cost))
+            if cell in self._node_position:
+                successors.extend((int(self._graph.nodes[node]), cost)
+                                  for node, cost in self._adjacency[self._node_position[cell]])
+            if cell in target_links:
+                successors.append((target_index, target_links[cell]))
+
+            for successor, edge_cost in successors:
+                successor_cost = g_cost[cell] + edge_cost
+                if successor in closed or g_cost.get(successor, successor_cost + 1) <= successor_cost:
+                    continue
+                g_cost[successor] = successor_cost
+                parent[successor] = cell
+                heapq.heappush(open_heap, (successor_cost + estimate(successor), -successor_cost, successor))
+        else:
+            return None
+
+        abstract_path: List[int] = []
+        cell = target_index
+        while cell != _UNSEEN:
+            abstract_path.append(cell)
+            cell = parent[cell]
+        abstract_path.reverse()
+        return abstract_path
+
+    def _refine(self, abstract_path: List[int]) -> List[Coord]:
+        path: List[Coord] = [self._grid.coord_of(abstract_path[0])]
+        for cell, next_cell in zip(abstract_path, abstract_path[1:]):
+            (row, col), (next_row, next_col) = self._grid.coord_of(cell), self._grid.coord_of(next_cell)
+            if abs(row - next_row) + abs(col - next_col) == 1:
+                path.append((next_row, next_col))  # Entrance edge between two neighbouring clusters
+                continue
+            cluster = _ClusterView(self._grid, _cluster_bounds(self._grid, cell, self._graph.cluster_size))
+            path.extend(self._grid.coord_of(index) for index in cluster.path(cell, next_cell)[1:])
+        return path
+
+
+def _main() -> None:
+    parser = ArgumentParser(description="Solves the Minecraft maze problem with hierarchical path finding (HPA*)")
+    parser.add_argument("input", help="name of the problem input file")
+    parser.add_argument("--cluster-size", type=int, default=16, help="width and height of each cluster (default: 16)")
+    parser.add_argument("--cache", required=False, help="file to persist the abstract graph to and load it from")
+    parser.add_argument("--verify", required=False, action="store_true",
+                        help="also solve with exact A* and compare the path lengths")
+    args = parser.parse_args()
+
+    is_traversable_map, start_position, target = load_problem(args.input)
+    start = perf_counter()
+    maze = HierarchicalMaze(is_traversable_map, args.cluster_size, args.cache)
+    print(f"Abstract graph with {maze.abstract_node_count} nodes ready in {perf_counter() - start:.3f} seconds")
+
+    start = perf_counter()
+    path = maze.path(start_position, target)
+    print(f"Hierarchical path of {len(path) - 1} moves found in {perf_counter() - start:.3f} seconds")
+    if args.verify:
+        start = perf_counter()
+        exact_path = maze.path(start_position, target, exact=True)
+        print(f"Exact path of {len(exact_path) - 1} moves found in {perf_counter() - start:.3f} seconds "
+              f"({(len(path) - len(exact_path)) / max(len(exact_path) - 1, 1):.2%} longer)")
+
+
+def _load_or_build_graph(
+        is_traversable_map: np.ndarray, cluster_size: int, cache_path: Optional[Union[str, Path]]
+) -> _AbstractGraph:
+    # The shape and dtype too, as grids of the same bytes laid out differently (4x6 and 6x4) have different graphs
+    grid_hash = hashlib.sha256(f"{is_traversable_map.shape}{is_traversable_map.dtype.str}".encode())
+    grid_hash.update(is_traversable_map.tobytes())
+    grid_digest = grid_hash.hexdigest()
+    if cache_path is not None and Path(cache_path).exists():
+        with np.load(cache_path) as cached:
+            if (int(cached["version"]) == _CACHE_FORMAT_VERSION and str(cached["grid_digest"]) == grid_digest
+                    and int(cached["cluster_size"]) == cluster_size):
+                return _AbstractGraph(cluster_size, cached["nodes"], cached["edge_sources"],
+                                      cached["edge_targets"], cached["edge_costs"])
+
+    graph = _build_graph(FlatGrid.from_array(is_traversable_map), cluster_size)
+    if cache_path is not None:
+        with open(cache_path, "wb") as cache_file:
+            np.savez(cache_file, version=_CACHE_FORMAT_VERSION, grid_digest=grid_digest, cluster_size=cluster_size,
+                     nodes=graph.nodes, edge_sources=graph.edge_sources, edge_targets=graph.edge_targets,
+                     edge_costs=graph.edge_costs)
+    return graph
+
+
+def _build_graph(grid: FlatGrid, cluster_size: int) -> _AbstractGraph:
+    inter_edges = _find_entrances(grid, cluster_size)
+    nodes = sorted({cell for edge in inter_edges for cell in edge})
+    node_position = {node: position for position, node in enumerate(nodes)}
+
+    sources: List[int] = []
+    targets: List[int] = []
+    costs: List[int] = []
+    for cell, other_cell in inter_edges:
+        for source, target in ((cell, other_cell), (other_cell, cell)):
+            sources.append(node_position[source])
+            targets.append(node_position[target])
+            costs.append(1)
+
+    nodes_by_cluster: Dict[Bounds, List[int]] = {}
+    for node in nodes:
+        nodes_by_cluster.setdefault(_cluster_bounds(grid, node, cluster_size), []).append(node)
+    for bounds, cluster_nodes in nodes_by_cluster.items():
+        cluster = _ClusterView(grid, bounds)
+        for node in cluster_nodes:
+            for other_node, distance in cluster.distances_to(node, cluster_nodes).items():
+                if other_node != node:
+                    sources.append(node_position[node])
+                    targets.append(node_position[other_node])
+                    costs.append(distance)
+
+    return _AbstractGraph(cluster_size, np.array(nodes, dtype=np.int64), np.array(sources, dtype=np.int32),
+                          np.array(targets, dtype=np.int32), np.array(costs, dtype=np.int32))
+
+
+def _find_entrances(grid: FlatGrid, cluster_size: int) -> List[Tuple[int, int]]:
+    cells, num_rows, num_cols = grid.cells, grid.num_rows, grid.num_cols
+    entrances: List[Tuple[int, int]] = []
+    # Vertical borders between horizontally adjacent clusters, then horizontal borders between vertical neighbours
+    for border_col in range(cluster_size, num_cols, cluster_size):
+        for row_start in range(0, num_rows, cluster_size):
+            pairs = [(row * num_cols + border_col - 1, row * num_cols + border_col)
+                     for row in range(row_start, min(row_start + cluster_size, num_rows))]
+            entrances.extend(_entrances_along(cells, pairs))
+    for border_row in range(cluster_size, num_rows, cluster_size):
+        for col_start in range(0, num_cols, cluster_size):
+            pairs = [((border_row - 1) * num_cols + col, border_row * num_cols + col)
+                     for col in range(col_start, min(col_start + cluster_size, num_cols))]
+            entrances.extend(_entrances_along(cells, pairs))
+    return entrances
+
+
+def _entrances_along(cells, pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    entrances: List[Tuple[int, int]] = []
+    opening: List[Tuple[int, int]] = []
+    for cell, other_cell in pairs + [(_UNSEEN, _UNSEEN)]:
+        if cell != _UNSEEN and cells[cell] and cells[other_cell]:
+            opening.append((cell, other_cell))
+            continue
+        if len(opening) >= _LONG_ENTRANCE_LENGTH:
+            entrances.extend((opening[0], opening[-1]))
+        elif opening:
+            entrances.append(opening[len(opening) // 2])
+        opening = []
+    return entrances
+
+
+def _cluster_bounds(grid: FlatGrid, index: int, cluster_size: int) -> Bounds:
+    row, col = grid.coord_of(index)
+    row_start, col_start = row - row % cluster_size, col - col % cluster_size
+    return row_start, col_start, min(row_start + cluster_size, grid.num_rows), min(col_start + cluster_size,
+                                                                                   grid.num_cols)
+
+
+def _nodes_in_bounds(nodes: np.ndarray, num_cols: int, bounds: Bounds) -> List[int]:
+    row_start, col_start, row_stop, col_stop = bounds
+    in_bounds: List[int] = []
+    for row in range(row_start, row_stop):
+        low, high = np.searchsorted(nodes, [row * num_cols + col_start, row * num_cols + col_stop])
+        in_bounds.extend(int(node) for node in nodes[low:high])
+    return in_bounds
+
+
+class _ClusterView:
+    # A copy of one cluster's cells inside a one cell wall border, so breadth first searches within the cluster need
+    # no bounds checks and can track state in small lists instead of dicts keyed by global index
+    __slots__ = ("row_start", "col_start", "num_cols", "width", "cells")
+
+    def __init__(self, grid: FlatGrid, bounds: Bounds):
+        row_start, col_start, row_stop, col_stop = bounds
+        self.row_start, self.col_start, self.num_cols = row_start, col_start, grid.num_cols
+        self.width = col_stop - col_start + 2
+        self.cells = bytearray(self.width * (row_stop - row_start + 2))
+        for row in range(row_start, row_stop):
+            local_start = self.to_local(row * grid.num_cols + col_start)
+            self.cells[local_start:local_start + col_stop - col_start] = \
+                grid.cells[row * grid.num_cols + col_start:row * grid.num_cols + col_stop]
+
+    def to_local(self, index: int) -> int:
+        row, col = divmod(index, self.num_cols)
+        return (row - self.row_start + 1) * self.width + col - self.col_start + 1
+
+    def to_global(self, local_index: int) -> int:
+        row, col = divmod(local_index, self.width)
+        return (row - 1 + self.row_start) * self.num_cols + col - 1 + self.col_start
+
+    def search(self, origin: int) -> Tuple[List[int], List[int]]:
+        cells, width = self.cells, self.width
+        local_origin = self.to_local(origin)
+        parents = [_UNSEEN] * len(cells)
+        distances = [_UNSEEN] * len(cells)
+        distances[local_origin] = 0
+        frontier = deque([local_origin])
+        while frontier:
+            index = frontier.popleft()
+            successor_distance = distances[index] + 1
+            for successor in (index + width, index - width, index + 1, index - 1):
+                if cells[successor] and distances[successor] == _UNSEEN:
+                    distances[successor] = successor_distance
+                    parents[successor] = index
+                    frontier.append(successor)
+        return parents, distances
+
+    def distances_to(self, origin: int, destinations: List[int]) -> Dict[int, int]:
+        _, distances = self.search(origin)
+        return {
+            destination: distances[local_destination]
+            for destination, local_destination in ((destination, self.to_local(destination))
+                                                   for destination in destinations)
+            if distances[local_destination] != _UNSEEN
+        }
+
+    def path(self, origin: int, destination: int) -> List[int]:
+        parents, _ = self.search(origin)
+        segment: List[int] = []
+        local_index = self.to_local(destination)
+        while local_index != _UNSEEN:
+            segment.append(self.to_global(local_index))
+            local_index = parents[local_index]
+        segment.reverse()
+        return segment
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,183 @@
+import heapq
+from array import array
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from playground.minecraft_mazes.compact_astar import FlatGrid, SearchStats
+
+Coord = Tuple[int, int]
+
+_UNSEEN = -1
+_STOP = b"\x01"
+
+
+class _JumpContext:
+    __slots__ = ("cells", "num_rows", "num_cols", "target_index", "target_row", "stop_east", "stop_west")
+
+    def __init__(self, grid: FlatGrid, target_index: int):
+        self.cells = grid.cells
+        self.num_rows, self.num_cols = grid.num_rows, grid.num_cols
+        self.target_index = target_index
+        self.target_row = target_index // grid.num_cols
+        self.stop_east, self.stop_west = _horizontal_stop_masks(grid)
+
+
+def solve_with_jump_point_search(
+        grid: FlatGrid, start_position: Coord, target: Coord, stats: Optional[SearchStats] = None
+) -> List[Coord]:
+    cells, num_cols = grid.cells, grid.num_cols
+    start_index = grid.index_of(start_position)
+    target_index = grid.index_of(target)
+    if not cells[start_index] or not cells[target_index]:
+        raise ValueError("Could not find path")
+
+    context = _JumpContext(grid, target_index)
+    cell_count = grid.num_rows * num_cols
+    g_cost = array("i", [_UNSEEN]) * cell_count
+    parent = array("i", [_UNSEEN]) * cell_count
+    closed = bytearray(cell_count)
+    target_row, target_col = target
+
+    g_cost[start_index] = 0
+    start_row, start_col = start_position
+    open_heap = [(abs(target_row - start_row) + abs(target_col - start_col), 0, start_index)]
+    nodes_expanded, peak_open_size = 0, 1
+    while open_heap:
+        peak_open_size = max(peak_open_size, len(open_heap))
+        _, _, index = heapq.heappop(open_heap)
+        if closed[index]:
+            continue
+        if index == target_index:
+            break
+        closed[index] = 1
+        nodes_expanded += 1
+
+        for jump_point in _successors(context, index, parent[index]):
+            if closed[jump_point]:
+                continue
+            successor_cost = g_cost[index] + _distance(index, jump_point, num_cols)
+            known_cost = g_cost[jump_point]
+            if known_cost != _UNSEEN and known_cost <= successor_cost:
+                continue
+            g_cost[jump_point] = successor_cost
+            parent[jump_point] = index
+            jump_row, jump_col = divmod(jump_point, num_cols)
+            estimate = successor_cost + abs(target_row - jump_row) + abs(target_col - jump_col)
+            heapq.heappush(open_heap, (estimate, -successor_cost, jump_point))
+    else:
+        if stats is not None:
+            stats.record(nodes_expanded, peak_open_size)
+        raise ValueError("Could not find path")
+    if stats is not None:
+        stats.record(nodes_expanded, peak_open_size)
+
+    jump_points: List[int] = []
+    index = target_index
+    while index != _UNSEEN:
+        jump_points.append(index)
+        index = parent[index]
+    jump_points.reverse()
+    return _interpolate(grid, jump_points)
+
+
+def _horizontal_stop_masks(grid: FlatGrid) -> Tuple[bytes, bytes]:
+    # A cell "stops" a horizontal jump when it is blocked, or when a cell above/below it opens up that was closed
+    # above/below the cell the jump just came from (a forced neighbour). Precomputing both directions for the whole
+    # grid lets each horizontal jump be a single bytes.find/rfind instead of a Python loop.
+    is_open = np.frombuffer(grid.cells, dtype=np.uint8).reshape(grid.num_rows, grid.num_cols).astype(bool)
+    above_open = np.zeros_like(is_open)
+    above_open[1:] = is_open[:-1]
+    below_open = np.zeros_like(is_open)
+    below_open[:-1] = is_open[1:]
+
+    stop_east = ~is_open
+    stop_east[:, 1:] |= (above_open[:, 1:] & ~above_open[:, :-1]) | (below_open[:, 1:] & ~below_open[:, :-1])
+    stop_west = ~is_open
+    stop_west[:, :-1] |= (above_open[:, :-1] & ~above_open[:, 1:]) | (below_open[:, :-1] & ~below_open[:, 1:])
+    return stop_east.astype(np.uint8).tobytes(), stop_west.astype(np.uint8).tobytes()
+
+
+def _successors(context: _JumpContext, index: int, parent_index: int) -> List[int]:
+    num_cols = context.num_cols
+    row, col = divmod(index, num_cols)
+    if parent_index == _UNSEEN:
+        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    else:
+        parent_row, parent_col = divmod(parent_index, num_cols)
+        if parent_row == row:
+            step = 1 if col > parent_col else -1
+            directions = [(0, step), (1, 0), (-1, 0)]
+        else:
+            step = 1 if row > parent_row else -1
+            directions = [(step, 0), (0, 1), (0, -1)]
+
+    jump_points: List[int] = []
+    for row_step, col_step in directions:
+        if row_step:
+            jump_point = _jump_vertical(context, index + row_step * num_cols, row + row_step, row_step)
+        else:
+            jump_point = _jump_horizontal(context, index + col_step, row, col + col_step, col_step)
+        if jump_point != _UNSEEN:
+            jump_points.append(jump_point)
+    return jump_points
+
+
+def _jump_horizontal(context: _JumpContext, index: int, row: int, col: int, step: int) -> int:
+    num_cols = context.num_cols
+    if not 0 <= col < num_cols:
+        return _UNSEEN
+    row_start = row * num_cols
+    if step > 0:
+        stop = context.stop_east.find(_STOP, index, row_start + num_cols)
+        reaches_target = (context.target_row == row and index <= context.target_index
+                          and (stop == _UNSEEN or context.target_index <= stop))
+    else:
+        stop = context.stop_west.rfind(_STOP, row_start, index + 1)
+        reaches_target = (context.target_row == row and context.target_index <= index
+                          and (stop == _UNSEEN or stop <= context.target_index))
+    if reaches_target:
+        return context.target_index
+    if stop == _UNSEEN or not context.cells[stop]:
+        return _UNSEEN
+    return stop
+
+
+def _jump_vertical(context: _JumpContext, index: int, row: int, step: int) -> int:
+    cells, num_rows, num_cols = context.cells, context.num_rows, context.num_cols
+    col = index % num_cols
+    row_step = step * num_cols
+    while 0 <= row < num_rows and cells[index]:
+        if index == context.target_index:
+            return index
+        previous = index - row_step
+        if col > 0 and cells[index - 1] and not cells[previous - 1]:
+            return index
+        if col + 1 < num_cols and cells[index + 1] and not cells[previous + 1]:
+            return index
+        # Moving vertically never turns on its own, so stop wherever a horizontal jump from here would find something
+        if (_jump_horizontal(context, index + 1, row, col + 1, 1) != _UNSEEN
+                or _jump_horizontal(context, index - 1, row, col - 1, -1) != _UNSEEN):
+            return index
+        index += row_step
+        row += step
+    return _UNSEEN
+
+
+def _distance(index: int, other_index: int, num_cols: int) -> int:
+    row, col = divmod(index, num_cols)
+    other_row, other_col = divmod(other_index, num_cols)
+    return abs(row - other_row) + abs(col - other_col)
+
+
+def _interpolate(grid: FlatGrid, jump_points: List[int]) -> List[Coord]:
+    path: List[Coord] = [grid.coord_of(jump_points[0])]
+    for jump_point in jump_points[1:]:
+        row, col = path[-1]
+        next_row, next_col = grid.coord_of(jump_point)
+        row_step = (next_row > row) - (next_row < row)
+        col_step = (next_col > col) - (next_col < col)
+        while (row, col) != (next_row, next_col):
+            row, col = row + row_step, col + col_step
+            path.append((row, col))
+    return path
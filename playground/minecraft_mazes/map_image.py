@@ -0,0 +1,81 @@
+import hashlib
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+CropBox = Tuple[int, int, int, int]
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".gif"}
+GRID_SUFFIX = ".npy"
+
+
+def load_map_image(
+        image_path: Union[str, Path], num_rows: int, num_cols: int, crop: Optional[CropBox] = None,
+        threshold: int = 128, invert: bool = False, cache_path: Optional[Union[str, Path]] = None
+) -> np.ndarray:
+    image_path = Path(image_path)
+    if cache_path is None:
+        cache_path = _default_cache_path(image_path, num_rows, num_cols, crop, threshold, invert)
+    cache_path = Path(cache_path)
+    if cache_path.exists() and cache_path.stat().st_mtime >= image_path.stat().st_mtime:
+        return load_grid(cache_path)
+
+    is_traversable_map = _threshold_image(image_path, num_rows, num_cols, crop, threshold, invert)
+    np.save(cache_path, is_traversable_map)
+    return load_grid(cache_path)
+
+
+def load_grid(grid_path: Union[str, Path]) -> np.ndarray:
+    is_traversable_map = np.load(grid_path, mmap_mode="r")
+    if is_traversable_map.ndim != 2 or is_traversable_map.dtype != bool:
+        raise ValueError(f"Grid file must hold a 2D bool array, was {is_traversable_map.ndim}D "
+                         f"{is_traversable_map.dtype}")
+    return is_traversable_map
+
+
+def _threshold_image(
+        image_path: Path, num_rows: int, num_cols: int, crop: Optional[CropBox], threshold: int, invert: bool
+) -> np.ndarray:
+    with Image.open(image_path) as image:
+        grayscale = image.convert("L")
+        if crop is not None:
+            grayscale = grayscale.crop(crop)
+        # Box resampling averages every pixel that falls in a cell, which smooths over labels drawn on the blocks
+        cell_brightness = np.asarray(grayscale.resize((num_cols, num_rows), Image.Resampling.BOX))
+    return (cell_brightness >= threshold) != invert
+
+
+def _default_cache_path(
+        image_path: Path, num_rows: int, num_cols: int, crop: Optional[CropBox], threshold: int, invert: bool
+) -> Path:
+    settings = repr((num_rows, num_cols, crop, threshold, invert)).encode("utf8")
+    settings_digest = hashlib.sha256(settings).hexdigest()[:12]
+    return image_path.with_name(f"{image_path.stem}.{num_rows}x{num_cols}.{settings_digest}{GRID_SUFFIX}")
+
+
+def _main() -> None:
+    parser = ArgumentParser(description="Converts a map screenshot into a grid and prints it in the problem format")
+    parser.add_argument("image", help="name of the image file")
+    parser.add_argument("--grid-size", type=int, nargs=2, required=True, metavar=("ROWS", "COLS"),
+                        help="number of rows and columns of blocks in the image")
+    parser.add_argument("--crop", type=int, nargs=4, required=False, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="pixel box around the blocks, the whole image is used otherwise")
+    parser.add_argument("--threshold", type=int, default=128,
+                        help="blocks at least this bright (0-255) are traversable (default: 128)")
+    parser.add_argument("--invert", required=False, action="store_true", help="treat dark blocks as traversable")
+    args = parser.parse_args()
+
+    num_rows, num_cols = args.grid_size
+    crop = tuple(args.crop) if args.crop else None
+    is_traversable_map = load_map_image(args.image, num_rows, num_cols, crop, args.threshold, args.invert)
+    print(num_rows)
+    print(num_cols)
+    for row in np.where(is_traversable_map, ord("0"), ord("1")).astype(np.uint8):
+        print(row.tobytes().decode("ascii"))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,77 @@
+from random import Random
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+Coord = Tuple[int, int]
+GeneratedMaze = Tuple[np.ndarray, Coord, Coord]
+
+
+def random_walls(size: int, seed: int, wall_density: float = 0.3) -> GeneratedMaze:
+    rng = np.random.default_rng(seed)
+    is_traversable_map = rng.random((size, size)) >= wall_density
+    # Random walls alone leave the corners disconnected for most seeds; a random staircase of right and down steps
+    # between them guarantees a path without making it the obvious one
+    is_down_step = rng.permutation(np.arange(2 * (size - 1)) < size - 1)
+    is_traversable_map[np.cumsum(is_down_step), np.cumsum(~is_down_step)] = True
+    return _with_open_corners(is_traversable_map)
+
+
+def recursive_backtracker(size: int, seed: int) -> GeneratedMaze:
+    # Perfect maze (exactly one path between any two cells) carved over the even coordinates of the grid. Uses an
+    # explicit stack rather than recursion so large sizes do not hit the recursion limit, and plain bytearrays since
+    # the loop touches one cell at a time.
+    rng = Random(seed)
+    rooms_per_side = (size + 1) // 2
+    cells = bytearray(size * size)
+    visited = bytearray(rooms_per_side * rooms_per_side)
+    visited[0] = 1
+    cells[0] = 1
+    stack = [(0, 0)]
+    while stack:
+        room_row, room_col = stack[-1]
+        unvisited = [
+            (next_row, next_col) for next_row, next_col in (
+                (room_row + 1, room_col), (room_row - 1, room_col), (room_row, room_col + 1), (room_row, room_col - 1)
+            )
+            if 0 <= next_row < rooms_per_side and 0 <= next_col < rooms_per_side
+            and not visited[next_row * rooms_per_side + next_col]
+        ]
+        if not unvisited:
+            stack.pop()
+            continue
+        next_row, next_col = unvisited[rng.randrange(len(unvisited))]
+        visited[next_row * rooms_per_side + next_col] = 1
+        cells[(room_row + next_row) * size + room_col + next_col] = 1  # The wall between the two rooms
+        cells[2 * next_row * size + 2 * next_col] = 1
+        stack.append((next_row, next_col))
+    last_room = 2 * (rooms_per_side - 1)
+    is_traversable_map = np.frombuffer(cells, dtype=np.uint8).reshape(size, size).astype(bool)
+    return is_traversable_map, (0, 0), (last_room, last_room)
+
+
+def open_field(size: int, seed: int) -> GeneratedMaze:
+    return _with_open_corners(np.ones((size, size), dtype=bool))
+
+
+def unreachable_target(size: int, seed: int, wall_density: float = 0.2) -> GeneratedMaze:
+    # Worst case for a uni-directional search: the target is sealed in, so everything reachable gets expanded
+    is_traversable_map, start_position, target = random_walls(size, seed, wall_density)
+    target_row, target_col = target
+    is_traversable_map[max(target_row - 1, 0):target_row + 2, max(target_col - 1, 0):target_col + 2] = False
+    is_traversable_map[target_row, target_col] = True
+    return is_traversable_map, start_position, target
+
+
+def _with_open_corners(is_traversable_map: np.ndarray) -> GeneratedMaze:
+    is_traversable_map[0, 0] = is_traversable_map[-1, -1] = True
+    size = is_traversable_map.shape[0]
+    return is_traversable_map, (0, 0), (size - 1, size - 1)
+
+
+GENERATORS: Dict[str, Callable[[int, int], GeneratedMaze]] = {
+    "random_walls": random_walls,
+    "recursive_backtracker": recursive_backtracker,
+    "open_field": open_field,
+    "unreachable_target": unreachable_target,
+}
@@ -0,0 +1,92 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from playground.minecraft_mazes.compact_astar import FlatGrid, solve_with_compact_a_star
+from playground.minecraft_mazes.maze_input import load_problem
+
+Coord = Tuple[int, int]
+Query = Tuple[Coord, Coord]
+
+_WALL_LABEL = -1
+
+
+class MazeIndex:
+    def __init__(self, is_traversable_map: np.ndarray, cache_size: int = 1024):
+        self._is_traversable_map = np.ascontiguousarray(is_traversable_map, dtype=bool)
+        self._grid = FlatGrid.from_array(self._is_traversable_map)
+        self._component_labels = label_components(self._is_traversable_map).reshape(-1)
+        self._cached_search = lru_cache(maxsize=cache_size)(self._search)
+
+    @classmethod
+    def from_problem_file(cls, path: Union[str, Path], cache_size: int = 1024) -> "MazeIndex":
+        is_traversable_map, _, _ = load_problem(path, use_mmap=True)
+        return cls(is_traversable_map, cache_size)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._grid.num_rows, self._grid.num_cols
+
+    def is_reachable(self, start_position: Coord, target: Coord) -> bool:
+        start_label = self._component_labels[self._grid.index_of(start_position)]
+        return start_label != _WALL_LABEL and start_label == self._component_labels[self._grid.index_of(target)]
+
+    def path(self, start_position: Coord, target: Coord) -> List[Coord]:
+        if not self.is_reachable(start_position, target):
+            raise ValueError("Could not find path")
+        return list(self._cached_search(start_position, target))
+
+    def paths(self, queries: Iterable[Query]) -> List[Optional[List[Coord]]]:
+        return [
+            self.path(start_position, target) if self.is_reachable(start_position, target) else None
+            for start_position, target in queries
+        ]
+
+    def cache_info(self):
+        return self._cached_search.cache_info()
+
+    def clear_cache(self) -> None:
+        self._cached_search.cache_clear()
+
+    def _search(self, start_position: Coord, target: Coord) -> Tuple[Coord, ...]:
+        return tuple(solve_with_compact_a_star(self._grid, start_position, target))
+
+
+def label_components(is_traversable_map: np.ndarray) -> np.ndarray:
+    num_rows, num_cols = is_traversable_map.shape
+    traversable = is_traversable_map.reshape(-1)
+    if not traversable.any():
+        return np.full(is_traversable_map.shape, _WALL_LABEL, dtype=np.int32)
+
+    # Every horizontal run of traversable cells gets its own id, so only vertical adjacency has to be merged below
+    starts_run = traversable.copy()
+    starts_run[1:] &= ~traversable[:-1] | (np.arange(1, traversable.size) % num_cols == 0)
+    run_ids = np.cumsum(starts_run, dtype=np.int32) - 1
+    run_ids = run_ids.reshape(num_rows, num_cols)
+    run_count = int(run_ids.max()) + 1
+
+    vertical_links = is_traversable_map[:-1] & is_traversable_map[1:]
+    upper_runs, lower_runs = run_ids[:-1][vertical_links], run_ids[1:][vertical_links]
+    links = np.unique(upper_runs.astype(np.int64) * run_count + lower_runs)
+    upper_runs, lower_runs = (links // run_count).astype(np.int32), (links % run_count).astype(np.int32)
+
+    # Hook-and-compress: repeatedly point the larger root of each linked pair at the smaller one (when several writes
+    # hit the same root any of them is fine, they are all in one component), then flatten the forest with pointer
+    # jumping. Converges in a handful of vectorized rounds rather than one Python step per cell.
+    parent = np.arange(run_count, dtype=np.int32)
+    while True:
+        upper_roots, lower_roots = parent[upper_runs], parent[lower_runs]
+        unmerged = upper_roots != lower_roots
+        if not unmerged.any():
+            break
+        upper_roots, lower_roots = upper_roots[unmerged], lower_roots[unmerged]
+        parent[np.maximum(upper_roots, lower_roots)] = np.minimum(upper_roots, lower_roots)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    return np.where(is_traversable_map, parent[run_ids], _WALL_LABEL).astype(np.int32)
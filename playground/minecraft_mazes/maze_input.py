@@ -0,0 +1,110 @@
+import mmap
+import sys
+import traceback
+from pathlib import Path
+from typing import BinaryIO, Iterator, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+Coord = Tuple[int, int]
+ProblemSource = Union[str, Path, BinaryIO, None]
+
+_NEWLINE = ord("\n")
+_CARRIAGE_RETURN = ord("\r")
+_TRAVERSABLE = ord("0")
+
+
+def load_problem(source: ProblemSource = None, use_mmap: bool = False) -> Tuple[np.ndarray, Coord, Coord]:
+    if source is None:
+        return parse_problem(sys.stdin.buffer.read())
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as file:
+            if not use_mmap:
+                return parse_problem(file.read())
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                try:
+                    return parse_problem(mapped)
+                except Exception as e:
+                    # The failed frames still hold views of the map, which could then not be closed (BufferError)
+                    traceback.clear_frames(e.__traceback__)
+                    raise
+    return parse_problem(source.read())
+
+
+def parse_problem(data: Union[bytes, bytearray, memoryview, mmap.mmap]) -> Tuple[np.ndarray, Coord, Coord]:
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        raise ValueError("Problem input was empty")
+    line_starts, line_ends = _find_lines(buffer)
+
+    num_rows = int(_line_bytes(buffer, line_starts, line_ends, 0))
+    num_cols = int(_line_bytes(buffer, line_starts, line_ends, 1))
+    if len(line_starts) < num_rows + 4:
+        raise ValueError(f"Problem input ended early. Expected {num_rows + 4} lines, was {len(line_starts)}")
+
+    map_line_starts = line_starts[2:2 + num_rows]
+    map_line_lengths = line_ends[2:2 + num_rows] - map_line_starts
+    wrong_lengths = np.flatnonzero(map_line_lengths != num_cols)
+    if wrong_lengths.size:
+        raise ValueError(f"Map line did not have expected length. Expected {num_cols}, "
+                         f"was {map_line_lengths[wrong_lengths[0]]}")
+    is_traversable_map = _extract_map(buffer, map_line_starts, num_rows, num_cols)
+
+    start_input = _line_bytes(buffer, line_starts, line_ends, num_rows + 2).split()
+    start_position = (int(start_input[0]), int(start_input[1]))
+    target_input = _line_bytes(buffer, line_starts, line_ends, num_rows + 3).split()
+    target = (int(target_input[0]), int(target_input[1]))
+    return is_traversable_map, start_position, target
+
+
+def split_problems(data: Union[bytes, bytearray, memoryview, mmap.mmap]) -> Iterator[bytes]:
+    # Splits a stream of back to back problems (blank lines between them are allowed) into one chunk per problem
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        return
+    line_starts, line_ends = _find_lines(buffer)
+    line_number = 0
+    while True:
+        while line_number < len(line_starts) and line_ends[line_number] == line_starts[line_number]:
+            line_number += 1
+        if line_number >= len(line_starts):
+            return
+        num_rows = int(_line_bytes(buffer, line_starts, line_ends, line_number))
+        last_line_number = line_number + num_rows + 3
+        if last_line_number >= len(line_starts):
+            raise ValueError(f"Problem starting on line {line_number + 1} ended early")
+        yield buffer[line_starts[line_number]:line_ends[last_line_number]].tobytes() + b"\n"
+        line_number = last_line_number + 1
+
+
+def _find_lines(buffer: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    line_ends = np.flatnonzero(buffer == _NEWLINE)
+    if buffer[-1] != _NEWLINE:
+        line_ends = np.append(line_ends, buffer.size)
+    line_starts = np.empty_like(line_ends)
+    line_starts[0] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    # Tolerate '\r\n' line endings by excluding the '\r' from any non-empty line that ends with one
+    has_carriage_return = (line_ends > line_starts) & (buffer[np.maximum(line_ends - 1, 0)] == _CARRIAGE_RETURN)
+    return line_starts, line_ends - has_carriage_return
+
+
+def _line_bytes(buffer: np.ndarray, line_starts: np.ndarray, line_ends: np.ndarray, line_number: int) -> bytes:
+    if line_number >= len(line_starts):
+        raise ValueError(f"Problem input ended early, line {line_number + 1} is missing")
+    return buffer[line_starts[line_number]:line_ends[line_number]].tobytes()
+
+
+def _extract_map(buffer: np.ndarray, map_line_starts: np.ndarray, num_rows: int, num_cols: int) -> np.ndarray:
+    if num_rows == 0:
+        return np.zeros((0, num_cols), dtype=bool)
+    strides = np.diff(map_line_starts)
+    if num_rows == 1 or np.all(strides == strides[0]):
+        # Uniform line endings: view the map block as a (rows, cols) window over the raw buffer without copying
+        stride = int(strides[0]) if num_rows > 1 else num_cols
+        block = as_strided(buffer[map_line_starts[0]:], shape=(num_rows, num_cols), strides=(stride, 1),
+                           writeable=False)
+    else:
+        block = buffer[map_line_starts[:, np.newaxis] + np.arange(num_cols)]
+    return block == _TRAVERSABLE
@@ -1,7 +1,9 @@
 from argparse import ArgumentParser
 from pathlib import Path
 from subprocess import Popen, PIPE, STDOUT
-from typing import List
+from typing import Dict, Iterable
+
+from playground.minecraft_mazes.astar_solver import decode_run_lengths
 
 
 def _main() -> None:
@@ -10,15 +12,21 @@ def _main() -> None:
     parser.add_argument("--output", required=False, help="optional name of the output file")
     parser.add_argument("--pretty", required=False, action="store_true",
                         help="print the visual path as text. cannot be combined with '--output'")
+    parser.add_argument("--algorithm", required=False, default="astar",
+                        help="search strategy passed on to the solver (astar, bidirectional or jps)")
+    parser.add_argument("--rle", required=False, action="store_true",
+                        help="have the solver run-length encode its output, decoded again before comparing")
     args = parser.parse_args()
 
     input_lines = Path(args.input).read_text("utf8")
-    solver = Popen(['python', 'astar_solver.py'], stdout=PIPE, stdin=PIPE, stderr=STDOUT)
+    solver_command = ['python', 'astar_solver.py', '--algorithm', args.algorithm] + (['--rle'] if args.rle else [])
+    solver = Popen(solver_command, stdout=PIPE, stdin=PIPE, stderr=STDOUT)
     result = solver.communicate(input=input_lines.encode("utf8"))[0].decode("utf8")
 
     if args.output:
         expected_result = Path(args.output).read_text("utf8")
-        is_correct = expected_result.splitlines() == result.splitlines()
+        is_correct = (list(decode_run_lengths(expected_result.splitlines()))
+                      == list(decode_run_lengths(result.splitlines())))
         print("----- Input:")
         print(input_lines)
         print(f"----- Result {'(CORRECT)' if is_correct else '(INCORRECT)'}: ")
@@ -33,28 +41,40 @@ def _main() -> None:
         lines = input_lines.split()
         rows = int(lines[0])
         cols = int(lines[1])
-        pretty_output: List[List[str]] = [[" " for _ in range(cols)] for _ in range(rows)]
-        row, col = [int(char) for char in lines[-4:-2]]
-        pretty_output[row][col] = "^"
-        for move in result.splitlines():
-            if move == "south":
-                row += 1
-            elif move == "north":
-                row -= 1
-            elif move == "east":
-                col += 1
-            elif move == "west":
-                col -= 1
-            else:
-                break
-            pretty_output[row][col] = "*"
-        pretty_output[row][col] = "$"
-        for pretty_row in pretty_output:
-            print(" ".join(pretty_row))
+        start_row, start_col = [int(char) for char in lines[-4:-2]]
+        _print_pretty_path(rows, cols, start_row, start_col, decode_run_lengths(result.splitlines()))
     else:
         print("----- Result:")
         print(result)
 
 
+def _print_pretty_path(rows: int, cols: int, start_row: int, start_col: int, moves: Iterable[str]) -> None:
+    # Only the path cells are kept (row -> {col: marker}); each row is rendered and printed on its own, so the full
+    # rows x cols matrix is never held in memory
+    path_cells: Dict[int, Dict[int, str]] = {start_row: {start_col: "^"}}
+    row, col = start_row, start_col
+    for move in moves:
+        if move == "south":
+            row += 1
+        elif move == "north":
+            row -= 1
+        elif move == "east":
+            col += 1
+        elif move == "west":
+            col -= 1
+        else:
+            break
+        path_cells.setdefault(row, {})[col] = "*"
+    path_cells.setdefault(row, {})[col] = "$"
+
+    blank_row = " ".join(" " * cols)
+    for row_index in range(rows):
+        row_cells = path_cells.get(row_index)
+        if row_cells is None:
+            print(blank_row)
+            continue
+        print(" ".join(row_cells.get(col_index, " ") for col_index in range(cols)))
+
+
 if __name__ == "__main__":
     _main()
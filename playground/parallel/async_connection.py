@@ -0,0 +1,166 @@
+"""
+'multiprocessing.connection' compatible messaging over asyncio streams.
+- Messages are framed as 'Connection.send_bytes' does: a 4 byte big-endian signed length, or -1 followed by an 8 byte
+  length for payloads over 2 GiB. 'send' and 'recv' pickle objects like 'Connection.send' and 'Connection.recv'.
+- 'accept' and 'connect' run the same authkey handshake as 'Listener.accept' and 'Client': each side proves it knows the
+  key by returning the HMAC of a random challenge from the other. Challenges sent from here use the original MD5 form,
+  which every Python version accepts. Answers handle both that and the '{digest}' prefixed challenges of Python 3.12+.
+- So an asyncio server can accept plain 'multiprocessing.connection.Client's, and an asyncio client can talk to a plain
+  'Listener', without either side noticing.
+"""
+import asyncio
+import hmac
+import os
+import pickle
+import struct
+from multiprocessing import AuthenticationError
+from typing import Any, Optional, Tuple
+
+_SHORT_HEADER = struct.Struct("!i")
+_LONG_HEADER = struct.Struct("!Q")
+_LONG_MESSAGE = -1
+_MAX_SHORT_LENGTH = 0x7fffffff
+_SEPARATE_WRITE_SIZE = 16384  # Smaller payloads are copied behind their header and written once, as the stdlib does
+_CHALLENGE = b"#CHALLENGE#"
+_WELCOME = b"#WELCOME#"
+_FAILURE = b"#FAILURE#"
+_CHALLENGE_LENGTH = 20
+_LEGACY_DIGEST = "md5"
+_LEGACY_RESPONSE_LENGTH = 16  # An MD5 digest
+_DIGESTS = {"md5", "sha256", "sha384", "sha3_256", "sha3_384"}  # Those Python 3.12+ accepts in a '{digest}' prefix
+_MAX_HANDSHAKE_MESSAGE = 256
+
+
+class AsyncConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @property
+    def peer(self) -> Any:
+        return self._writer.get_extra_info("peername")
+
+    async def send(self, obj: Any) -> None:
+        await self.send_bytes(pickle.dumps(obj))
+
+    async def recv(self) -> Any:
+        # Only unpickle from peers that passed the handshake, as with 'Connection.recv'
+        return pickle.loads(await self.recv_bytes())
+
+    async def send_bytes(self, payload: bytes) -> None:
+        self.write_bytes(payload)
+        await self._writer.drain()
+
+    def write_bytes(self, payload: bytes) -> None:
+        # Buffers a message without waiting for the socket, for writing several before a single 'drain'
+        if self._writer.transport.is_closing():
+            return  # The peer has gone; asyncio would drop it anyway, warning about every write after the first few
+        if len(payload) > _MAX_SHORT_LENGTH:
+            self._writer.write(_SHORT_HEADER.pack(_LONG_MESSAGE) + _LONG_HEADER.pack(len(payload)))
+            self._writer.write(payload)
+        elif len(payload) < _SEPARATE_WRITE_SIZE:
+            self._writer.write(_SHORT_HEADER.pack(len(payload)) + payload)
+        else:
+            self._writer.write(_SHORT_HEADER.pack(len(payload)))
+            self._writer.write(payload)
+
+    async def drain(self) -> None:
+        await self._writer.drain()
+
+    @property
+    def unsent_bytes(self) -> int:
+        # What 'write_bytes' has buffered that the socket has not taken yet, e.g. for spotting a peer that reads slowly
+        return self._writer.transport.get_write_buffer_size()
+
+    async def recv_bytes(self, max_size: Optional[int] = None) -> bytes:
+        # Raises EOFError once the peer has closed the connection, as 'Connection.recv_bytes' does
+        try:
+            size, = _SHORT_HEADER.unpack(await self._reader.readexactly(_SHORT_HEADER.size))
+            if size == _LONG_MESSAGE:
+                size, = _LONG_HEADER.unpack(await self._reader.readexactly(_LONG_HEADER.size))
+            if max_size is not None and size > max_size:
+                raise OSError(f"Message of {size} bytes is over the limit of {max_size}")
+            return await self._reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            raise EOFError from None
+
+    def write_eof(self) -> None:
+        self._writer.write_eof()
+
+    def close_when_sent(self) -> None:
+        # Closes once everything buffered has been sent, without waiting for that
+        self._writer.close()
+
+    def abort(self) -> None:
+        # Closes straight away, dropping anything not sent yet
+        self._writer.transport.abort()
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, authkey: bytes) -> AsyncConnection:
+    # For 'asyncio.start_server' callbacks; closes the connection and raises AuthenticationError for a wrong key
+    connection = AsyncConnection(reader, writer)
+    try:
+        await _deliver_challenge(connection, authkey)
+        await _answer_challenge(connection, authkey)
+    except (AuthenticationError, EOFError, OSError):
+        await connection.close()
+        raise
+    return connection
+
+
+async def connect(address: Tuple[str, int], authkey: bytes) -> AsyncConnection:
+    reader, writer = await asyncio.open_connection(*address)
+    connection = AsyncConnection(reader, writer)
+    try:
+        await _answer_challenge(connection, authkey)
+        await _deliver_challenge(connection, authkey)
+    except (AuthenticationError, EOFError, OSError):
+        await connection.close()
+        raise
+    return connection
+
+
+async def _deliver_challenge(connection: AsyncConnection, authkey: bytes) -> None:
+    challenge = os.urandom(_CHALLENGE_LENGTH)
+    await connection.send_bytes(_CHALLENGE + challenge)
+    response = await connection.recv_bytes(_MAX_HANDSHAKE_MESSAGE)
+    digest_name, response_digest = _split_digest(response, _LEGACY_RESPONSE_LENGTH)
+    if hmac.compare_digest(response_digest, hmac.new(authkey, challenge, digest_name or _LEGACY_DIGEST).digest()):
+        await connection.send_bytes(_WELCOME)
+    else:
+        await connection.send_bytes(_FAILURE)
+        raise AuthenticationError("digest received was wrong")
+
+
+async def _answer_challenge(connection: AsyncConnection, authkey: bytes) -> None:
+    message = await connection.recv_bytes(_MAX_HANDSHAKE_MESSAGE)
+    if not message.startswith(_CHALLENGE):
+        raise AuthenticationError(f"Expected a challenge, received {message[:len(_CHALLENGE)]!r}")
+    digest_name, challenge = _split_digest(message[len(_CHALLENGE):], _CHALLENGE_LENGTH)
+    if digest_name is None:
+        await connection.send_bytes(hmac.new(authkey, challenge, _LEGACY_DIGEST).digest())
+    else:
+        # Python 3.12+ signs the whole challenge, prefix included, and prefixes its answer the same way
+        signed = message[len(_CHALLENGE):]
+        await connection.send_bytes(b"{%s}" % digest_name.encode() + hmac.new(authkey, signed, digest_name).digest())
+    if await connection.recv_bytes(_MAX_HANDSHAKE_MESSAGE) != _WELCOME:
+        raise AuthenticationError("digest sent was rejected")
+
+
+def _split_digest(message: bytes, legacy_length: int) -> Tuple[Optional[str], bytes]:
+    # '{sha256}...' -> ('sha256', '...'). Legacy messages are random bytes that may well start with '{' too, so they are
+    # told apart by their length, as Python 3.12+ does
+    if len(message) == legacy_length:
+        return None, message
+    end = message.find(b"}", 1, 2 + max(map(len, _DIGESTS)))
+    digest_name = message[1:end].decode("ascii", "replace") if message.startswith(b"{") and end > 0 else None
+    if digest_name not in _DIGESTS:
+        raise AuthenticationError("unsupported message length, missing digest prefix, or unsupported digest")
+    return digest_name, message[end + 1:]
@@ -0,0 +1,319 @@
+import asyncio
+import sys
+from argparse import ArgumentParser
+from asyncio import StreamReader, StreamWriter
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import current_process, get_context
+from multiprocessing.util import Finalize
+from os import cpu_count
+from signal import SIGINT, SIG_IGN, signal
+from threading import Thread
+from typing import AsyncIterator, Dict, List, Optional, Set, Union
+
+from playground.parallel.event_log import Verbosity, flush, is_enabled, log
+from playground.parallel.fibonacci_cache import FibonacciCache
+from playground.parallel.shared_results import SharedResult, SharedResultWriter, describe_result, take_result
+from playground.parallel.worker_metrics import (
+    MetricsRing, TaskTiming, TimedWork, export_metrics, parse_metrics_command,
+)
+from playground.parallel.worker_requests import calculate, parse_work_request
+
+_EXIT_FLAG = "__EXIT__"
+_EXIT_COMMAND = "exit"
+# Answers queued for a client past which its further requests are not read until it has caught up
+_CLIENT_BACKLOG_LINES = 1000
+# Per pool worker process, set by _initialize_pool_worker
+_pool_cache: Optional[FibonacciCache] = None
+_pool_writer: Optional[SharedResultWriter] = None
+
+
+# A socket client's answers are queued here without waiting, and written out by the client's own sender task. A client
+# that is slow to read therefore only holds up its own answers, never the printer that serves every client.
+class _ClientOutbox:
+    def __init__(self, writer: StreamWriter):
+        self._writer = writer
+        self._lines: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+
+    def send(self, message: str) -> None:
+        self._lines.put_nowait(message)
+        if self._lines.qsize() >= _CLIENT_BACKLOG_LINES:
+            self._has_room.clear()
+
+    async def wait_for_room(self) -> None:
+        await self._has_room.wait()
+
+    async def sender_main(self) -> None:
+        # Runs until 'finish'; whatever has queued up meanwhile goes out in a single write
+        finishing = False
+        while not finishing:
+            lines = [await self._lines.get()]
+            while not self._lines.empty():
+                lines.append(self._lines.get_nowait())
+            if lines[-1] is None:
+                finishing = True
+                lines.pop()
+            if lines and not self._writer.is_closing():
+                try:
+                    self._writer.write("".join(f"{line}\n" for line in lines).encode())
+                    await self._writer.drain()
+                except ConnectionError:
+                    pass  # The client left without waiting for its answers
+            if self._lines.qsize() < _CLIENT_BACKLOG_LINES:
+                self._has_room.set()
+
+    def finish(self) -> None:
+        self._lines.put_nowait(None)
+
+
+@dataclass(frozen=True)
+class _Request:
+    work: TimedWork
+    reply: Optional[_ClientOutbox]  # The socket client that sent it, or None to print the results
+    done: asyncio.Future  # Set once every result has been printed or sent
+
+
+@dataclass(frozen=True)
+class _Output:
+    request: _Request
+    results: List[Union[SharedResult, TaskTiming, str]]
+
+
+@dataclass
+class _Arguments:
+    worker_count: int
+    max_pending: int
+    host: str
+    port: Optional[int]
+
+
+def _parse_arguments() -> _Arguments:
+    parser = ArgumentParser(description="Asyncio front-end for process pool Fibonacci workers")
+    parser.add_argument("-w", "--workers", type=int, default=cpu_count() or 1,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--max-pending", type=int, default=10_000,
+                        help="most requests waiting for a worker, input waits while this many are queued "
+                             "(default: 10000)")
+    parser.add_argument("--port", type=int, required=False,
+                        help="also accept requests from TCP clients on this port, one request per line")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on with --port (default: 127.0.0.1)")
+    args = parser.parse_args()
+    if args.workers <= 0 or args.max_pending <= 0:
+        parser.error("--workers and --max-pending must be at least 1")
+
+    return _Arguments(args.workers, args.max_pending, args.host, args.port)
+
+
+def _main():
+    args = _parse_arguments()
+    try:
+        asyncio.run(_main_async(args))
+    except KeyboardInterrupt:
+        log("Interrupted, exiting.")
+
+
+async def _main_async(args: _Arguments) -> None:
+    # A single event loop thread reads input, keeps up to 'max_pending' requests in a bounded queue and hands them to a
+    # process pool with 'run_in_executor'. Only twice as many requests as there are workers are in the pool at once, so
+    # the rest wait in the queue, where they cost an object each rather than a thread each.
+    request_queue: asyncio.Queue[Union[_Request, str]] = asyncio.Queue(maxsize=args.max_pending)
+    output_queue: asyncio.Queue[Union[_Output, str]] = asyncio.Queue()
+    metrics = MetricsRing()
+    clients: Dict[asyncio.Task, StreamReader] = {}
+
+    log(f"Spinning up a pool of {args.worker_count} worker processes...")
+    executor = ProcessPoolExecutor(args.worker_count, get_context("spawn"), _initialize_pool_worker)
+    max_in_flight = 2 * args.worker_count
+    dispatcher_task = asyncio.create_task(_dispatcher_main(executor, request_queue, output_queue, max_in_flight))
+    printer_task = asyncio.create_task(_printer_main(output_queue, metrics))
+    server: Optional[asyncio.Server] = None
+    if args.port is not None:
+        server = await asyncio.start_server(
+            partial(_client_main, request_queue, metrics, clients), args.host, args.port
+        )
+        log(f"Listening for requests on {args.host}:{args.port}.")
+    log("Pool ready.")
+
+    flush()
+    print("Enter numbers and press enter. Repeat as long as desired. Requests will be enqueued for asynchronous "
+          "calculation. Answers will be printed once calculated. Enter a range (e.g. '100..200') or several numbers "
+          "(e.g. '5, 8, 13') to calculate them together. Enter 'metrics' (or 'metrics <file>') for timings. Enter "
+          "'exit' to quit.")
+    try:
+        async for user_input in _stdin_lines():
+            if user_input == _EXIT_COMMAND:
+                break
+            await _submit(user_input, None, request_queue, metrics)
+
+        log("Finishing outstanding calculations and stopping the pool...")
+        if server is not None:
+            # Clients stop being read from, but still get the answers to what they sent before
+            server.close()
+            for reader in clients.values():
+                reader.feed_eof()
+            await asyncio.gather(*clients, return_exceptions=True)
+        await request_queue.put(_EXIT_FLAG)
+        await dispatcher_task
+        await output_queue.put(_EXIT_FLAG)
+        await printer_task
+    finally:
+        # Also reached when interrupted, in which case queued requests are dropped and running ones left to finish
+        executor.shutdown(wait=False, cancel_futures=True)
+    executor.shutdown()
+    log("Pool shut down, exiting.")
+
+
+async def _stdin_lines() -> AsyncIterator[str]:
+    # A daemon thread reads stdin one line at a time, waiting for each line to be taken before reading the next.
+    # Handing stdin to the loop itself instead (with 'connect_read_pipe') does not work on Windows, nor for redirected
+    # files, and makes a terminal non-blocking for the prints as well. The loop's default executor is no good either: a
+    # blocked read can not be cancelled, so Ctrl+C would wait for one more line of input.
+    loop = asyncio.get_running_loop()
+    lines: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=1)
+
+    def read_lines() -> None:
+        try:
+            for line in sys.stdin:
+                asyncio.run_coroutine_threadsafe(lines.put(line.rstrip("\r\n")), loop).result()
+            asyncio.run_coroutine_threadsafe(lines.put(None), loop).result()
+        except (RuntimeError, CancelledError):
+            pass  # The loop is already gone
+
+    Thread(target=read_lines, daemon=True).start()
+    while (line := await lines.get()) is not None:
+        yield line
+
+
+async def _client_main(
+        request_queue: asyncio.Queue, metrics: MetricsRing, clients: Dict[asyncio.Task, StreamReader],
+        reader: StreamReader, writer: StreamWriter
+) -> None:
+    clients[asyncio.current_task()] = reader
+    peer = writer.get_extra_info("peername")
+    log(f"Client {peer} connected.")
+    outbox = _ClientOutbox(writer)
+    sender_task = asyncio.create_task(outbox.sender_main())
+    pending: Set[asyncio.Future] = set()
+    try:
+        while line := await reader.readline():
+            user_input = line.decode(errors="replace").strip()
+            if user_input == _EXIT_COMMAND:
+                break
+            done = await _submit(user_input, outbox, request_queue, metrics)
+            if done is not None:
+                pending.add(done)
+                done.add_done_callback(pending.discard)
+            await outbox.wait_for_room()
+        await asyncio.gather(*pending)  # Answers everything the client sent before closing the connection
+    except ConnectionError:
+        pass  # Answers still on their way are dropped once the connection is closed
+    finally:
+        outbox.finish()
+        await sender_task
+        writer.close()
+        del clients[asyncio.current_task()]
+        log(f"Client {peer} disconnected.")
+
+
+async def _submit(
+        user_input: str, reply: Optional[_ClientOutbox], request_queue: asyncio.Queue, metrics: MetricsRing
+) -> Optional[asyncio.Future]:
+    metrics_export = parse_metrics_command(user_input)
+    if metrics_export is not None:
+        if reply is not None and metrics_export.destination:
+            _reply(reply, "Clients can only ask for the metrics summary, not write files")
+            return None
+        try:
+            _reply(reply, export_metrics(metrics, metrics_export))
+        except OSError as e:
+            _reply(reply, f"Could not export metrics: {e}")
+        return None
+    try:
+        work = TimedWork.now(parse_work_request(user_input))
+    except ValueError:
+        _reply(reply, f"Skipping invalid input '{user_input}'")
+        return None
+    request = _Request(work, reply, asyncio.get_running_loop().create_future())
+    await request_queue.put(request)  # Waits while the queue is full
+    return request.done
+
+
+async def _dispatcher_main(
+        executor: ProcessPoolExecutor, request_queue: asyncio.Queue, output_queue: asyncio.Queue, max_in_flight: int
+) -> None:
+    in_flight = asyncio.Semaphore(max_in_flight)
+    running: Set[asyncio.Task] = set()
+
+    async def run(request: _Request, queue_depth: int) -> None:
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                executor, _calculate, request.work, queue_depth
+            )
+        except ValueError as e:
+            results = [f"Fibonacci({request.work.request}) failed! {e}"]
+        except Exception as e:
+            # A worker died (BrokenProcessPool), the work could not be pickled...; the request is still answered
+            results = [f"Fibonacci({request.work.request}) failed! {e!r}"]
+        finally:
+            in_flight.release()
+        await output_queue.put(_Output(request, results))
+
+    while True:
+        request = await request_queue.get()
+        if request == _EXIT_FLAG:
+            break
+        await in_flight.acquire()
+        task = asyncio.create_task(run(request, request_queue.qsize()))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    await asyncio.gather(*running)
+
+
+async def _printer_main(output_queue: asyncio.Queue, metrics: MetricsRing) -> None:
+    while True:
+        output = await output_queue.get()
+        if output == _EXIT_FLAG:
+            break
+        for result in output.results:
+            if isinstance(result, TaskTiming):
+                metrics.record(result)
+            elif isinstance(result, SharedResult):
+                value = take_result(result)  # Also when not logged, as it releases the shared memory
+                if output.request.reply is not None or is_enabled(Verbosity.NORMAL):
+                    _reply(output.request.reply, describe_result(result.fibonacci_number, value))
+            else:
+                _reply(output.request.reply, result)
+        output.request.done.set_result(None)
+
+
+def _reply(reply: Optional[_ClientOutbox], message: str) -> None:
+    if reply is None:
+        log(message)
+    else:
+        reply.send(message)
+
+
+# noinspection DuplicatedCode
+def _initialize_pool_worker() -> None:
+    global _pool_cache, _pool_writer
+    signal(SIGINT, SIG_IGN)  # Ctrl+C is handled by the main process, so running requests are allowed to finish
+    _pool_cache = FibonacciCache()
+    _pool_writer = SharedResultWriter()
+    Finalize(_pool_writer, _pool_writer.close, exitpriority=10)
+
+
+def _calculate(work: TimedWork, queue_depth: int) -> List[Union[SharedResult, TaskTiming]]:
+    timing = TaskTiming.taken(work, current_process().ident, queue_depth)
+    results: List[Union[SharedResult, TaskTiming]] = [
+        _pool_writer.share(desired_fibonacci_number, result)
+        for desired_fibonacci_number, result in calculate(work.request, _pool_cache.fibonacci)
+    ]
+    results.append(timing.finish(len(results)))
+    return results
+
+
+if __name__ == "__main__":
+    _main()
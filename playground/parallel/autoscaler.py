@@ -0,0 +1,191 @@
+"""
+Grows and shrinks a set of worker threads or processes with the load on their work queue.
+- Workers follow the protocol of the worker demos: they take work from a shared queue until they take an exit flag,
+  and report how long each item took on a latency queue.
+- Every 'interval' seconds the queue depth and the average item latency are turned into an estimate of how long the
+  queue would take to drain. Workers are added while that exceeds 'target_wait', and one is retired (by queueing a
+  single exit flag) after the queue has stayed empty for 'idle_checks' checks in a row.
+- Threads suit work that mostly waits (I/O); CPU bound Python code in threads is serialised by the GIL, so CPU bound
+  work such as 'fibonacci' should be scaled as processes, which also caps the default maximum at the number of cores.
+  Thread workers are not added while the process already keeps a core busy, as the GIL lets no more run at once.
+- 'parse_autoscale' reads the 'auto' answer to the worker scripts' worker count question, with optional bounds on the
+  worker count ('auto 2..16', 'auto 4..', 'auto ..8').
+- Every scaling decision is logged with the numbers that led to it.
+"""
+import os
+from dataclasses import dataclass
+from enum import Enum
+from math import ceil
+from queue import Empty
+from threading import Event, Lock, Thread
+from time import perf_counter, process_time
+from typing import Any, Callable, List, Optional, Tuple, Union
+from multiprocessing import Process
+
+Worker = Union[Thread, Process]
+
+# Weight of the newest latency in the running average, high enough to follow a change of workload within a few items
+_LATENCY_SMOOTHING = 0.3
+# Share of one core this process has to have used since the last check for more threads to be pointless under the GIL
+_GIL_BOUND_CPU_SHARE = 0.8
+_AUTOSCALE = "auto"
+_BOUNDS_SEPARATOR = ".."
+
+
+class WorkerKind(Enum):
+    THREAD = "thread"
+    PROCESS = "process"
+
+    def default_max_workers(self) -> int:
+        cpu_count = os.cpu_count() or 1
+        return cpu_count if self == WorkerKind.PROCESS else 4 * cpu_count
+
+
+@dataclass(frozen=True)
+class WorkerBounds:
+    min_workers: Optional[int] = None
+    max_workers: Optional[int] = None
+
+
+def parse_autoscale(worker_count_raw: str) -> Optional[WorkerBounds]:
+    # None when a fixed worker count was asked for instead; bounds left out are None
+    words = worker_count_raw.split()
+    if not words or words[0] != _AUTOSCALE:
+        return None
+    if len(words) == 1:
+        return WorkerBounds()
+    if len(words) > 2 or _BOUNDS_SEPARATOR not in words[1]:
+        raise ValueError(f"Worker bounds must look like '{_AUTOSCALE} 2..16', was '{worker_count_raw.strip()}'")
+    first, _, last = words[1].partition(_BOUNDS_SEPARATOR)
+    return WorkerBounds(int(first) if first else None, int(last) if last else None)
+
+
+class Autoscaler:
+    def __init__(
+            self, kind: WorkerKind, start_worker: Callable[[], Worker], work_queue: Any, latency_queue: Any,
+            exit_flag: str, log: Callable[[str], None], min_workers: Optional[int] = None,
+            max_workers: Optional[int] = None, interval: float = 0.5, target_wait: float = 2.0, idle_checks: int = 6
+    ):
+        min_workers = min_workers if min_workers is not None else 1
+        max_workers = max_workers if max_workers is not None else kind.default_max_workers()
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError(f"Must have 1 <= min workers <= max workers, was {min_workers} and {max_workers}")
+        self._kind = kind
+        self._start_worker = start_worker
+        self._work_queue = work_queue
+        self._latency_queue = latency_queue
+        self._exit_flag = exit_flag
+        self._log = log
+        self._min_workers, self._max_workers = min_workers, max_workers
+        self._interval, self._target_wait, self._idle_checks = interval, target_wait, idle_checks
+
+        self._lock = Lock()
+        self._workers: List[Worker] = []
+        self._retiring = 0  # Exit flags queued whose worker has not been seen to exit yet
+        self._average_latency: Optional[float] = None
+        self._idle_streak = 0
+        self._last_check: Optional[Tuple[float, float]] = None  # (perf_counter, process_time)
+        self._held_by_gil = False
+        self._stopping = Event()
+        self._monitor_thread = Thread(target=self._monitor_main, daemon=True)
+
+    @property
+    def worker_count(self) -> int:
+        with self._lock:
+            return len(self._workers) - self._retiring
+
+    def start(self) -> None:
+        with self._lock:
+            self._add_workers(self._min_workers)
+        self._log(f"Autoscaler started with {self._min_workers} {self._kind.value} workers "
+                  f"(between {self._min_workers} and {self._max_workers}).")
+        self._last_check = perf_counter(), process_time()
+        self._monitor_thread.start()
+
+    def stop(self) -> None:
+        # Queued work is still finished: the exit flags go to the back of the queue
+        self._stopping.set()
+        self._monitor_thread.join()
+        with self._lock:
+            self._prune_exited()
+            workers, exit_flags_needed = list(self._workers), len(self._workers) - self._retiring
+        for _ in range(exit_flags_needed):
+            self._work_queue.put(self._exit_flag)
+        for worker in workers:
+            worker.join()
+
+    def _monitor_main(self) -> None:
+        while not self._stopping.wait(self._interval):
+            with self._lock:
+                self._rescale()
+
+    def _rescale(self) -> None:
+        self._prune_exited()
+        self._drain_latencies()
+        cpu_share = self._cpu_share_since_last_check()
+        active = len(self._workers) - self._retiring
+        if active < self._min_workers:
+            self._log(f"Autoscaler: only {active} {self._kind.value} workers left running, restarting "
+                      f"{self._min_workers - active}.")
+            self._add_workers(self._min_workers - active)
+            active = self._min_workers
+        depth = self._work_queue.qsize()
+        if depth == 0:
+            self._idle_streak += 1
+            if self._idle_streak >= self._idle_checks and active > self._min_workers:
+                self._work_queue.put(self._exit_flag)
+                self._retiring += 1
+                self._idle_streak = 0
+                self._log(f"Autoscaler: queue idle for {self._idle_checks} checks, retiring one of {active} "
+                          f"{self._kind.value} workers.")
+            return
+        self._idle_streak = 0
+        if self._average_latency is None or active >= self._max_workers:
+            return
+
+        # Workers needed to drain the current queue within the target wait, assuming items keep their recent cost
+        expected_drain = depth * self._average_latency / active
+        if expected_drain <= self._target_wait:
+            return
+        desired = min(self._max_workers, ceil(depth * self._average_latency / self._target_wait))
+        if desired > active and self._kind == WorkerKind.THREAD and cpu_share >= _GIL_BOUND_CPU_SHARE:
+            if not self._held_by_gil:
+                self._log(f"Autoscaler: {depth} queued would take {expected_drain:.1f}s to drain, but the process is "
+                          f"already using {cpu_share:.0%} of a core, so more threads would only wait for the GIL. "
+                          f"Staying at {active}; scale CPU bound work as processes instead.")
+            self._held_by_gil = True
+            return
+        self._held_by_gil = False
+        if desired > active:
+            self._log(f"Autoscaler: {depth} queued at {self._average_latency:.3f}s each would take "
+                      f"{expected_drain:.1f}s to drain, growing from {active} to {desired} {self._kind.value} workers.")
+            self._add_workers(desired - active)
+
+    def _cpu_share_since_last_check(self) -> float:
+        # CPU time of every thread in this process over the wall time since the last check, 1.0 being one full core
+        now = perf_counter(), process_time()
+        last, self._last_check = self._last_check, now
+        if last is None or now[0] <= last[0]:
+            return 0.0
+        return (now[1] - last[1]) / (now[0] - last[0])
+
+    def _add_workers(self, count: int) -> None:
+        for _ in range(count):
+            worker = self._start_worker()
+            self._workers.append(worker)
+
+    def _prune_exited(self) -> None:
+        still_alive = [worker for worker in self._workers if worker.is_alive()]
+        self._retiring = max(self._retiring - (len(self._workers) - len(still_alive)), 0)
+        self._workers = still_alive
+
+    def _drain_latencies(self) -> None:
+        while True:
+            try:
+                latency = self._latency_queue.get_nowait()
+            except Empty:
+                return
+            if self._average_latency is None:
+                self._average_latency = latency
+            else:
+                self._average_latency += _LATENCY_SMOOTHING * (latency - self._average_latency)
@@ -1,65 +1,92 @@
 from argparse import ArgumentParser
 from dataclasses import dataclass
-from datetime import datetime
 from enum import Enum
-from multiprocessing import current_process, Process
+from multiprocessing import Process
 from multiprocessing.connection import Listener, Connection, Client
 from random import shuffle
-from threading import get_ident, Thread
+from threading import Thread
 from typing import NoReturn
 
+from playground.parallel.chat_application.chat_history import HistorySettings
+from playground.parallel.chat_application.chat_rooms import run_chat_server
+from playground.parallel.chat_application.chat_shards import ROOM_PLACEMENT, SPREAD_PLACEMENT, run_sharded_chat_server
+from playground.parallel.event_log import flush, log, log_detail
+
+_AUTHKEY = b'secret password'
+
 
 class _Mode(Enum):
     SERVER = "server"
     CLIENT = "client"
 
 
+class _Engine(Enum):
+    THREADS = "threads"
+    ASYNCIO = "asyncio"
+
+
 @dataclass
 class _Arguments:
     mode: _Mode
     port: int
+    engine: _Engine
+    room_size: int
+    shard_count: int
+    placement: str
+    history: HistorySettings
+    duplex: bool
 
 
 def _main() -> NoReturn:
     arguments = _parse_arguments()
     if arguments.mode == _Mode.SERVER:
-        _run_chat_server(arguments.port)
+        _run_chat_server(arguments.port, arguments.engine, arguments.room_size, arguments.shard_count,
+                         arguments.placement, arguments.history)
     elif arguments.mode == _Mode.CLIENT:
-        _run_chat_client(arguments.port)
+        _run_chat_client(arguments.port, arguments.duplex)
     else:
         raise ValueError(f"Unknown mode {arguments.mode}")
 
 
-def _run_chat_server(port) -> NoReturn:
-    _print(f"Running chat server on port {port}.")
-    client_listener_process = Process(target=_client_listener, args=(port,))
+def _run_chat_server(port: int, engine: _Engine, room_size: int, shard_count: int, placement: str,
+                     history: HistorySettings) -> NoReturn:
+    log(f"Running chat server on port {port} with the {engine.value} engine.")
+    if engine == _Engine.THREADS:
+        client_listener_process = Process(target=_client_listener, args=(port,))
+    elif shard_count > 0:
+        client_listener_process = Process(
+            target=run_sharded_chat_server, args=(port, _AUTHKEY, room_size, shard_count, placement, history)
+        )
+    else:
+        client_listener_process = Process(target=run_chat_server, args=(port, _AUTHKEY, room_size, history))
     try:
         client_listener_process.start()
-        _print("Client listener running, press any key to stop.")
+        log("Client listener running, press any key to stop.")
+        flush()
         input()  # Wait for any key
     except KeyboardInterrupt:
         pass
     finally:
-        _print("Stopping listener...")
+        log("Stopping listener...")
         client_listener_process.terminate()
         client_listener_process.join()
-    _print("Stopped server.")
+    log("Stopped server.")
     exit()
 
 
 def _client_listener(port: int) -> None:
     address = ('localhost', port)
-    listener = Listener(address, authkey=b'secret password')
-    _print("Listening for clients...")
+    listener = Listener(address, authkey=_AUTHKEY)
+    log("Listening for clients...")
     chat_room_number: int = 0
     while True:
         chat_room_number += 1
-        _print(f"Waiting for chat client 1...")
+        log(f"Waiting for chat client 1...")
         p1_conn = listener.accept()
-        _print(f"Chat client 1 connected from {listener.last_accepted}")
-        _print(f"Waiting for chat client 2...")
+        log(f"Chat client 1 connected from {listener.last_accepted}")
+        log(f"Waiting for chat client 2...")
         p2_conn = listener.accept()
-        _print(f"Chat client 2 connected from {listener.last_accepted}")
+        log(f"Chat client 2 connected from {listener.last_accepted}")
         connection_thread = Thread(target=_client_handler, args=(p1_conn, p2_conn, chat_room_number))
         connection_thread.start()
 
@@ -72,7 +99,7 @@ def _client_handler(conn_a: Connection, conn_b: Connection, chat_room_number: in
         # Receive chat client names
         p1_name = p1_conn.recv()
         p2_name = p2_conn.recv()
-        _print(f"[Room {chat_room_number}] Chat room spun up between P1 '{p1_name}' and P2 '{p2_name}'")
+        log(f"[Room {chat_room_number}] Chat room spun up between P1 '{p1_name}' and P2 '{p2_name}'")
         # Send other chat client names
         p1_conn.send(p2_name)
         p2_conn.send(p1_name)
@@ -83,22 +110,22 @@ def _client_handler(conn_a: Connection, conn_b: Connection, chat_room_number: in
         # Start main chat loop
         while True:
             msg = p1_conn.recv()
-            _print(f"[Room {chat_room_number}] Forwarding from P1 to P2: '{msg}'")
+            log_detail("[Room %d] Forwarding from P1 to P2: '%s'", chat_room_number, msg)
             p2_conn.send(msg)
             msg = p2_conn.recv()
-            _print(f"[Room {chat_room_number}] Forwarding from P2 to P1: '{msg}'")
+            log_detail("[Room %d] Forwarding from P2 to P1: '%s'", chat_room_number, msg)
             p1_conn.send(msg)
     except (EOFError, ConnectionResetError):
-        _print(f"[Room {chat_room_number}] Closing connection (EOF).")
+        log(f"[Room {chat_room_number}] Closing connection (EOF).")
         p1_conn.close()
         p2_conn.close()
 
 
-def _run_chat_client(port) -> NoReturn:
+def _run_chat_client(port: int, duplex: bool) -> NoReturn:
     print("-" * 50)
     name = _input_client_name("| ")
     address = ('localhost', port)
-    conn = Client(address, authkey=b'secret password')
+    conn = Client(address, authkey=_AUTHKEY)
     print("| Connected to chat server.")
     print("| Waiting on another chat client...")
 
@@ -116,18 +143,21 @@ def _run_chat_client(port) -> NoReturn:
         def prepend_names(sender: str, msg: str) -> str:
             return f"| {sender.rjust(max(len(other_name), 2))}: {msg}"
 
-        if name == starting_name:
-            message = input(prepend_names("Me", ""))
-            conn.send(message)
-        while True:
-            message = conn.recv()
-            print(prepend_names(other_name, message))
-            message = input(prepend_names("Me", ""))
-            if not message:
-                break
-            conn.send(message)
+        if duplex:
+            _chat_duplex(conn, prepend_names, other_name)
+        else:
+            if name == starting_name:
+                message = input(prepend_names("Me", ""))
+                conn.send(message)
+            while True:
+                message = conn.recv()
+                print(prepend_names(other_name, message))
+                message = input(prepend_names("Me", ""))
+                if not message:
+                    break
+                conn.send(message)
         conn.close()
-    except (ConnectionResetError, EOFError):
+    except (ConnectionError, EOFError):
         print("| Other client left chat.")
     except KeyboardInterrupt:
         pass
@@ -138,6 +168,24 @@ def _run_chat_client(port) -> NoReturn:
     exit()
 
 
+def _chat_duplex(conn: Connection, prepend_names, other_name: str) -> None:
+    # Messages are printed as they arrive, while this thread keeps reading what to send
+    Thread(target=_print_received, args=(conn, prepend_names, other_name), daemon=True).start()
+    while True:
+        message = input(prepend_names("Me", ""))
+        if not message:
+            break
+        conn.send(message)
+
+
+def _print_received(conn: Connection, prepend_names, other_name: str) -> None:
+    try:
+        while True:
+            print(prepend_names(other_name, conn.recv()))
+    except (ConnectionResetError, EOFError, OSError):
+        print("| Chat closed, press enter to leave.")
+
+
 def _input_client_name(message_prefix: str = "") -> str:
     name = None
     while name is None:
@@ -148,18 +196,41 @@ def _input_client_name(message_prefix: str = "") -> str:
     return name
 
 
-def _print(msg: str) -> None:
-    proc_thread_id = f"{current_process().ident}::{get_ident()}".ljust(13)
-    print(f"~~> [{proc_thread_id} @ {datetime.utcnow()}] {msg}")
-
-
 def _parse_arguments() -> _Arguments:
     parser = ArgumentParser(description="Inter-Process Communication Example")
     parser.add_argument("mode", choices=["server", "client"], help="Run in client or server mode")
     parser.add_argument("-p", "--port", type=int, default=31337, help="Port to communicate on.")
+    parser.add_argument("-e", "--engine", choices=[engine.value for engine in _Engine], default=_Engine.THREADS.value,
+                        help="Server only: a thread per chat room, or one asyncio thread for all (default: threads)")
+    parser.add_argument("-r", "--room-size", type=int, default=2,
+                        help="Server only, asyncio engine: most clients in a room (default: 2)")
+    parser.add_argument("-s", "--shards", type=int, default=0,
+                        help="Server only, asyncio engine: spread rooms over this many processes (default: 0, run "
+                             "every room in the listener process)")
+    parser.add_argument("--placement", choices=[ROOM_PLACEMENT, SPREAD_PLACEMENT], default=ROOM_PLACEMENT,
+                        help="Server only, with shards: hand clients to their room's shard, or to each shard in turn "
+                             "(default: room)")
+    parser.add_argument("--history", type=int, default=0,
+                        help="Server only, asyncio engine: replay up to this many of a room's latest messages to "
+                             "clients joining it (default: 0, keep no history)")
+    parser.add_argument("--history-kib", type=int, default=64,
+                        help="Server only, with history: memory per room for it, in KiB (default: 64)")
+    parser.add_argument("--history-dir",
+                        help="Server only, with history: also append every message to a log file per room in this "
+                             "directory, replayed when the server is restarted")
+    parser.add_argument("-d", "--duplex", action="store_true",
+                        help="Client only: print messages as they arrive rather than taking turns")
     args = parser.parse_args()
-
-    return _Arguments(_Mode(args.mode), args.port)
+    if args.room_size < 2 or (args.room_size != 2 and args.engine != _Engine.ASYNCIO.value):
+        parser.error("rooms hold at least 2 clients, and only the asyncio engine has rooms of more than 2")
+    if args.shards < 0 or (args.shards > 0 and args.engine != _Engine.ASYNCIO.value):
+        parser.error("only the asyncio engine can be sharded")
+    if args.history < 0 or args.history_kib <= 0 or (args.history > 0 and args.engine != _Engine.ASYNCIO.value):
+        parser.error("only the asyncio engine keeps history, in at least 1 KiB per room")
+
+    history = HistorySettings(args.history, args.history_kib * 1024, args.history_dir)
+    return _Arguments(_Mode(args.mode), args.port, _Engine(args.engine), args.room_size, args.shards, args.placement,
+                      history, args.duplex)
 
 
 if __name__ == "__main__":
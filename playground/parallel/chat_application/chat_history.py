@@ -0,0 +1,139 @@
+"""
+Message history for the chat rooms of the asyncio engine, replayed to clients as they join.
+- Each room keeps its most recent messages in a 'RoomHistory': one preallocated bytearray holding the pickled frames
+  the room already makes to send them, used as a ring, and two int64 arrays of where each message is. Its memory is
+  fixed when the room opens; the oldest messages are dropped to make space for new ones.
+- Keeping a message copies its frame once, allocating nothing. Replay writes the stored frames as they are.
+- Optionally every message is also appended to a log file per room, in the same length prefixed framing as the wire. A
+  room reloads its log when it opens, so a restarted server replays what was said before. Writes go through the file's
+  buffer, flushed a second after the first unflushed one, so stopping the server loses at most the last second.
+"""
+import asyncio
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+_LENGTH = struct.Struct("!i")
+_LOG_FLUSH_SECONDS = 1.0
+
+
+class RoomHistory:
+    def __init__(self, capacity_bytes: int, max_messages: int, log_path: Optional[str] = None):
+        if capacity_bytes <= 0 or max_messages <= 0:
+            raise ValueError(f"History must hold at least 1 byte and 1 message, was {capacity_bytes} bytes and "
+                             f"{max_messages} messages")
+        self._capacity_bytes = capacity_bytes
+        self._max_messages = max_messages
+        self._data = bytearray(capacity_bytes)
+        self._offsets = array("q", bytes(8 * max_messages))
+        self._lengths = array("q", bytes(8 * max_messages))
+        self._first = 0  # Slot of the oldest message
+        self._count = 0
+        self._head = 0  # Where in '_data' the next message goes
+        self._stored_bytes = 0
+        self._log: Optional[BinaryIO] = None
+        self._flush_scheduled = False
+        if log_path is not None:
+            if os.path.exists(log_path):
+                self._load(log_path)
+            self._log = open(log_path, "ab")
+
+    @property
+    def max_messages(self) -> int:
+        return self._max_messages
+
+    @property
+    def message_count(self) -> int:
+        return self._count
+
+    @property
+    def stored_bytes(self) -> int:
+        return self._stored_bytes
+
+    @property
+    def memory_bytes(self) -> int:
+        # All of it allocated up front, whether or not it is in use yet
+        return sys.getsizeof(self._data) + sys.getsizeof(self._offsets) + sys.getsizeof(self._lengths)
+
+    def append(self, frame: bytes) -> None:
+        # On the forwarding path, so the checks and evictions are written out here rather than in helpers
+        length = len(frame)
+        if self._log is not None:
+            self._log.write(_LENGTH.pack(length) + frame)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                asyncio.get_running_loop().call_later(_LOG_FLUSH_SECONDS, self.flush)
+        capacity = self._capacity_bytes
+        if not 0 < length <= capacity:
+            return  # Too big to keep (it is still in the log), or empty, which a pickle never is
+        start = self._head
+        if start + length > capacity:
+            self._drop_from(start)  # The unused end of the buffer, holding the oldest messages
+            start = 0
+        end = start + length
+        offsets, lengths, max_messages = self._offsets, self._lengths, self._max_messages
+        first, count, stored = self._first, self._count, self._stored_bytes
+        # Messages just ahead of the head are the oldest, so only the oldest can be in the way
+        while count and (count == max_messages or (offsets[first] < end and offsets[first] + lengths[first] > start)):
+            stored -= lengths[first]
+            first = (first + 1) % max_messages
+            count -= 1
+        self._data[start:end] = frame
+        slot = (first + count) % max_messages
+        offsets[slot] = start
+        lengths[slot] = length
+        self._first, self._count, self._stored_bytes, self._head = first, count + 1, stored + length, end
+
+    def recent(self, count: int) -> List[bytes]:
+        # Oldest first
+        count = min(count, self._count)
+        slots = ((self._first + self._count - count + index) % self._max_messages for index in range(count))
+        return [bytes(self._data[self._offsets[slot]:self._offsets[slot] + self._lengths[slot]]) for slot in slots]
+
+    def flush(self) -> None:
+        self._flush_scheduled = False
+        if self._log is not None:
+            self._log.flush()
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _load(self, log_path: str) -> None:
+        with open(log_path, "r+b") as log_file:
+            while True:
+                complete = log_file.tell()
+                header = log_file.read(_LENGTH.size)
+                length = _LENGTH.unpack(header)[0] if len(header) == _LENGTH.size else -1
+                frame = log_file.read(length) if length >= 0 else b""
+                if length < 0 or len(frame) < length:
+                    log_file.truncate(complete)  # Cut short when the server stopped, so appending can carry on after it
+                    return
+                self.append(frame)
+
+    def _drop_from(self, start: int) -> None:
+        while self._count and self._offsets[self._first] >= start:
+            self._stored_bytes -= self._lengths[self._first]
+            self._first = (self._first + 1) % self._max_messages
+            self._count -= 1
+
+
+@dataclass(frozen=True)
+class HistorySettings:
+    replay_count: int = 0  # Messages replayed to each client joining a room; 0 keeps no history
+    capacity_bytes: int = 64 * 1024  # Per room
+    log_directory: Optional[str] = None
+
+    def history_for(self, room_number: int) -> Optional[RoomHistory]:
+        if self.replay_count <= 0:
+            return None
+        log_path = None
+        if self.log_directory is not None:
+            os.makedirs(self.log_directory, exist_ok=True)
+            log_path = os.path.join(self.log_directory, f"room-{room_number}.log")
+        return RoomHistory(self.capacity_bytes, self.replay_count, log_path)
+
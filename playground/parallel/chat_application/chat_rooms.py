@@ -0,0 +1,184 @@
+"""
+Chat rooms served from a single asyncio event loop thread, the 'asyncio' engine of 'chat_app.py'.
+- Clients are put in the newest room until it holds 'room_size' of them, then a new room is opened. Rooms start once a
+  second client has joined; later joiners (up to the room size) are added to the running room.
+- The name exchange is the same as with the threaded server: the client sends its name, and receives the name of the
+  other client (in larger rooms, the room's name) followed by the name of the client to start. That is always the
+  client's own name, as every member is read from all the time: anyone can send whenever they like, and it is passed on
+  to everyone else straight away.
+- A message is pickled once and written to every other member without waiting for their sockets. A member with more
+  than 'MAX_UNSENT_BYTES' still waiting to be sent is disconnected, rather than holding up the room.
+- In rooms of 2 messages are passed on as they are. In larger rooms they are prefixed with their sender's name, and
+  members hear who is in the room when they join, and when others join or leave. A room closes once fewer than 2
+  members are left in it.
+- Rooms can keep their latest messages (see 'chat_history.py'), which are replayed to each member after the name
+  exchange.
+"""
+import asyncio
+import pickle
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import AuthenticationError
+from typing import List, Optional, Protocol
+
+from playground.parallel.async_connection import accept
+from playground.parallel.chat_application.chat_history import HistorySettings, RoomHistory
+from playground.parallel.event_log import log, log_detail
+
+MAX_UNSENT_BYTES = 1024 * 1024
+LISTEN_BACKLOG = 1024  # Pending connections the OS queues for the listener, for many clients connecting at once
+_PAIR = 2
+
+
+class MemberConnection(Protocol):
+    # What a room needs of a member's connection; an 'AsyncConnection', or a stand-in for one in another process
+    @property
+    def unsent_bytes(self) -> int: ...
+
+    def write_bytes(self, payload: bytes) -> None: ...
+
+    def close_when_sent(self) -> None: ...
+
+    def abort(self) -> None: ...
+
+
+@dataclass(eq=False)
+class ChatMember:
+    name: str
+    connection: MemberConnection
+
+
+class ChatRoom:
+    def __init__(self, number: int, capacity: int, history: Optional[RoomHistory] = None):
+        self.number = number
+        self.capacity = capacity
+        self.history = history
+        self.closed = False
+        self._members: List[ChatMember] = []
+        self._started = False
+
+    @property
+    def is_open(self) -> bool:
+        return not self.closed and len(self._members) < self.capacity
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    def join(self, member: ChatMember) -> None:
+        self._members.append(member)
+        if self._started:
+            self._welcome(member)
+            self._send_to_others(member, f"* {member.name} joined the room")
+        elif len(self._members) >= _PAIR:
+            self._started = True
+            for waiting in self._members:
+                self._welcome(waiting)
+
+    def broadcast(self, sender: ChatMember, message: str) -> None:
+        frame = self._send_to_others(sender, message if self.capacity == _PAIR else f"{sender.name}: {message}")
+        if self.history is not None:
+            self.history.append(frame)
+
+    def close_history(self) -> None:
+        if self.history is not None:
+            log(f"[Room {self.number}] Kept {self.history.message_count} messages, {self.history.stored_bytes} bytes "
+                f"of the {self.history.memory_bytes} held for its history.")
+            self.history.close()
+
+    def leave(self, member: ChatMember) -> None:
+        if member not in self._members:
+            return
+        self._members.remove(member)
+        if not self._started or self.closed:
+            return
+        if len(self._members) >= _PAIR:
+            self._send_to_others(member, f"* {member.name} left the room")
+            return
+        log(f"[Room {self.number}] Closing room, {member.name} left.")
+        self.closed = True
+        for other in self._members:
+            other.connection.close_when_sent()
+        self._members.clear()
+        self.close_history()
+
+    def _welcome(self, member: ChatMember) -> None:
+        # The name exchange, written before anything from the room can be: the name the client shows next to everything
+        # it receives, then who starts (which is everyone)
+        if self.capacity == _PAIR:
+            introduction = next(other.name for other in self._members if other is not member)
+        else:
+            introduction = f"Room {self.number}"
+        member.connection.write_bytes(pickle.dumps(introduction))
+        member.connection.write_bytes(pickle.dumps(member.name))
+        if self.capacity != _PAIR:
+            member.connection.write_bytes(pickle.dumps(f"* In the room: {', '.join(m.name for m in self._members)}"))
+        if self.history is not None:
+            for frame in self.history.recent(self.history.max_messages):
+                member.connection.write_bytes(frame)
+
+    def _send_to_others(self, sender: ChatMember, message: str) -> bytes:
+        frame = pickle.dumps(message)
+        for member in list(self._members):
+            if member is sender:
+                continue
+            if member.connection.unsent_bytes > MAX_UNSENT_BYTES:
+                log(f"[Room {self.number}] Disconnecting {member.name}, who is not keeping up.")
+                member.connection.abort()
+                self.leave(member)
+            else:
+                member.connection.write_bytes(frame)
+        return frame
+
+
+class _RoomAssigner:
+    def __init__(self, room_size: int, history: HistorySettings):
+        self._room_size = room_size
+        self._history = history
+        self._room_count = 0
+        self._newest: Optional[ChatRoom] = None
+
+    def place(self, member: ChatMember) -> ChatRoom:
+        if self._newest is None or not self._newest.is_open:
+            self._room_count += 1
+            self._newest = ChatRoom(self._room_count, self._room_size, self._history.history_for(self._room_count))
+        self._newest.join(member)
+        return self._newest
+
+
+def run_chat_server(port: int, authkey: bytes, room_size: int, history: HistorySettings = HistorySettings()) -> None:
+    asyncio.run(_serve(port, authkey, room_size, history))
+
+
+async def _serve(port: int, authkey: bytes, room_size: int, history: HistorySettings) -> None:
+    rooms = _RoomAssigner(room_size, history)
+    server = await asyncio.start_server(
+        partial(_client_main, rooms, authkey), "localhost", port, backlog=LISTEN_BACKLOG
+    )
+    log(f"Listening for clients, in rooms of {room_size}...")
+    async with server:
+        await server.serve_forever()
+
+
+async def _client_main(rooms: _RoomAssigner, authkey: bytes, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+    try:
+        connection = await accept(reader, writer, authkey)
+        member = ChatMember(await connection.recv(), connection)
+    except (AuthenticationError, EOFError, OSError) as e:
+        log(f"Chat client from {writer.get_extra_info('peername')} refused: {e!r}")
+        writer.close()
+        return
+    room = rooms.place(member)
+    log(f"[Room {room.number}] {member.name} joined ({room.member_count} of {room.capacity}).")
+    try:
+        while not room.closed:
+            message = await connection.recv()
+            log_detail("[Room %d] Forwarding from %s: '%s'", room.number, member.name, message)
+            room.broadcast(member, message)
+    except (EOFError, ConnectionError):
+        pass
+    finally:
+        log(f"[Room {room.number}] {member.name} left.")
+        room.leave(member)
+        connection.close_when_sent()
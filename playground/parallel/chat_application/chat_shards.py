@@ -0,0 +1,279 @@
+"""
+Chat rooms spread over several processes, the 'asyncio' engine of 'chat_app.py' with '--shards'.
+- An acceptor process accepts connections on the chat port and hands each socket on, untouched, to one of K shard
+  processes ('multiprocessing.reduction.send_handle', or 'socket.share' on Windows). Clients are numbered in the order
+  they connect and put in rooms of 'room_size' in that order, so the acceptor already knows each client's room.
+- Each room lives on the shard its number hashes to, which holds its 'ChatRoom' and does its fan-out. With the 'room'
+  placement clients are handed to their room's shard. With 'spread' they are handed to the shards in turn, which
+  balances connections rather than rooms, and a shard then also serves members of rooms that live elsewhere.
+- Shards are connected to each other by socket pairs. A shard passes on what its members of a remote room send to the
+  room's shard, and gets back each of the room's messages once (not once per member) to write to those members.
+- Everything else (the name exchange, rooms starting and closing, slow members being disconnected) is as in
+  'chat_rooms.py'. Shards exit when the acceptor does.
+"""
+import asyncio
+import pickle
+import socket
+import sys
+from multiprocessing import AuthenticationError, get_context, reduction
+from multiprocessing.connection import Connection
+from threading import Thread
+from typing import Dict, List, Optional, Set, Tuple
+
+from playground.parallel.async_connection import AsyncConnection, accept
+from playground.parallel.chat_application.chat_history import HistorySettings
+from playground.parallel.chat_application.chat_rooms import ChatMember, ChatRoom, LISTEN_BACKLOG, MAX_UNSENT_BYTES
+from playground.parallel.event_log import log, log_detail
+
+ROOM_PLACEMENT = "room"
+SPREAD_PLACEMENT = "spread"
+# Messages between shards, each a tuple starting with one of these
+_JOIN = "join"  # (_JOIN, room number, member id, name)
+_SAY = "say"  # (_SAY, room number, member id, message)
+_LEAVE = "leave"  # (_LEAVE, room number, member id)
+_DELIVER = "deliver"  # (_DELIVER, member ids, pickled message), for the receiving shard to write to those members
+_CLOSE = "close"  # (_CLOSE, member id, whether to drop what is unsent)
+
+
+def home_shard(room_number: int, shard_count: int) -> int:
+    return hash(room_number) % shard_count
+
+
+def run_sharded_chat_server(port: int, authkey: bytes, room_size: int, shard_count: int,
+                            placement: str = ROOM_PLACEMENT, history: HistorySettings = HistorySettings()) -> None:
+    context = get_context("spawn")
+    pairs = {(a, b): socket.socketpair() for a in range(shard_count) for b in range(a + 1, shard_count)}
+    handoffs: List[Connection] = []
+    process_ids: List[int] = []
+    for index in range(shard_count):
+        links = {b: ends[0] for (a, b), ends in pairs.items() if a == index}
+        links.update({a: ends[1] for (a, b), ends in pairs.items() if b == index})
+        shard_end, acceptor_end = context.Pipe()  # Duplex, as handles can only be sent over a socket on POSIX
+        shard = context.Process(target=_shard_main, name=f"ChatShard-{index}", args=(
+            index, shard_count, room_size, history, authkey, shard_end, links
+        ))
+        shard.start()
+        shard_end.close()
+        handoffs.append(acceptor_end)
+        process_ids.append(shard.pid)
+    for ends in pairs.values():
+        for end in ends:
+            end.close()
+
+    with socket.create_server(("localhost", port), backlog=LISTEN_BACKLOG) as server:
+        log(f"Listening for clients, in rooms of {room_size} over {shard_count} shards ({placement} placement)...")
+        member_id = 0
+        while True:
+            client, _ = server.accept()
+            room_number = member_id // room_size + 1
+            shard = home_shard(room_number, shard_count) if placement == ROOM_PLACEMENT else member_id % shard_count
+            handoffs[shard].send((room_number, member_id))
+            _send_socket(handoffs[shard], client, process_ids[shard])
+            client.close()
+            member_id += 1
+
+
+def _send_socket(connection: Connection, sock: socket.socket, process_id: int) -> None:
+    if sys.platform == "win32":
+        connection.send_bytes(sock.share(process_id))
+    else:
+        reduction.send_handle(connection, sock.fileno(), process_id)
+
+
+def _receive_socket(connection: Connection) -> socket.socket:
+    if sys.platform == "win32":
+        return socket.fromshare(connection.recv_bytes())
+    return socket.socket(fileno=reduction.recv_handle(connection))
+
+
+class _ShardLink:
+    def __init__(self, connection: AsyncConnection):
+        self.connection = connection
+        self._frame: Optional[bytes] = None
+        self._member_ids: List[int] = []
+
+    def send(self, message: Tuple) -> None:
+        self._flush()  # Keeps deliveries and other messages in the order they were made
+        self.connection.write_bytes(pickle.dumps(message))
+
+    def deliver(self, member_id: int, frame: bytes) -> None:
+        # A room's fan-out calls this for each member on the other shard in turn, all with the same frame. Those are
+        # gathered into one message, sent once the fan-out is done.
+        if frame is not self._frame:
+            self._flush()
+            self._frame = frame
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._member_ids.append(member_id)
+
+    def _flush(self) -> None:
+        if self._frame is not None:
+            self.connection.write_bytes(pickle.dumps((_DELIVER, self._member_ids, self._frame)))
+            self._frame, self._member_ids = None, []
+
+
+class _RemoteConnection:
+    # Stands in for the connection of a member served by another shard, in a room that lives on this one
+    def __init__(self, link: _ShardLink, member_id: int):
+        self._link = link
+        self._member_id = member_id
+
+    @property
+    def unsent_bytes(self) -> int:
+        return 0  # The member's own shard looks after that
+
+    def write_bytes(self, payload: bytes) -> None:
+        self._link.deliver(self._member_id, payload)
+
+    def close_when_sent(self) -> None:
+        self._link.send((_CLOSE, self._member_id, False))
+
+    def abort(self) -> None:
+        self._link.send((_CLOSE, self._member_id, True))
+
+
+class _Shard:
+    def __init__(self, index: int, shard_count: int, room_size: int, history: HistorySettings, authkey: bytes):
+        self._index = index
+        self._shard_count = shard_count
+        self._room_size = room_size
+        self._history = history
+        self._authkey = authkey
+        self._links: Dict[int, _ShardLink] = {}
+        self._rooms: Dict[int, ChatRoom] = {}  # Rooms that live on this shard
+        self._remote_members: Dict[int, ChatMember] = {}  # Members of those rooms connected to other shards
+        self._connections: Dict[int, AsyncConnection] = {}  # Members connected to this shard
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self, handoff: Connection, links: Dict[int, socket.socket]) -> None:
+        loop = asyncio.get_running_loop()
+        for shard, sock in links.items():
+            link = _ShardLink(AsyncConnection(*await asyncio.open_connection(sock=sock)))
+            self._links[shard] = link
+            self._start(self._link_main(shard, link))
+        stopped = loop.create_future()
+        Thread(target=self._handoff_main, args=(handoff, loop, stopped), name="handoff", daemon=True).start()
+        await stopped
+        log(f"Shard {self._index} stopping, the acceptor has gone.")
+
+    def _handoff_main(self, handoff: Connection, loop: asyncio.AbstractEventLoop, stopped: asyncio.Future) -> None:
+        # Receiving a socket blocks, so it is done on a thread of its own and the socket passed on to the loop
+        try:
+            while True:
+                room_number, member_id = handoff.recv()
+                sock = _receive_socket(handoff)
+                loop.call_soon_threadsafe(self._start, self._client_main(room_number, member_id, sock))
+        except (EOFError, OSError):
+            loop.call_soon_threadsafe(stopped.set_result, None)
+
+    def _start(self, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)  # The loop only keeps weak references to tasks
+        task.add_done_callback(self._tasks.discard)
+
+    def _room(self, room_number: int) -> ChatRoom:
+        room = self._rooms.get(room_number)
+        if room is None:
+            room = ChatRoom(room_number, self._room_size, self._history.history_for(room_number))
+            self._rooms[room_number] = room
+        return room
+
+    def _leave(self, room: ChatRoom, member: ChatMember) -> None:
+        room.leave(member)
+        if room.closed or room.member_count == 0:
+            self._rooms.pop(room.number, None)
+            if not room.closed:
+                room.close_history()
+
+    async def _client_main(self, room_number: int, member_id: int, sock: socket.socket) -> None:
+        reader, writer = await asyncio.open_connection(sock=sock)
+        try:
+            connection = await accept(reader, writer, self._authkey)
+            name = await connection.recv()
+        except (AuthenticationError, EOFError, OSError) as e:
+            log(f"Chat client from {writer.get_extra_info('peername')} refused: {e!r}")
+            writer.close()
+            return
+        home = home_shard(room_number, self._shard_count)
+        log(f"[Room {room_number}] {name} joined on shard {self._index} (the room is on shard {home}).")
+        self._connections[member_id] = connection
+        member = ChatMember(name, connection)
+        link = self._links.get(home)
+        room = self._room(room_number) if link is None else None
+        try:
+            if room is not None:
+                room.join(member)
+                while not room.closed:
+                    message = await connection.recv()
+                    log_detail("[Room %d] Forwarding from %s: '%s'", room_number, name, message)
+                    room.broadcast(member, message)
+            else:
+                link.send((_JOIN, room_number, member_id, name))
+                while True:
+                    message = await connection.recv()
+                    link.send((_SAY, room_number, member_id, message))
+                    if link.connection.unsent_bytes > MAX_UNSENT_BYTES:
+                        await link.connection.drain()  # The room's shard is behind; stop reading until it catches up
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            log(f"[Room {room_number}] {name} left.")
+            del self._connections[member_id]
+            if room is not None:
+                self._leave(room, member)
+            else:
+                link.send((_LEAVE, room_number, member_id))
+            connection.close_when_sent()
+
+    async def _link_main(self, shard: int, link: _ShardLink) -> None:
+        try:
+            while True:
+                message = await link.connection.recv()
+                kind = message[0]
+                if kind == _DELIVER:
+                    _, member_ids, frame = message
+                    for member_id in member_ids:
+                        self._write(member_id, frame)
+                elif kind == _SAY:
+                    _, room_number, member_id, text = message
+                    member = self._remote_members.get(member_id)
+                    room = self._rooms.get(room_number)
+                    if member is not None and room is not None:
+                        log_detail("[Room %d] Forwarding from %s: '%s'", room_number, member.name, text)
+                        room.broadcast(member, text)
+                elif kind == _JOIN:
+                    _, room_number, member_id, name = message
+                    member = ChatMember(name, _RemoteConnection(link, member_id))
+                    self._remote_members[member_id] = member
+                    self._room(room_number).join(member)
+                elif kind == _LEAVE:
+                    _, room_number, member_id = message
+                    member = self._remote_members.pop(member_id, None)
+                    room = self._rooms.get(room_number)
+                    if member is not None and room is not None:
+                        self._leave(room, member)
+                elif kind == _CLOSE:
+                    _, member_id, drop_unsent = message
+                    connection = self._connections.get(member_id)
+                    if connection is None:
+                        pass  # Already gone
+                    elif drop_unsent:
+                        connection.abort()
+                    else:
+                        connection.close_when_sent()
+        except (EOFError, ConnectionError):
+            log(f"Shard {self._index} lost its link to shard {shard}.")
+
+    def _write(self, member_id: int, frame: bytes) -> None:
+        connection = self._connections.get(member_id)
+        if connection is None:
+            return  # Left while the message was on its way
+        if connection.unsent_bytes > MAX_UNSENT_BYTES:
+            log(f"Disconnecting member {member_id}, who is not keeping up.")
+            connection.abort()
+        else:
+            connection.write_bytes(frame)
+
+
+def _shard_main(index: int, shard_count: int, room_size: int, history: HistorySettings, authkey: bytes,
+                handoff: Connection, links: Dict[int, socket.socket]) -> None:
+    asyncio.run(_Shard(index, shard_count, room_size, history, authkey).run(handoff, links))
@@ -0,0 +1,217 @@
+"""
+Stress test for the asyncio engine of 'chat_app.py', run in one process or sharded over more and more.
+- For each shard count asked for (0 being the unsharded server), starts a server on a free port, then 'client
+  processes' processes which connect a share of the simulated clients each. Once every client is in its room, each
+  sends its messages 'interval' apart, starting at a random offset so that they do not all send at once.
+- Every message carries the 'time.monotonic_ns' it was sent at (a clock all processes of a machine share), so the
+  clients receiving it can tell how long it took to be delivered. The latencies include the time the client processes
+  take to get around to reading, so keep them from being the bottleneck.
+- Prints the messages sent and copies delivered per second, and the delivery latency, for each shard count.
+"""
+import asyncio
+import os
+import pickle
+import socket
+from argparse import ArgumentParser
+from array import array
+from dataclasses import dataclass
+from multiprocessing import get_context
+from multiprocessing.synchronize import Event
+from queue import Queue
+from random import random
+from time import monotonic_ns
+from typing import List, Sequence, Tuple
+
+from playground.parallel.async_connection import AsyncConnection, connect
+from playground.parallel.chat_application.chat_history import HistorySettings
+from playground.parallel.chat_application.chat_rooms import run_chat_server
+from playground.parallel.chat_application.chat_shards import ROOM_PLACEMENT, SPREAD_PLACEMENT, run_sharded_chat_server
+
+_AUTHKEY = b'secret password'
+_READY = "ready"
+_CONCURRENT_HANDSHAKES = 100
+_CONNECT_ATTEMPTS = 300  # 0.1 s apart; the server may still be starting up
+_RESULT_TIMEOUT = 300
+_NOTICE_PREFIX = "* "
+_NANOSECONDS_PER_MILLISECOND = 1_000_000
+
+
+@dataclass(frozen=True)
+class _Settings:
+    client_count: int
+    room_size: int
+    message_count: int
+    interval: float
+    client_processes: int
+    placement: str
+    history: HistorySettings
+
+
+@dataclass(frozen=True)
+class _Report:
+    sent: int
+    latencies: bytes  # array("q") of nanoseconds
+    last_delivery_ns: int
+
+
+def _main():
+    parser = ArgumentParser(description="Measures the asyncio chat server's throughput and latency as shards are added")
+    parser.add_argument("-c", "--clients", type=int, default=1000, help="simulated clients (default: 1000)")
+    parser.add_argument("-r", "--room-size", type=int, default=10, help="clients per room (default: 10)")
+    parser.add_argument("-m", "--messages", type=int, default=20, help="messages each client sends (default: 20)")
+    parser.add_argument("-i", "--interval", type=float, default=100,
+                        help="ms between each client's messages (default: 100)")
+    parser.add_argument("-s", "--shards", default="0,1,2,4",
+                        help="comma separated shard counts to try, 0 for unsharded (default: 0,1,2,4)")
+    parser.add_argument("--placement", choices=[ROOM_PLACEMENT, SPREAD_PLACEMENT], default=ROOM_PLACEMENT,
+                        help="how the sharded server hands clients to shards (default: room)")
+    parser.add_argument("-p", "--client-processes", type=int, default=max(2, (os.cpu_count() or 1) // 2),
+                        help="processes to run the clients in (default: half the cores, at least 2)")
+    parser.add_argument("--history", type=int, default=0,
+                        help="messages the server keeps per room to replay (default: 0, keep no history)")
+    parser.add_argument("--history-dir", help="directory for the server to also log every room's messages to")
+    args = parser.parse_args()
+    if args.clients % args.room_size != 0:
+        parser.error("clients must fill whole rooms")
+    settings = _Settings(args.clients, args.room_size, args.messages, args.interval / 1000, args.client_processes,
+                         args.placement, HistorySettings(args.history, log_directory=args.history_dir))
+
+    # The servers would otherwise log every client joining and leaving; processes started from here inherit this
+    os.environ["PARALLEL_VERBOSITY"] = "quiet"
+    print(f"{settings.client_count} clients in rooms of {settings.room_size}, each sending {settings.message_count} "
+          f"messages {args.interval:g} ms apart ({settings.placement} placement, history of {args.history})")
+    print(f"{'shards':>6}  {'sent/s':>9}  {'delivered/s':>11}  {'lost':>6}  "
+          f"{'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for shard_count in (int(count) for count in args.shards.split(",")):
+        _run(shard_count, settings)
+
+
+def _run(shard_count: int, settings: _Settings) -> None:
+    context = get_context("spawn")
+    port = _free_port()
+    if shard_count == 0:
+        server = context.Process(target=run_chat_server, args=(port, _AUTHKEY, settings.room_size, settings.history))
+    else:
+        server = context.Process(target=run_sharded_chat_server, args=(
+            port, _AUTHKEY, settings.room_size, shard_count, settings.placement, settings.history
+        ))
+    server.start()
+    go = context.Event()
+    results = context.Queue()
+    shares = [len(range(index, settings.client_count, settings.client_processes))
+              for index in range(settings.client_processes)]
+    clients = [context.Process(target=_clients_main, args=(port, share, settings, go, results)) for share in shares]
+    try:
+        for process in clients:
+            process.start()
+        for _ in clients:
+            outcome = results.get(timeout=_RESULT_TIMEOUT)
+            if outcome != _READY:
+                raise RuntimeError(f"A client process failed to connect: {outcome}")
+        start_ns = monotonic_ns()
+        go.set()
+        reports: List[_Report] = [results.get(timeout=_RESULT_TIMEOUT) for _ in clients]
+        failures = [report for report in reports if not isinstance(report, _Report)]
+        if failures:
+            raise RuntimeError(f"A client process failed: {failures[0]}")
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    latencies = array("q")
+    for report in reports:
+        latencies.frombytes(report.latencies)
+    ordered = sorted(latencies)
+    expected = settings.client_count * settings.message_count * (settings.room_size - 1)
+    seconds = (max(report.last_delivery_ns for report in reports) - start_ns) / 1e9
+    sent = sum(report.sent for report in reports)
+    print(f"{shard_count:>6}  {sent / seconds:>9,.0f}  {len(ordered) / seconds:>11,.0f}  {expected - len(ordered):>6}  "
+          f"{_quantile(ordered, 0.5):>8.1f}  {_quantile(ordered, 0.99):>8.1f}  {_quantile(ordered, 1):>8.1f}")
+
+
+def _clients_main(port: int, client_count: int, settings: _Settings, go: Event, results: Queue) -> None:
+    try:
+        asyncio.run(_clients(port, client_count, settings, go, results))
+    except Exception as e:
+        results.put(repr(e))  # Rather than leave the test waiting for this process
+        raise
+
+
+async def _clients(port: int, client_count: int, settings: _Settings, go: Event, results: Queue) -> None:
+    handshakes = asyncio.Semaphore(_CONCURRENT_HANDSHAKES)
+    connections = await asyncio.gather(*[_join(port, handshakes) for _ in range(client_count)])
+    results.put(_READY)
+    await asyncio.get_running_loop().run_in_executor(None, go.wait)
+    started_ns = monotonic_ns()
+    expected = settings.message_count * (settings.room_size - 1)
+    outcomes = await asyncio.gather(*[_chat(connection, expected, started_ns, settings) for connection in connections])
+    latencies = array("q")
+    last_delivery_ns = 0
+    for received, last in outcomes:
+        latencies.extend(received)
+        last_delivery_ns = max(last_delivery_ns, last)
+    results.put(_Report(client_count * settings.message_count, latencies.tobytes(), last_delivery_ns))
+
+
+async def _join(port: int, handshakes: asyncio.Semaphore) -> AsyncConnection:
+    async with handshakes:
+        for attempt in range(_CONNECT_ATTEMPTS):
+            try:
+                connection = await connect(("localhost", port), _AUTHKEY)
+                break
+            except ConnectionRefusedError:
+                if attempt == _CONNECT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(0.1)
+        await connection.send(f"client{id(connection)}")
+        await connection.recv()  # The others' names
+        await connection.recv()  # Who starts
+        return connection
+
+
+async def _chat(connection: AsyncConnection, expected: int, started_ns: int, settings: _Settings) -> Tuple[array, int]:
+    latencies = array("q")
+    last_delivery_ns = 0
+
+    async def receive() -> None:
+        nonlocal last_delivery_ns
+        while len(latencies) < expected:
+            message: str = await connection.recv()
+            if message.startswith(_NOTICE_PREFIX):
+                continue
+            sent_ns = int(message.rsplit(" ", 1)[-1])
+            if sent_ns < started_ns:
+                continue  # Replayed from the room's history, from before this test
+            last_delivery_ns = monotonic_ns()
+            latencies.append(last_delivery_ns - sent_ns)
+
+    receiving = asyncio.create_task(receive())
+    await asyncio.sleep(random() * settings.interval)
+    for _ in range(settings.message_count):
+        connection.write_bytes(pickle.dumps(str(monotonic_ns())))
+        await asyncio.sleep(settings.interval)
+    try:
+        # Anything that has not arrived a few intervals after the last message is counted as lost
+        await asyncio.wait_for(receiving, timeout=max(5.0, 10 * settings.interval))
+    except (asyncio.TimeoutError, EOFError, ConnectionError):
+        pass
+    await connection.close()
+    return latencies, last_delivery_ns
+
+
+def _quantile(ordered: Sequence[int], quantile: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)] / _NANOSECONDS_PER_MILLISECOND
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+if __name__ == "__main__":
+    _main()
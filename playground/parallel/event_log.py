@@ -0,0 +1,186 @@
+"""
+Shared, non-blocking console logging for the parallel scripts.
+- 'log' and 'log_detail' only put the message, its arguments, a 'time.monotonic_ns' timestamp and the thread id on an
+  in-memory queue. The message is %-formatted with its arguments (as in the 'logging' module) and the timestamp turned
+  into a time of day by a single writer thread per process, which writes whatever has piled up in one batch.
+- Verbosity: 'log_detail' is for per-request progress, 'log' for everything else (results, errors, startup and
+  shutdown). Below a message's verbosity a call returns straight away, before anything is formatted or queued. The
+  default comes from the PARALLEL_VERBOSITY environment variable ('quiet', 'normal' or 'detailed', the default), which
+  child processes inherit; 'set_verbosity' changes it for the current process only.
+- Whatever is still queued is written when the process exits, and 'flush' waits for it to be written, e.g. before
+  printing a prompt that should appear after it.
+- The writer thread never dies of a record: arguments that can not be %-formatted are shown as they are, and once stdout
+  is closed (e.g. piped into 'head') records are dropped. 'flush' also stops waiting if the writer thread is gone.
+"""
+import os
+import sys
+from enum import IntEnum
+from multiprocessing.util import Finalize
+from queue import SimpleQueue
+from threading import Event, Lock, Thread, get_native_id
+from time import localtime, monotonic_ns, strftime, time_ns
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+_Record = Tuple[int, int, str, Tuple[Any, ...]]  # (monotonic ns, thread id, message, arguments)
+
+_VERBOSITY_VARIABLE = "PARALLEL_VERBOSITY"
+_MAX_BATCH = 1024
+_FLUSH_CHECK_SECONDS = 0.1
+
+
+class Verbosity(IntEnum):
+    QUIET = 0
+    NORMAL = 1
+    DETAILED = 2
+
+
+def _verbosity_from_environment() -> Verbosity:
+    raw = os.environ.get(_VERBOSITY_VARIABLE, Verbosity.DETAILED.name)
+    try:
+        return Verbosity[raw.strip().upper()]
+    except KeyError:
+        raise ValueError(f"{_VERBOSITY_VARIABLE} must be one of {[level.name.lower() for level in Verbosity]}, "
+                         f"was '{raw}'") from None
+
+
+# Kept as a plain int, comparing IntEnum members costs several times as much
+_verbosity = int(_verbosity_from_environment())
+_NORMAL = int(Verbosity.NORMAL)
+_DETAILED = int(Verbosity.DETAILED)
+_records: "SimpleQueue[Union[_Record, Event]]" = SimpleQueue()
+_writer_lock = Lock()
+_writer: Optional[Thread] = None
+_pid = os.getpid()
+# Added to a monotonic timestamp to get the wall clock time it was taken at
+_wall_clock_offset_ns = time_ns() - monotonic_ns()
+# Only used by the writer thread
+_thread_prefixes: Dict[int, str] = {}
+_last_centisecond = -1
+_last_time_of_day = ""
+_output_closed = False
+
+
+def set_verbosity(verbosity: Verbosity) -> None:
+    global _verbosity
+    _verbosity = int(verbosity)
+
+
+def is_enabled(verbosity: Verbosity) -> bool:
+    # For callers that would do expensive work just to produce a message
+    return _verbosity >= verbosity
+
+
+def log(message: str, *args: Any) -> None:
+    if _verbosity >= _NORMAL:
+        _enqueue(message, args)
+
+
+def log_detail(message: str, *args: Any) -> None:
+    if _verbosity >= _DETAILED:
+        _enqueue(message, args)
+
+
+def flush() -> None:
+    if _writer is None:
+        return
+    written = Event()
+    _records.put(written)
+    while not written.wait(_FLUSH_CHECK_SECONDS):
+        if not _writer.is_alive():
+            return  # Nothing is left to write it
+
+
+def _enqueue(message: str, args: Tuple[Any, ...]) -> None:
+    if _writer is None:
+        _start_writer()
+    _records.put((monotonic_ns(), get_native_id(), message, args))
+
+
+def _start_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = Thread(target=_writer_main, name="event-log-writer", daemon=True)
+            _writer.start()
+            # Runs at exit in the main process as well as in 'multiprocessing' children, after the finalizers with a
+            # priority such as shared memory cleanup
+            Finalize(None, flush, exitpriority=0)
+
+
+def _writer_main() -> None:
+    while True:
+        batch: List[_Record] = []
+        waiting: List[Event] = []
+        record = _records.get()
+        while True:
+            if isinstance(record, Event):
+                waiting.append(record)
+            else:
+                batch.append(record)
+            if len(batch) >= _MAX_BATCH or _records.empty():
+                break
+            record = _records.get()
+        try:
+            if batch and not _output_closed:
+                sys.stdout.write("".join([_format(record) for record in batch]))
+                sys.stdout.flush()
+        except (OSError, ValueError):
+            _close_output()
+        finally:
+            for written in waiting:
+                written.set()
+
+
+def _close_output() -> None:
+    # stdout was closed (or its pipe, e.g. by '| head'). Later records are dropped, but still taken off the queue so
+    # that 'flush' returns, and stdout is pointed at devnull so the interpreter does not fail flushing it at exit.
+    global _output_closed
+    _output_closed = True
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+    except (OSError, ValueError):
+        pass
+
+
+def _format(record: _Record) -> str:
+    global _last_centisecond, _last_time_of_day
+    timestamp_ns, thread_id, message, args = record
+    if args:
+        message = _apply_args(message, args)
+    # Records in a batch mostly share their time of day and thread, so both are only formatted when they change
+    centisecond = (timestamp_ns + _wall_clock_offset_ns) // 10_000_000
+    if centisecond != _last_centisecond:
+        seconds, fraction = divmod(centisecond, 100)
+        _last_centisecond, _last_time_of_day = centisecond, f"{strftime('%H:%M:%S', localtime(seconds))}.{fraction:02}"
+    prefix = _thread_prefixes.get(thread_id)
+    if prefix is None:
+        prefix = _thread_prefixes[thread_id] = f"{_pid}:{thread_id}".rjust(14)
+    return f"{prefix} @ {_last_time_of_day}  ||  {message}\n"
+
+
+def _apply_args(message: str, args: Tuple[Any, ...]) -> str:
+    # Called on the writer thread, which must not die of a bad record (an argument whose __str__ raises, ...)
+    try:
+        return message % args
+    except Exception:
+        pass
+    try:
+        return f"{message} {args!r}"
+    except Exception as e:
+        return f"{message} (arguments could not be formatted: {e!r})"
+
+
+def _reset_after_fork() -> None:
+    # A forked child inherits the queue but not the writer thread; it starts over with its own
+    global _records, _writer_lock, _writer, _pid
+    _records = SimpleQueue()
+    _writer_lock = Lock()
+    _writer = None
+    _pid = os.getpid()
+    _thread_prefixes.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -4,13 +4,82 @@ Fibonacci number calculator module.
 - A positive integer can be provided as a command line argument.
 - If no numeric argument is provided, a single numeric argument will be read from stdin.
 - In both of the above 2 cases, the corresponding fibonacci number will be calculated and printed to stdout.
+- The '--algorithm' option selects how the number is calculated (fast doubling by default).
+- 'fibonacci_range' and 'fibonacci_many' calculate many numbers in a single ascending sweep.
 """
-from sys import argv
+from argparse import ArgumentParser
+from enum import Enum
+from typing import Iterable, Iterator, Tuple
 
 
-def fibonacci(fibonacci_number: int) -> int:
+class FibonacciAlgorithm(Enum):
+    ITERATIVE = "iterative"
+    FAST_DOUBLING = "fast_doubling"
+    MATRIX = "matrix"
+
+
+# Up to this many numbers apart, stepping one number at a time (one big integer addition each) is cheaper than a fresh
+# fast doubling
+MAX_SEQUENTIAL_STEPS = 1000
+
+
+def fibonacci(fibonacci_number: int, algorithm: FibonacciAlgorithm = FibonacciAlgorithm.FAST_DOUBLING) -> int:
     if fibonacci_number <= 0:
         raise ValueError("Must provide an integer argument greater than 0.")
+    if algorithm == FibonacciAlgorithm.ITERATIVE:
+        return _fibonacci_iterative(fibonacci_number)
+    if algorithm == FibonacciAlgorithm.MATRIX:
+        return _fibonacci_matrix(fibonacci_number)
+    return fibonacci_pair(fibonacci_number)[0]
+
+
+def fibonacci_pair(fibonacci_number: int) -> Tuple[int, int]:
+    # Returns (F(n), F(n+1)) by fast doubling, walking the bits of n from the most significant down:
+    #   F(2k) = F(k) * (2F(k+1) - F(k))        F(2k+1) = F(k)^2 + F(k+1)^2
+    # O(log n) big integer multiplications instead of O(n) additions.
+    if fibonacci_number < 0:
+        raise ValueError("Must provide an integer argument of at least 0.")
+    current, following = 0, 1
+    for bit in bin(fibonacci_number)[2:]:
+        doubled = current * (2 * following - current)
+        doubled_following = current * current + following * following
+        if bit == "1":
+            current, following = doubled_following, doubled + doubled_following
+        else:
+            current, following = doubled, doubled_following
+    return current, following
+
+
+def fibonacci_range(start: int, stop: int) -> Iterator[int]:
+    # Yields F(start) ... F(stop - 1), like range(start, stop): one fast doubling to the start, then one addition each
+    if start <= 0:
+        raise ValueError("Must provide an integer argument greater than 0.")
+    current, following = fibonacci_pair(start)
+    for _ in range(start, stop):
+        yield current
+        current, following = following, current + following
+
+
+def fibonacci_many(fibonacci_numbers: Iterable[int]) -> Iterator[Tuple[int, int]]:
+    # Yields (n, F(n)) for every requested number in ascending order (duplicates included) in a single sweep. Only the
+    # current pair is held, so memory stays bounded however many numbers are requested; gaps too long to be worth
+    # stepping through are jumped with fast doubling instead.
+    ordered = sorted(fibonacci_numbers)
+    if ordered and ordered[0] <= 0:
+        raise ValueError("Must provide an integer argument greater than 0.")
+    position, current, following = 0, 0, 1
+    for fibonacci_number in ordered:
+        gap = fibonacci_number - position
+        if gap > MAX_SEQUENTIAL_STEPS:
+            current, following = fibonacci_pair(fibonacci_number)
+        else:
+            for _ in range(gap):
+                current, following = following, current + following
+        position = fibonacci_number
+        yield fibonacci_number, current
+
+
+def _fibonacci_iterative(fibonacci_number: int) -> int:
     last, curr = 1, 1
     index = 2
     while index < fibonacci_number:
@@ -19,17 +88,42 @@ def fibonacci(fibonacci_number: int) -> int:
     return curr
 
 
+def _fibonacci_matrix(fibonacci_number: int) -> int:
+    # [[1, 1], [1, 0]] ** n == [[F(n+1), F(n)], [F(n), F(n-1)]]; the matrix is symmetric, so three entries suffice
+    result = (1, 0, 1)  # Identity as (top left, off diagonal, bottom right)
+    base = (1, 1, 0)
+    exponent = fibonacci_number
+    while exponent:
+        if exponent & 1:
+            result = _multiply_symmetric(result, base)
+        base = _multiply_symmetric(base, base)
+        exponent >>= 1
+    return result[1]
+
+
+def _multiply_symmetric(left: Tuple[int, int, int], right: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    left_a, left_b, left_d = left
+    right_a, right_b, right_d = right
+    return (
+        left_a * right_a + left_b * right_b,
+        left_a * right_b + left_b * right_d,
+        left_b * right_b + left_d * right_d,
+    )
+
+
 def _main():
-    if len(argv) == 1:
-        fib_num_raw = input()
-    elif len(argv) == 2:
-        fib_num_raw = argv[1]
-    else:
-        raise ValueError(f"Exactly 1 integer argument must be provided, but {len(argv) - 1} were.")
+    parser = ArgumentParser(description="Calculates a Fibonacci number")
+    parser.add_argument("number", nargs="?", help="which Fibonacci number to calculate, read from stdin if omitted")
+    parser.add_argument("--algorithm", choices=[algorithm.value for algorithm in FibonacciAlgorithm],
+                        default=FibonacciAlgorithm.FAST_DOUBLING.value,
+                        help="how to calculate the number (default: fast_doubling)")
+    args = parser.parse_args()
+
+    fib_num_raw = args.number if args.number is not None else input()
     if not fib_num_raw.isnumeric():
         raise ValueError(f"Must provide an integer argument, was {fib_num_raw}.")
 
-    print(fibonacci(int(fib_num_raw)))
+    print(fibonacci(int(fib_num_raw), FibonacciAlgorithm(args.algorithm)))
 
 
 if __name__ == "__main__":
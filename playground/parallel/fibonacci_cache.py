@@ -0,0 +1,218 @@
+"""
+Memoization layer in front of the 'fibonacci' module.
+- Recent results are kept in memory, least recently used first out once their total size exceeds a byte budget.
+- An optional sqlite database keeps every result on disk, so several processes pointed at the same file share results.
+- Every entry holds the pair (F(n), F(n+1)), so a number near a cached one is continued from that pair rather than
+  calculated from scratch.
+- Hit and miss counters are kept in 'FibonacciCache.stats'.
+"""
+import sqlite3
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from os import getpid
+from pathlib import Path
+from sys import getsizeof
+from threading import Lock
+from typing import List, Optional, Tuple, Union
+
+from playground.parallel.fibonacci import MAX_SEQUENTIAL_STEPS, fibonacci_pair
+
+FibonacciPair = Tuple[int, int]
+
+# Jumping forward from a cached F(k) only beats calculating from scratch while the jump is small next to k (measured
+# crossover is around k / 5, this stays well clear of it)
+_MAX_JUMP_FRACTION = 8
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    seeded_misses: int = 0  # Misses that were continued from a nearby cached pair
+    evictions: int = 0
+
+
+class FibonacciCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, database_path: Optional[Union[str, Path]] = None):
+        if max_bytes < 0:
+            raise ValueError(f"Memory budget must not be negative, was {max_bytes}")
+        self._max_bytes = max_bytes
+        self._database_path = database_path
+        self._lock = Lock()
+        self._entries: "OrderedDict[int, FibonacciPair]" = OrderedDict()
+        self._sorted_numbers: List[int] = []
+        self._entry_bytes = 0
+        self._stats = CacheStats()
+        # sqlite connections must not cross a fork, so each process opens its own on first use
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return replace(self._stats)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._entry_bytes
+
+    def fibonacci(self, fibonacci_number: int) -> int:
+        if fibonacci_number <= 0:
+            raise ValueError("Must provide an integer argument greater than 0.")
+        return self.pair(fibonacci_number)[0]
+
+    def pair(self, fibonacci_number: int) -> FibonacciPair:
+        with self._lock:
+            cached = self._entries.get(fibonacci_number)
+            if cached is not None:
+                self._entries.move_to_end(fibonacci_number)
+                self._stats.memory_hits += 1
+                return cached
+            cached = self._load(fibonacci_number)
+            if cached is not None:
+                self._stats.disk_hits += 1
+                self._remember(fibonacci_number, cached)
+                return cached
+            seed = self._nearest_seed(fibonacci_number)
+            self._stats.misses += 1
+            if seed is not None:
+                self._stats.seeded_misses += 1
+
+        # Calculated outside the lock so other threads are not held up behind a large number
+        if seed is None:
+            calculated = fibonacci_pair(fibonacci_number)
+        else:
+            calculated = _continue_from(seed[0], seed[1], fibonacci_number)
+        with self._lock:
+            self._store(fibonacci_number, calculated)
+            self._remember(fibonacci_number, calculated)
+        return calculated
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sorted_numbers.clear()
+            self._entry_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._connection_pid == getpid():
+                self._connection.close()
+            self._connection = self._connection_pid = None
+
+    def _remember(self, fibonacci_number: int, pair: FibonacciPair) -> None:
+        if fibonacci_number in self._entries:  # Another thread calculated the same number meanwhile
+            self._entries.move_to_end(fibonacci_number)
+            return
+        size = _pair_bytes(pair)
+        if size > self._max_bytes:
+            return
+        self._entries[fibonacci_number] = pair
+        insort(self._sorted_numbers, fibonacci_number)
+        self._entry_bytes += size
+        while self._entry_bytes > self._max_bytes:
+            evicted_number, evicted_pair = self._entries.popitem(last=False)
+            del self._sorted_numbers[bisect_right(self._sorted_numbers, evicted_number) - 1]
+            self._entry_bytes -= _pair_bytes(evicted_pair)
+            self._stats.evictions += 1
+
+    def _nearest_seed(self, fibonacci_number: int) -> Optional[Tuple[int, FibonacciPair]]:
+        candidates: List[Tuple[int, FibonacciPair]] = []
+        position = bisect_right(self._sorted_numbers, fibonacci_number)
+        if position > 0:
+            below = self._sorted_numbers[position - 1]
+            candidates.append((below, self._entries[below]))
+        if position < len(self._sorted_numbers):
+            above = self._sorted_numbers[position]
+            candidates.append((above, self._entries[above]))
+        candidates.extend(self._load_neighbours(fibonacci_number))
+        usable = [(number, pair) for number, pair in candidates if _is_worth_seeding(number, fibonacci_number)]
+        if not usable:
+            return None
+        return min(usable, key=lambda candidate: abs(candidate[0] - fibonacci_number))
+
+    def _database(self) -> Optional[sqlite3.Connection]:
+        if self._database_path is None:
+            return None
+        if self._connection is None or self._connection_pid != getpid():
+            self._connection = sqlite3.connect(self._database_path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS fibonacci (number INTEGER PRIMARY KEY, value BLOB, following BLOB)"
+            )
+            self._connection.commit()
+            self._connection_pid = getpid()
+        return self._connection
+
+    def _load(self, fibonacci_number: int) -> Optional[FibonacciPair]:
+        database = self._database()
+        if database is None:
+            return None
+        row = database.execute(
+            "SELECT value, following FROM fibonacci WHERE number = ?", (fibonacci_number,)
+        ).fetchone()
+        return None if row is None else (_from_bytes(row[0]), _from_bytes(row[1]))
+
+    def _load_neighbours(self, fibonacci_number: int) -> List[Tuple[int, FibonacciPair]]:
+        database = self._database()
+        if database is None:
+            return []
+        neighbours = []
+        for query in (
+                "SELECT number, value, following FROM fibonacci WHERE number < ? ORDER BY number DESC LIMIT 1",
+                "SELECT number, value, following FROM fibonacci WHERE number > ? ORDER BY number LIMIT 1",
+        ):
+            row = database.execute(query, (fibonacci_number,)).fetchone()
+            if row is not None:
+                neighbours.append((row[0], (_from_bytes(row[1]), _from_bytes(row[2]))))
+        return neighbours
+
+    def _store(self, fibonacci_number: int, pair: FibonacciPair) -> None:
+        database = self._database()
+        if database is None:
+            return
+        database.execute(
+            "INSERT OR IGNORE INTO fibonacci (number, value, following) VALUES (?, ?, ?)",
+            (fibonacci_number, _to_bytes(pair[0]), _to_bytes(pair[1])),
+        )
+        database.commit()
+
+
+def _is_worth_seeding(seed_number: int, fibonacci_number: int) -> bool:
+    distance = fibonacci_number - seed_number
+    return -MAX_SEQUENTIAL_STEPS <= distance <= max(MAX_SEQUENTIAL_STEPS, seed_number // _MAX_JUMP_FRACTION)
+
+
+def _continue_from(seed_number: int, seed_pair: FibonacciPair, fibonacci_number: int) -> FibonacciPair:
+    current, following = seed_pair
+    distance = fibonacci_number - seed_number
+    if distance < 0:
+        # F(k-1) = F(k+1) - F(k)
+        for _ in range(-distance):
+            current, following = following - current, current
+        return current, following
+    if distance <= MAX_SEQUENTIAL_STEPS:
+        for _ in range(distance):
+            current, following = following, current + following
+        return current, following
+    # F(k+m) = F(k)F(m+1) + F(k-1)F(m) and F(k+m+1) = F(k+1)F(m+1) + F(k)F(m)
+    offset, offset_following = fibonacci_pair(distance)
+    previous = following - current
+    return (
+        current * offset_following + previous * offset,
+        following * offset_following + current * offset,
+    )
+
+
+def _pair_bytes(pair: FibonacciPair) -> int:
+    return getsizeof(pair[0]) + getsizeof(pair[1])
+
+
+def _to_bytes(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, "little")
+
+
+def _from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, "little")
@@ -3,67 +3,107 @@ Example of inter-process communication.
 - Message passing from a client process to a server process on a specified port.
 - Multiple clients can connect to the server simultaneously, as each are handled on a separate thread.
 - Server can be run by invoking `python inter_process_communication.py server`
+    - `--engine threads` (the default) handles each connection on its own thread, `--engine asyncio` handles all of
+      them on a single thread with an asyncio event loop. Both accept the same clients.
 - Clients can be run by invoking `python inter_process_communication.py client`
     - Once connected, client script will receive messages via stdin and forward to the server.
+    - With `--flush-interval`, messages are collected and sent in batches (see `message_batching.py`), which the server
+      reads and logs a batch at a time.
+- A load test can be run by invoking `python inter_process_communication.py load -c 1000 -m 100`
+    - Opens the given number of connections at once from a single asyncio thread, sends the given number of messages on
+      each, waits for the server to have read them all and reports messages/sec. `--batch` sends that many per frame.
 """
+import asyncio
 from argparse import ArgumentParser
 from dataclasses import dataclass
-from datetime import datetime
 from enum import Enum
-from multiprocessing import current_process, Process
+from multiprocessing import AuthenticationError, Process
 from multiprocessing.connection import Listener, Client, Connection
-from threading import get_ident, Thread
-from typing import NoReturn
+from threading import Thread
+from time import perf_counter
+from typing import Any, List, NoReturn
+
+from playground.parallel.async_connection import AsyncConnection, accept, connect
+from playground.parallel.event_log import flush, log, log_detail
+from playground.parallel.message_batching import BatchingSender, decode_frame, encode_batch
+
+_AUTHKEY = b'secret password'
+_BACKLOG = 128  # Pending connections the OS queues for the listener; a load test opens them all at once
 
 
 class _Mode(Enum):
     SERVER = "server"
     CLIENT = "client"
+    LOAD = "load"
+
+
+class _Engine(Enum):
+    THREADS = "threads"
+    ASYNCIO = "asyncio"
 
 
 @dataclass
 class _Arguments:
     mode: _Mode
     port: int
+    engine: _Engine
+    connection_count: int
+    message_count: int
+    flush_interval_ms: float
+    compact: bool
+    batch_size: int
 
 
 def _parse_arguments() -> _Arguments:
     parser = ArgumentParser(description="Inter-Process Communication Example")
-    parser.add_argument("mode", choices=["server", "client"], help="Run in client or server mode")
+    parser.add_argument("mode", choices=[mode.value for mode in _Mode], help="Run in client, server or load test mode")
     parser.add_argument("-p", "--port", type=int, default=31337, help="Port to communicate on.")
+    parser.add_argument("-e", "--engine", choices=[engine.value for engine in _Engine], default=_Engine.THREADS.value,
+                        help="Server only: a thread per connection, or one asyncio thread for all (default: threads)")
+    parser.add_argument("-c", "--connections", type=int, default=100, help="Load only: connections to open.")
+    parser.add_argument("-m", "--messages", type=int, default=1000, help="Load only: messages per connection.")
+    parser.add_argument("-f", "--flush-interval", type=float, default=0,
+                        help="Client only: ms to collect messages for before sending them as one batch (default: 0, "
+                             "send each on its own).")
+    parser.add_argument("--compact", action="store_true", help="Client only: send batches as text rather than pickled.")
+    parser.add_argument("-b", "--batch", type=int, default=1,
+                        help="Load only: messages per frame, sent as compact batches when over 1 (default: 1).")
     args = parser.parse_args()
 
-    return _Arguments(_Mode(args.mode), args.port)
+    return _Arguments(_Mode(args.mode), args.port, _Engine(args.engine), args.connections, args.messages,
+                      args.flush_interval, args.compact, args.batch)
 
 
-def _print_prefixed(message: str) -> None:
-    print(f"~~> [{current_process().ident}::{get_ident()}@{datetime.utcnow()}] {message}")
-
-
-def _server_main(port: int) -> NoReturn:
-    _print_prefixed(f"Running in SERVER mode on port {port}")
-    listener_process = Process(target=_server_listener, args=(port,))
+def _server_main(port: int, engine: _Engine) -> NoReturn:
+    log(f"Running in SERVER mode on port {port} with the {engine.value} engine")
+    listener = _server_listener if engine == _Engine.THREADS else _async_server_listener
+    listener_process = Process(target=listener, args=(port,))
     try:
         listener_process.start()
-        _print_prefixed("Listener running, press any key to stop.")
+        log("Listener running, press any key to stop.")
+        flush()
         input()  # Wait for any key
     except KeyboardInterrupt:
         pass
     finally:
-        _print_prefixed("Stopping listener...")
+        log("Stopping listener...")
         listener_process.terminate()
         listener_process.join()
-    _print_prefixed("Stopped server.")
+    log("Stopped server.")
     exit()
 
 
 def _server_listener(port: int) -> None:
     address = ("localhost", port)
-    listener = Listener(address, authkey=b'secret password')
+    listener = Listener(address, backlog=_BACKLOG, authkey=_AUTHKEY)
     while True:
-        _print_prefixed("Listening for connections...")
-        conn = listener.accept()
-        _print_prefixed(f"Connection accepted from {listener.last_accepted}")
+        log("Listening for connections...")
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, ConnectionResetError) as e:
+            log(f"Connection refused: {e!r}")
+            continue
+        log(f"Connection accepted from {listener.last_accepted}")
         connection_thread = Thread(target=_connection_handler, args=(conn,))
         connection_thread.start()
 
@@ -71,38 +111,125 @@ def _server_listener(port: int) -> None:
 def _connection_handler(conn: Connection) -> None:
     try:
         while True:
-            msg = conn.recv()
-            _print_prefixed(f"Connection received '{msg}'")
-    except EOFError:
-        _print_prefixed("Closing connection (EOF).")
+            _log_received(decode_frame(conn.recv_bytes()))
+    except (EOFError, ConnectionResetError):
+        log("Closing connection (EOF).")
         conn.close()
 
 
-def _client_main(port: int) -> NoReturn:
-    _print_prefixed(f"Running in SERVER mode on port {port}")
+def _log_received(messages: List[Any]) -> None:
+    # A batch gets a single line rather than one per message
+    if len(messages) == 1:
+        log_detail("Connection received '%s'", messages[0])
+    else:
+        log_detail("Connection received %d messages: %s", len(messages), messages)
+
+
+def _async_server_listener(port: int) -> None:
+    asyncio.run(_async_serve(port))
+
+
+async def _async_serve(port: int) -> None:
+    server = await asyncio.start_server(_async_connection_handler, "localhost", port, backlog=_BACKLOG)
+    log("Listening for connections...")
+    async with server:
+        await server.serve_forever()
+
+
+async def _async_connection_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        conn = await accept(reader, writer, _AUTHKEY)
+    except (AuthenticationError, EOFError, OSError) as e:
+        log(f"Connection from {writer.get_extra_info('peername')} refused: {e!r}")
+        return
+    log(f"Connection accepted from {conn.peer}")
+    try:
+        while True:
+            _log_received(decode_frame(await conn.recv_bytes()))
+    except (EOFError, ConnectionResetError):
+        log("Closing connection (EOF).")
+        await conn.close()
+
+
+def _client_main(port: int, flush_interval_ms: float, compact: bool) -> NoReturn:
+    log(f"Running in SERVER mode on port {port}")
     address = ('localhost', port)
-    _print_prefixed(f"Connecting to server...")
-    conn = Client(address, authkey=b'secret password')
-    _print_prefixed(f"Connection established.")
+    log(f"Connecting to server...")
+    conn = Client(address, authkey=_AUTHKEY)
+    log(f"Connection established.")
+    sender = BatchingSender(conn, flush_interval_ms / 1000, compact=compact) if flush_interval_ms > 0 else None
     while True:
+        flush()
         message = input("Enter to send message (blank to exit): ")
         if not message:
             break
-        _print_prefixed(f"Sending message '{message}'.")
-        conn.send(message)
-    _print_prefixed(f"Closing connection.")
+        log(f"Sending message '{message}'.")
+        if sender is None:
+            conn.send(message)
+        else:
+            sender.send(message)
+    log(f"Closing connection.")
+    if sender is not None:
+        sender.close()
     conn.close()
-    _print_prefixed(f"Stopping client.")
+    log(f"Stopping client.")
     exit()
 
 
+def _load_main(port: int, connection_count: int, message_count: int, batch_size: int) -> NoReturn:
+    log(f"Running in LOAD mode on port {port}")
+    asyncio.run(_load(("localhost", port), connection_count, message_count, batch_size))
+    log(f"Stopping load test.")
+    exit()
+
+
+async def _load(address, connection_count: int, message_count: int, batch_size: int) -> None:
+    log(f"Opening {connection_count} connections...")
+    start = perf_counter()
+    # Past the listener's backlog the OS drops connections it has no room for, and a slow server then stalls the client
+    handshakes = asyncio.Semaphore(_BACKLOG)
+
+    async def open_connection() -> AsyncConnection:
+        async with handshakes:
+            return await connect(address, _AUTHKEY)
+
+    connections = await asyncio.gather(*[open_connection() for _ in range(connection_count)])
+    connected = perf_counter()
+    log(f"Connected in {connected - start:.2f}s, sending {message_count} messages on each...")
+    await asyncio.gather(*[
+        _send_load(conn, index, message_count, batch_size) for index, conn in enumerate(connections)
+    ])
+    elapsed = perf_counter() - connected
+    total = connection_count * message_count
+    log(f"Server read {total} messages in {elapsed:.2f}s: {total / elapsed:,.0f} messages/sec")
+
+
+async def _send_load(conn: AsyncConnection, index: int, message_count: int, batch_size: int) -> None:
+    messages = [f"Load message {number} from connection {index}" for number in range(message_count)]
+    if batch_size > 1:
+        for start in range(0, message_count, batch_size):
+            await conn.send_bytes(encode_batch(messages[start:start + batch_size]))
+    else:
+        for message in messages:
+            await conn.send(message)
+    # The server closes its end once it has read everything up to our EOF, so waiting for that times its reading too
+    conn.write_eof()
+    try:
+        await conn.recv_bytes()
+    except (EOFError, ConnectionResetError):
+        pass
+    await conn.close()
+
+
 def _main() -> NoReturn:
     arguments = _parse_arguments()
-    _print_prefixed(f"{arguments}")
+    log(f"{arguments}")
     if arguments.mode == _Mode.SERVER:
-        _server_main(arguments.port)
+        _server_main(arguments.port, arguments.engine)
     elif arguments.mode == _Mode.CLIENT:
-        _client_main(arguments.port)
+        _client_main(arguments.port, arguments.flush_interval_ms, arguments.compact)
+    elif arguments.mode == _Mode.LOAD:
+        _load_main(arguments.port, arguments.connection_count, arguments.message_count, arguments.batch_size)
     else:
         raise ValueError(f"Unknown mode {arguments.mode}")
 
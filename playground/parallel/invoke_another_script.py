@@ -4,9 +4,12 @@ Simple example of invoking another script or command via the subprocess module.
 - Invoking a script with an argument passed to stdin using submodule.run()
 - Invoking a script with a command line argument using Popen
 - Invoking a script with an argument passed to stdin using Popen
+Repeated calls can instead go to a pool of interpreters that are already running, see 'warm_runner.py'.
 """
 from subprocess import run, PIPE, STDOUT, Popen
 
+from playground.parallel.warm_runner import WarmRunner
+
 
 def _main():
     print("--- Invoke fibonacci.py with a command line argument using submodule.run()")
@@ -29,6 +32,12 @@ def _main():
     stdout, _ = Popen(["python", "fibonacci.py"], text=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT).communicate(input="25")
     print(f"stdout: {stdout}")
 
+    print("--- Invoke fibonacci.py with a command line argument using an already running interpreter")
+    print('> stdout = runner.run(["python", "fibonacci.py", "25"]).stdout')
+    with WarmRunner(1) as runner:
+        stdout = runner.run(["python", "fibonacci.py", "25"]).stdout
+    print(f"stdout: {stdout}")
+
 
 if __name__ == "__main__":
     _main()
@@ -0,0 +1,241 @@
+"""
+Batched sending of text messages over a 'multiprocessing.connection' Connection.
+- 'BatchingSender.send' only buffers a message. The buffer is sent as one frame once it holds 'max_bytes' of text, or
+  once its oldest message has waited 'flush_interval' seconds (checked by a background thread), whichever comes first.
+  That costs a single pickle (or encode) and a single write per frame, instead of per message.
+- Frames are either a pickled 'MessageBatch', or with 'compact' a 'C' followed by the messages in UTF-8, one per line.
+  Both ends of that are a single call into C ('str.join' and 'encode', 'decode' and 'str.split'), with nothing to
+  unpickle. A batch with a line break inside one of its messages is pickled instead.
+- 'decode_frame' turns any frame received with 'recv_bytes' back into its messages, including plain 'Connection.send'
+  messages, so a receiver can serve batching and non-batching senders alike.
+- Running this module benchmarks throughput and latency of unbatched against batched sending on a local socket.
+"""
+import pickle
+import socket
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Connection, Listener
+from threading import Condition, Thread
+from time import monotonic, monotonic_ns, perf_counter, sleep
+from typing import Any, List, Optional, Sequence, Tuple
+
+_COMPACT_MARKER = b"C"  # Pickles start with the PROTO opcode (0x80), so this can not be mistaken for one
+_COMPACT_SEPARATOR = "\n"
+_AUTHKEY = b"secret password"
+_NANOSECONDS_PER_MILLISECOND = 1_000_000
+
+
+@dataclass(frozen=True)
+class MessageBatch:
+    messages: Tuple[str, ...]
+
+
+def encode_batch(messages: Sequence[str], compact: bool = True) -> bytes:
+    if compact:
+        joined = _COMPACT_SEPARATOR.join(messages)
+        if joined.count(_COMPACT_SEPARATOR) == len(messages) - 1:
+            return _COMPACT_MARKER + joined.encode()
+    return pickle.dumps(MessageBatch(tuple(messages)))
+
+
+def decode_frame(frame: bytes) -> List[Any]:
+    if frame[:1] == _COMPACT_MARKER:
+        return str(memoryview(frame)[1:], "utf-8").split(_COMPACT_SEPARATOR)
+    message = pickle.loads(frame)  # Only unpickle frames from authenticated connections, as with 'Connection.recv'
+    return list(message.messages) if isinstance(message, MessageBatch) else [message]
+
+
+class BatchingSender:
+    def __init__(self, connection: Connection, flush_interval: float = 0.005, max_bytes: int = 64 * 1024,
+                 compact: bool = True):
+        if flush_interval < 0 or max_bytes <= 0:
+            raise ValueError(f"Need a flush interval of at least 0 and a positive batch size, "
+                             f"were {flush_interval} and {max_bytes}")
+        self._connection = connection
+        _disable_nagle(connection)
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._compact = compact
+        self._condition = Condition()
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._oldest = 0.0
+        self._frames_sent = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._flusher = Thread(target=self._flush_main, name="batch-flusher", daemon=True)
+        self._flusher.start()
+
+    @property
+    def frames_sent(self) -> int:
+        return self._frames_sent
+
+    def __enter__(self) -> "BatchingSender":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def send(self, message: str) -> None:
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError("Sender is closed")
+            if not self._pending:
+                self._oldest = monotonic()
+                self._condition.notify()  # Starts the flusher's clock
+            self._pending.append(message)
+            self._pending_bytes += len(message)
+            if self._pending_bytes >= self._max_bytes:
+                self._send_pending()
+
+    def flush(self) -> None:
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            self._send_pending()
+
+    def close(self) -> None:
+        # Sends what is still buffered; the connection itself is left to the caller
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._flusher.join()
+        if self._error is not None:
+            raise self._error
+        self._send_pending()
+
+    def _flush_main(self) -> None:
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                remaining = self._oldest + self._flush_interval - monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                try:
+                    self._send_pending()
+                except OSError as e:
+                    self._error = e  # Raised from the next 'send', on the producer's thread
+                    return
+
+    def _send_pending(self) -> None:
+        # Called with the condition held, which also keeps frames from interleaving on the connection
+        if not self._pending:
+            return
+        frame = encode_batch(self._pending, self._compact)
+        self._pending, self._pending_bytes = [], 0
+        self._connection.send_bytes(frame)
+        self._frames_sent += 1
+
+
+def _disable_nagle(connection: Connection) -> None:
+    # The sender batches by itself. The kernel holding small frames back until the last one is acknowledged (which the
+    # receiver may delay for up to 40 ms) only adds to that.
+    try:
+        wrapped = socket.socket(fileno=connection.fileno())
+    except OSError:
+        return  # A pipe rather than a socket
+    try:
+        if wrapped.family in (socket.AF_INET, socket.AF_INET6):
+            wrapped.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    finally:
+        wrapped.detach()  # The connection still owns the socket
+
+
+@dataclass(frozen=True)
+class _Approach:
+    name: str
+    batched: bool
+    compact: bool = False
+
+
+_APPROACHES = (
+    _Approach("unbatched", False),
+    _Approach("batched, pickle", True),
+    _Approach("batched, compact", True, True),
+)
+
+
+def _produce(address: Tuple[str, int], approach: _Approach, message_count: int, message_size: int, rate: float,
+             flush_interval: float, max_bytes: int) -> None:
+    # Each message starts with the 'time.monotonic_ns' it was sent at. That clock is shared by all processes of a
+    # machine (on Windows, Linux and macOS alike), so the receiver can tell how long each one took to arrive.
+    padding = "x" * message_size
+    connection = Client(address, authkey=_AUTHKEY)
+    sender = BatchingSender(connection, flush_interval, max_bytes, approach.compact) if approach.batched else None
+    start = perf_counter()
+    for number in range(message_count):
+        if rate > 0:
+            ahead = start + number / rate - perf_counter()
+            if ahead > 0.001:
+                sleep(ahead)
+        message = f"{monotonic_ns()} {padding}"
+        if sender is None:
+            connection.send(message)
+        else:
+            sender.send(message)
+    if sender is not None:
+        sender.close()
+    connection.close()
+
+
+def _receive(connection: Connection) -> Tuple[int, int, float, List[int]]:
+    # Reads until the producer hangs up; returns message and frame counts, seconds taken and latencies in ns
+    latencies: List[int] = []
+    frame_count = 0
+    start: Optional[float] = None
+    try:
+        while True:
+            frame = connection.recv_bytes()
+            start = start or perf_counter()
+            received = monotonic_ns()
+            frame_count += 1
+            latencies.extend([received - int(message[:message.index(" ")]) for message in decode_frame(frame)])
+    except EOFError:
+        pass
+    return len(latencies), frame_count, perf_counter() - (start or perf_counter()), latencies
+
+
+def _quantile(ordered: List[int], quantile: float) -> float:
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)] / _NANOSECONDS_PER_MILLISECOND
+
+
+def _main():
+    parser = ArgumentParser(description="Benchmarks unbatched against batched sending over a local connection")
+    parser.add_argument("-n", "--messages", type=int, default=100_000, help="messages per approach (default: 100000)")
+    parser.add_argument("-s", "--size", type=int, default=32, help="characters of padding per message (default: 32)")
+    parser.add_argument("-r", "--rate", type=float, default=0,
+                        help="messages per second to send at, 0 for as fast as possible (default: 0)")
+    parser.add_argument("-f", "--flush-interval", type=float, default=5, help="batch flush interval in ms (default: 5)")
+    parser.add_argument("-b", "--max-bytes", type=int, default=64 * 1024, help="batch size in bytes (default: 65536)")
+    args = parser.parse_args()
+
+    context = get_context("spawn")
+    with Listener(("localhost", 0), authkey=_AUTHKEY) as listener:
+        print(f"{args.messages} messages of {args.size} characters at "
+              f"{f'{args.rate:,.0f}/s' if args.rate > 0 else 'full speed'}, flushed after {args.flush_interval} ms")
+        print(f"{'approach':>16}  {'frames':>7}  {'messages/s':>10}  {'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+        for approach in _APPROACHES:
+            producer = context.Process(target=_produce, args=(
+                listener.address, approach, args.messages, args.size, args.rate, args.flush_interval / 1000,
+                args.max_bytes
+            ))
+            producer.start()
+            with listener.accept() as connection:
+                message_count, frame_count, elapsed, latencies = _receive(connection)
+            producer.join()
+            latencies.sort()
+            print(f"{approach.name:>16}  {frame_count:>7}  {message_count / elapsed:>10,.0f}  "
+                  f"{_quantile(latencies, 0.5):>8.2f}  {_quantile(latencies, 0.99):>8.2f}  "
+                  f"{_quantile(latencies, 1):>8.2f}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,95 +1,380 @@
-from datetime import datetime
-from typing import Union
-from multiprocessing import current_process, Process, Queue
+from argparse import ArgumentParser
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from queue import Empty, Queue as LocalQueue
+from signal import SIGINT, SIG_IGN, signal
+from tempfile import gettempdir
+from threading import BoundedSemaphore, Event, Thread
+from typing import List, Optional, Union
+from multiprocessing import current_process, get_context, Process, Queue
+from multiprocessing.util import Finalize
 
-from playground.parallel.fibonacci import fibonacci
+from playground.parallel.autoscaler import Autoscaler, WorkerKind, parse_autoscale
+from playground.parallel.event_log import Verbosity, flush, is_enabled, log, log_detail
+from playground.parallel.fibonacci_cache import FibonacciCache
+from playground.parallel.shared_results import SharedResult, SharedResultWriter, describe_result, take_result
+from playground.parallel.worker_metrics import (
+    MetricsExport, MetricsRing, TaskTiming, TimedWork, export_metrics, parse_metrics_command,
+)
+from playground.parallel.worker_requests import calculate, parse_work_request
 
-WorkData = Union[int, str]
-ResultData = str
+WorkData = Union[TimedWork, str]
+# Failures in pool mode come back as a plain message instead. In hand managed mode the main process also sends
+# 'MetricsExport' requests this way, since the result process is the one keeping the metrics.
+ResultData = Union[SharedResult, TaskTiming, MetricsExport]
 _EXIT_FLAG = "__EXIT__"
+# Pool and autoscaled workers are started while the main thread waits in input(). A forked child closes its copy of
+# stdin on startup, which needs the stdin lock that the waiting main thread holds, so it would hang forever. Spawned
+# children start fresh, as on Windows where spawn is the only option.
+_PROCESS_CONTEXT = get_context("spawn")
+# Each worker process keeps its own in-memory cache, this file is what they share
+_CACHE_DATABASE = Path(gettempdir()) / "playground_fibonacci_cache.sqlite3"
+# Per pool worker process, set by _initialize_pool_worker
+_pool_cache: Optional[FibonacciCache] = None
+_pool_writer: Optional[SharedResultWriter] = None
+
+
+class _ResultOrder(Enum):
+    COMPLETION = "completion"
+    SUBMISSION = "submission"
+
+
+@dataclass
+class _Arguments:
+    pool: bool
+    worker_count: Optional[str]
+    min_workers: Optional[int]
+    max_workers: Optional[int]
+    max_pending: Optional[int]
+    chunk_size: int
+    order: _ResultOrder
+
+
+def _parse_arguments() -> _Arguments:
+    parser = ArgumentParser(description="Process based Fibonacci workers")
+    parser.add_argument("--pool", action="store_true",
+                        help="run the workers in a ProcessPoolExecutor instead of hand managed processes")
+    parser.add_argument("-w", "--workers", required=False,
+                        help="number of worker processes, or 'auto' to scale them with the load (asked for on startup "
+                             "if omitted)")
+    parser.add_argument("--min-workers", type=int, required=False,
+                        help="(auto) fewest worker processes to keep running (default: 1)")
+    parser.add_argument("--max-workers", type=int, required=False,
+                        help="(auto) most worker processes to scale up to (default: number of cores)")
+    parser.add_argument("--max-pending", type=int, required=False,
+                        help="(pool) most chunks in the pool at once, input waits while the pool is this far behind "
+                             "(default: 2 per worker)")
+    parser.add_argument("--chunk-size", type=int, default=1,
+                        help="(pool) most waiting requests sent to a worker together (default: 1)")
+    parser.add_argument("--order", choices=[order.value for order in _ResultOrder],
+                        default=_ResultOrder.COMPLETION.value,
+                        help="(pool) print results as they complete, or in the order they were entered")
+    args = parser.parse_args()
+    if args.chunk_size <= 0 or (args.max_pending is not None and args.max_pending <= 0):
+        parser.error("--chunk-size and --max-pending must be at least 1")
+
+    return _Arguments(
+        args.pool, args.workers, args.min_workers, args.max_workers, args.max_pending, args.chunk_size,
+        _ResultOrder(args.order)
+    )
 
 
 # noinspection DuplicatedCode
 def _main():
-    work_queue: Queue[WorkData] = Queue()
-    answer_queue: Queue[ResultData] = Queue()
-    worker_process_count = int(input("How many worker processes? "))
-    if worker_process_count <= 0:
+    args = _parse_arguments()
+    worker_process_count_raw = args.worker_count
+    if worker_process_count_raw is None:
+        worker_process_count_raw = input("How many worker processes? (a number, or 'auto' to scale with the load, "
+                                         "optionally between bounds as in 'auto 2..8') ")
+    worker_bounds = parse_autoscale(worker_process_count_raw)
+    worker_process_count = 0 if worker_bounds is not None else int(worker_process_count_raw)
+    if worker_bounds is None and worker_process_count <= 0:
         raise ValueError("Must have at least 1 worker process.")
+    if args.pool:
+        if worker_bounds is not None:
+            raise ValueError("The pool mode needs a fixed number of worker processes.")
+        max_pending = args.max_pending if args.max_pending is not None else 2 * worker_process_count
+        _pool_main(worker_process_count, max_pending, args.chunk_size, args.order)
+        return
 
-    _print_prefixed("Spinning up worker and result processes...")
-    worker_processes = [
-        Process(target=_worker_process_main, args=(work_queue, answer_queue))
-        for _ in range(worker_process_count)
-    ]
-    result_process = Process(target=_result_process_main, args=(answer_queue,))
+    work_queue: Queue[WorkData] = _PROCESS_CONTEXT.Queue()
+    answer_queue: Queue[ResultData] = _PROCESS_CONTEXT.Queue()
+    latency_queue: Optional[Queue[float]] = _PROCESS_CONTEXT.Queue() if worker_bounds is not None else None
 
-    for worker_process in worker_processes:
+    def start_worker_process() -> Process:
+        worker_process = _PROCESS_CONTEXT.Process(
+            target=_worker_process_main, args=(work_queue, answer_queue, latency_queue)
+        )
         worker_process.start()
+        return worker_process
+
+    autoscaler: Optional[Autoscaler] = None
+    if worker_bounds is not None:
+        # Bounds given with 'auto' take precedence over the options; checked here, before any process is started
+        min_workers = worker_bounds.min_workers if worker_bounds.min_workers is not None else args.min_workers
+        max_workers = worker_bounds.max_workers if worker_bounds.max_workers is not None else args.max_workers
+        autoscaler = Autoscaler(WorkerKind.PROCESS, start_worker_process, work_queue, latency_queue, _EXIT_FLAG,
+                                log, min_workers, max_workers)
+
+    log("Spinning up worker and result processes...")
+    result_process = _PROCESS_CONTEXT.Process(target=_result_process_main, args=(answer_queue,))
     result_process.start()
-    _print_prefixed("Processes ready.")
+    worker_processes: List[Process] = []
+    if autoscaler is not None:
+        autoscaler.start()
+    else:
+        worker_processes = [start_worker_process() for _ in range(worker_process_count)]
+    log("Processes ready.")
 
+    flush()
     print("Enter numbers and press enter. Repeat as long as desired. Requests will be enqueued for asynchronous "
-          "calculation. Answers will be printed once calculated. Enter 'exit' to quit.")
+          "calculation. Answers will be printed once calculated. Enter a range (e.g. '100..200') or several numbers "
+          "(e.g. '5, 8, 13') to calculate them together. Enter 'metrics' (or 'metrics <file>') for timings. Enter "
+          "'exit' to quit.")
     try:
         while True:
             user_input = input()
             if user_input == "exit":
                 break
-            if not user_input.isnumeric() or int(user_input) <= 0:
-                _print_prefixed(f"Skipping invalid input '{user_input}'")
+            metrics_export = parse_metrics_command(user_input)
+            if metrics_export is not None:
+                answer_queue.put_nowait(metrics_export)
                 continue
-            requested_number = int(user_input)
-            work_queue.put_nowait(requested_number)
+            try:
+                work_queue.put_nowait(TimedWork.now(parse_work_request(user_input)))
+            except ValueError:
+                log(f"Skipping invalid input '{user_input}'")
     except KeyboardInterrupt:
         pass
 
-    _print_prefixed("Finishing outstanding calculations and stopping all processes...")
+    log("Finishing outstanding calculations and stopping all processes...")
+    if autoscaler is not None:
+        autoscaler.stop()
     for _ in range(worker_process_count):
         work_queue.put_nowait(_EXIT_FLAG)
     for worker_process in worker_processes:
         worker_process.join()
     answer_queue.put_nowait(_EXIT_FLAG)
     result_process.join()
-    _print_prefixed("All processes re-joined, exiting.")
+    log("All processes re-joined, exiting.")
 
 
 # noinspection DuplicatedCode
-def _worker_process_main(work_queue: Queue, answer_queue: Queue) -> None:
-    _print_prefixed("Worker process initialized.")
+def _worker_process_main(work_queue: Queue, answer_queue: Queue, latency_queue: Optional[Queue] = None) -> None:
+    log_detail("Worker process initialized.")
+    cache = FibonacciCache(database_path=_CACHE_DATABASE)
+    writer = SharedResultWriter()
     while True:
         try:
             work = work_queue.get()
             if isinstance(work, str):
                 if work == _EXIT_FLAG:
+                    log(f"Worker process exiting. Cache: {cache.stats}")
+                    cache.close()
+                    writer.close()
                     break
                 else:
-                    _print_prefixed(f"Unknown worker process command '{work}', skipping.")
+                    log(f"Unknown worker process command '{work}', skipping.")
                     continue
-            desired_fibonacci_number = work
-            _print_prefixed(f"Calculating Fibonacci({desired_fibonacci_number})... ({work_queue.qsize()} still in queue)")
-            start = datetime.now()
-            result = fibonacci(desired_fibonacci_number)
-            delta = datetime.now() - start
-            _print_prefixed(f"Done in {delta.total_seconds()} seconds.")
-            answer_queue.put_nowait(f"Fibonacci({desired_fibonacci_number}) is {result}")
+            queue_depth = work_queue.qsize()
+            timing = TaskTiming.taken(work, current_process().ident, queue_depth)
+            log_detail("Calculating Fibonacci(%s)... (%d still in queue)", work.request, queue_depth)
+            result_count = 0
+            for desired_fibonacci_number, result in calculate(work.request, cache.fibonacci):
+                answer_queue.put_nowait(writer.share(desired_fibonacci_number, result))
+                result_count += 1
+            answer_queue.put_nowait(timing.finish(result_count))
+            log_detail("Done in %s seconds.", timing.compute_seconds)
+            if latency_queue is not None:
+                latency_queue.put_nowait(timing.compute_seconds)
         except ValueError as e:
-            _print_prefixed(f"Failed! {e}")
+            log(f"Failed! {e}")
 
 
 def _result_process_main(answer_queue: Queue) -> None:
-    _print_prefixed("Result process initialized.")
+    log_detail("Result process initialized.")
+    metrics = MetricsRing()
     while True:
         result = answer_queue.get()
         if result == _EXIT_FLAG:
             break
-        truncated, remaining = result[:80], result[80:]
-        output = truncated if not remaining else f"{truncated}... ({len(remaining)} more digits)"
-        _print_prefixed(output)
+        if isinstance(result, TaskTiming):
+            metrics.record(result)
+        elif isinstance(result, MetricsExport):
+            _export_metrics(metrics, result)
+        else:
+            _log_result(result)
+
+
+def _pool_main(worker_process_count: int, max_pending: int, chunk_size: int, order: _ResultOrder) -> None:
+    # The input loop feeds a bounded local queue, a dispatcher thread groups whatever is waiting there into chunks and
+    # submits them, and a printer thread prints the results. At most 'max_pending' chunks are in the pool at once; past
+    # that the dispatcher waits, the local queue fills up and the input loop blocks until the pool catches up.
+    submission_queue: LocalQueue[WorkData] = LocalQueue(maxsize=max_pending * chunk_size)
+    result_queue: LocalQueue[Union[Future, str]] = LocalQueue()
+    pending_slots = BoundedSemaphore(max_pending)
+    stopping = Event()
+    metrics = MetricsRing()
+
+    log(f"Spinning up a pool of {worker_process_count} worker processes...")
+    executor = ProcessPoolExecutor(worker_process_count, _PROCESS_CONTEXT, _initialize_pool_worker)
+    dispatcher_thread = Thread(target=_dispatcher_thread_main, args=(
+        executor, submission_queue, result_queue, pending_slots, max_pending, chunk_size, order, stopping
+    ))
+    printer_thread = Thread(target=_printer_thread_main, args=(result_queue, metrics))
+    dispatcher_thread.start()
+    printer_thread.start()
+    log("Pool ready.")
+
+    flush()
+    print("Enter numbers and press enter. Repeat as long as desired. Requests will be enqueued for asynchronous "
+          "calculation. Answers will be printed once calculated. Enter a range (e.g. '100..200') or several numbers "
+          "(e.g. '5, 8, 13') to calculate them together. Enter 'metrics' (or 'metrics <file>') for timings. Enter "
+          "'exit' to quit.")
+    try:
+        while True:
+            user_input = input()
+            if user_input == "exit":
+                break
+            metrics_export = parse_metrics_command(user_input)
+            if metrics_export is not None:
+                _export_metrics(metrics, metrics_export)
+                continue
+            try:
+                submission_queue.put(TimedWork.now(parse_work_request(user_input)))
+            except ValueError:
+                log(f"Skipping invalid input '{user_input}'")
+        log("Finishing outstanding calculations and stopping the pool...")
+    except (KeyboardInterrupt, EOFError):
+        # Requests that never reached a worker are dropped, the ones already running are finished and printed
+        log("Interrupted, cancelling queued calculations and finishing the running ones...")
+        stopping.set()
+        dropped_requests = 0
+        while True:
+            try:
+                submission_queue.get_nowait()
+                dropped_requests += 1
+            except Empty:
+                break
+        executor.shutdown(wait=False, cancel_futures=True)
+        if dropped_requests:
+            log(f"Dropped {dropped_requests} requests that had not been sent to the pool yet.")
+
+    submission_queue.put(_EXIT_FLAG)
+    dispatcher_thread.join()
+    printer_thread.join()
+    executor.shutdown()
+    log("Pool shut down, exiting.")
+
+
+def _dispatcher_thread_main(
+        executor: ProcessPoolExecutor, submission_queue: LocalQueue, result_queue: LocalQueue,
+        pending_slots: BoundedSemaphore, max_pending: int, chunk_size: int, order: _ResultOrder, stopping: Event
+) -> None:
+    def on_chunk_done(finished: Future) -> None:
+        if order == _ResultOrder.COMPLETION:
+            result_queue.put_nowait(finished)
+        pending_slots.release()
+
+    exiting = False
+    while not exiting:
+        work = submission_queue.get()
+        if work == _EXIT_FLAG:
+            break
+        # Only requests that are already waiting join the chunk, so a lone request is never held back to fill it
+        chunk: List[TimedWork] = [work]
+        while len(chunk) < chunk_size:
+            try:
+                work = submission_queue.get_nowait()
+            except Empty:
+                break
+            if work == _EXIT_FLAG:
+                exiting = True
+                break
+            chunk.append(work)
+
+        pending_slots.acquire()
+        if stopping.is_set():
+            pending_slots.release()
+            continue
+        try:
+            future = executor.submit(_calculate_chunk, chunk, submission_queue.qsize())
+        except RuntimeError:  # The pool was shut down by an interrupt while this chunk was waiting for a slot
+            pending_slots.release()
+            continue
+        if order == _ResultOrder.SUBMISSION:
+            result_queue.put_nowait(future)
+        future.add_done_callback(on_chunk_done)
+
+    # Holding every slot means every submitted chunk has finished (and been queued for printing)
+    for _ in range(max_pending):
+        pending_slots.acquire()
+    result_queue.put_nowait(_EXIT_FLAG)
+
+
+def _printer_thread_main(result_queue: LocalQueue, metrics: MetricsRing) -> None:
+    # Timings are received once their chunk is printed, so in submission order the transfer time includes waiting
+    # behind slower chunks entered earlier
+    cancelled_chunks = 0
+    while True:
+        future = result_queue.get()
+        if isinstance(future, str) and future == _EXIT_FLAG:
+            break
+        try:
+            results = future.result()
+        except CancelledError:
+            cancelled_chunks += 1
+            continue
+        except Exception as e:
+            log(f"Failed! {e}")
+            continue
+        for result in results:
+            if isinstance(result, SharedResult):
+                _log_result(result)
+            elif isinstance(result, TaskTiming):
+                metrics.record(result)
+            else:
+                log(result)
+    if cancelled_chunks:
+        log(f"{cancelled_chunks} queued chunks were cancelled before they started.")
+
+
+def _initialize_pool_worker() -> None:
+    global _pool_cache, _pool_writer
+    signal(SIGINT, SIG_IGN)  # Ctrl+C is handled by the main process, so running chunks are allowed to finish
+    _pool_cache = FibonacciCache(database_path=_CACHE_DATABASE)
+    _pool_writer = SharedResultWriter()
+    Finalize(_pool_writer, _pool_writer.close, exitpriority=10)
+
+
+def _calculate_chunk(chunk: List[TimedWork], queue_depth: int) -> List[Union[ResultData, str]]:
+    results: List[Union[ResultData, str]] = []
+    for work in chunk:
+        timing = TaskTiming.taken(work, current_process().ident, queue_depth)
+        result_count = 0
+        try:
+            for desired_fibonacci_number, result in calculate(work.request, _pool_cache.fibonacci):
+                results.append(_pool_writer.share(desired_fibonacci_number, result))
+                result_count += 1
+            results.append(timing.finish(result_count))
+        except ValueError as e:
+            results.append(f"Fibonacci({work.request}) failed! {e}")
+    return results
+
+
+def _export_metrics(metrics: MetricsRing, export: MetricsExport) -> None:
+    try:
+        log(export_metrics(metrics, export))
+    except OSError as e:
+        log(f"Could not export metrics: {e}")
 
 
-def _print_prefixed(message: str) -> None:
-    print(f"{str(current_process().ident).rjust(10)} @ {datetime.now().strftime('%H:%M:%S.%f')[:-4]}  ||  {message}")
+def _log_result(handle: SharedResult) -> None:
+    value = take_result(handle)  # Also when not logged, as it releases the shared memory
+    if is_enabled(Verbosity.NORMAL):
+        log(describe_result(handle.fibonacci_number, value))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Passing huge Fibonacci results between processes without converting or pickling them.
+- 'SharedResultWriter.share' writes the raw bytes of a result into a new shared memory block and returns a small
+  'SharedResult' handle, which is all that goes onto a queue.
+- 'take_result' rebuilds the number from the block on the consuming side and releases the block.
+- Each block holds a file descriptor until it is taken, so a writer keeps at most 'MAX_OPEN_BLOCKS' of them. Beyond that
+  (or when a block can not be created at all) the value travels inside the handle, pickled like any other result.
+- 'describe_result' produces the truncated one line summary the workers print. The leading digits and the digit count
+  are worked out from the binary value, so a million digit number is never converted to decimal in full (and Python's
+  limit on converting huge integers to strings never comes into play).
+"""
+import os
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_FLOOR, localcontext
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from time import monotonic, sleep
+from typing import List, Optional, Tuple
+
+# Every block starts with a flag byte the consumer sets once it has read the value. The writer keeps its blocks open
+# until then: on Windows a block is destroyed as soon as no process has it open, so closing right after writing could
+# free it before the consumer attaches.
+_HEADER_SIZE = 1
+MAX_OPEN_BLOCKS = 256  # Well below the usual limit of 1024 open files per process
+_TAKEN = 1
+_SUMMARY_LENGTH = 80
+# Numbers up to this many bits (about 3900 digits) are simply converted, below Python's default 4300 digit limit
+_EXACT_BIT_LIMIT = 13000
+_GUARD_DIGITS = 25
+
+
+@dataclass(frozen=True)
+class SharedResult:
+    fibonacci_number: int
+    block_name: str
+    byte_count: int
+    value: Optional[int] = None  # Set instead of a block when none could be used
+
+
+class SharedResultWriter:
+    def __init__(self):
+        self._open_blocks: List[SharedMemory] = []
+
+    def share(self, fibonacci_number: int, value: int) -> SharedResult:
+        self.close_taken()
+        byte_count = max((value.bit_length() + 7) // 8, 1)
+        if len(self._open_blocks) >= MAX_OPEN_BLOCKS:
+            return SharedResult(fibonacci_number, "", byte_count, value)  # The consumer is behind
+        try:
+            block = SharedMemory(create=True, size=_HEADER_SIZE + byte_count)
+        except OSError:
+            return SharedResult(fibonacci_number, "", byte_count, value)  # Out of file descriptors or shared memory
+        _set_tracked(block, False)
+        block.buf[0] = 0
+        block.buf[_HEADER_SIZE:_HEADER_SIZE + byte_count] = value.to_bytes(byte_count, "little")
+        self._open_blocks.append(block)
+        return SharedResult(fibonacci_number, block.name, byte_count)
+
+    def close_taken(self) -> None:
+        still_open = []
+        for block in self._open_blocks:
+            if block.buf[0] == _TAKEN:
+                block.close()
+            else:
+                still_open.append(block)
+        self._open_blocks = still_open
+
+    def close(self, timeout: float = 10) -> None:
+        # Gives the consumer a chance to take what is still outstanding, then frees whatever it never took
+        deadline = monotonic() + timeout
+        self.close_taken()
+        while self._open_blocks and monotonic() < deadline:
+            sleep(0.01)
+            self.close_taken()
+        for block in self._open_blocks:
+            block.close()
+            _set_tracked(block, True)  # unlink() untracks it again
+            block.unlink()
+        self._open_blocks = []
+
+
+def take_result(handle: SharedResult) -> int:
+    if handle.value is not None:
+        return handle.value
+    block = SharedMemory(name=handle.block_name)
+    try:
+        with block.buf[_HEADER_SIZE:_HEADER_SIZE + handle.byte_count] as payload:
+            value = int.from_bytes(payload, "little")
+        block.buf[0] = _TAKEN
+    finally:
+        block.close()
+    if os.name != "nt":
+        block.unlink()  # POSIX blocks outlive every handle until unlinked; on Windows the writer's close frees it
+    return value
+
+
+def _set_tracked(block: SharedMemory, tracked: bool) -> None:
+    # On POSIX each process may have its own resource tracker, which unlinks (and warns about) every block its process
+    # created and did not unlink itself when it exits. The consumer unlinks the blocks it takes, so the writer's tracker
+    # must not know about them. Windows has no tracking for shared memory.
+    if os.name == "nt":
+        return
+    if tracked:
+        resource_tracker.register(block._name, "shared_memory")
+    else:
+        resource_tracker.unregister(block._name, "shared_memory")
+
+
+def describe_result(fibonacci_number: int, value: int) -> str:
+    # Same output as formatting the whole result and keeping its first 80 characters
+    prefix = f"Fibonacci({fibonacci_number}) is "
+    visible_digits = max(_SUMMARY_LENGTH - len(prefix), 0)
+    leading, digit_count = leading_digits(value, visible_digits)
+    if digit_count <= visible_digits:
+        return f"{prefix}{leading}"
+    return f"{prefix}{leading}... ({digit_count - visible_digits} more digits)"
+
+
+def leading_digits(value: int, count: int) -> Tuple[str, int]:
+    # Returns the first 'count' decimal digits of a non-negative value together with its total number of digits
+    if value < 0:
+        raise ValueError(f"Value must not be negative, was {value}")
+    if count <= 0:
+        return "", leading_digits(value, 1)[1]
+    if value.bit_length() <= _EXACT_BIT_LIMIT:
+        digits = str(value)
+        return digits[:count], len(digits)
+
+    # value lies in [mantissa * 2^shift, (mantissa + 1) * 2^shift), so log10(value) lies between the logarithms of the
+    # two bounds. When both bounds (widened by a little slack for rounding) agree on the leading digits, so does value.
+    shift = value.bit_length() - 4 * (count + _GUARD_DIGITS)
+    mantissa = value >> shift
+    with localcontext() as context:
+        context.prec = count + _GUARD_DIGITS + len(str(shift))
+        shift_logarithm = shift * Decimal(2).log10()
+        slack = Decimal(10) ** -(count + _GUARD_DIGITS // 2)
+        lower = _split_logarithm(Decimal(mantissa).log10() + shift_logarithm - slack, count)
+        upper = _split_logarithm(Decimal(mantissa + 1).log10() + shift_logarithm + slack, count)
+    if lower == upper:
+        return lower
+    return _exact_leading_digits(value, count, lower[1])
+
+
+def _split_logarithm(logarithm: Decimal, count: int) -> Tuple[str, int]:
+    exponent = int(logarithm)
+    leading = (Decimal(10) ** (logarithm - exponent + count - 1)).to_integral_value(rounding=ROUND_FLOOR)
+    return str(int(leading)), exponent + 1
+
+
+def _exact_leading_digits(value: int, count: int, estimated_digit_count: int) -> Tuple[str, int]:
+    # Only reached when value sits right on a digit boundary (e.g. just below a power of ten), where the estimate could
+    # be off by one. Slower, but exact.
+    digit_count = estimated_digit_count
+    while value >= 10 ** digit_count:
+        digit_count += 1
+    while digit_count > 1 and value < 10 ** (digit_count - 1):
+        digit_count -= 1
+    return str(value // 10 ** (digit_count - count)), digit_count
@@ -1,12 +1,18 @@
-from datetime import datetime
 from queue import Queue
 from threading import Thread, get_ident
-from typing import Union
-
-from playground.parallel.fibonacci import fibonacci
-
-WorkData = Union[int, str]
-ResultData = str
+from typing import List, Optional, Tuple, Union
+
+from playground.parallel.autoscaler import Autoscaler, WorkerKind, parse_autoscale
+from playground.parallel.event_log import Verbosity, flush, is_enabled, log, log_detail
+from playground.parallel.fibonacci_cache import FibonacciCache
+from playground.parallel.shared_results import describe_result
+from playground.parallel.worker_metrics import (
+    MetricsRing, TaskTiming, TimedWork, export_metrics, parse_metrics_command,
+)
+from playground.parallel.worker_requests import calculate, parse_work_request
+
+WorkData = Union[TimedWork, str]
+ResultData = Union[Tuple[int, int], TaskTiming]  # (n, F(n)) is only summarised for printing by the result thread
 _EXIT_FLAG = "__EXIT__"
 
 
@@ -14,50 +20,77 @@ _EXIT_FLAG = "__EXIT__"
 def _main():
     work_queue: Queue[WorkData] = Queue()
     answer_queue: Queue[ResultData] = Queue()
-    worker_thread_count = int(input("How many worker threads? "))
-    if worker_thread_count <= 0:
+    cache = FibonacciCache()
+    metrics = MetricsRing()
+    worker_thread_count_raw = input("How many worker threads? (a number, or 'auto' to scale with the load, "
+                                    "optionally between bounds as in 'auto 2..16') ")
+    worker_bounds = parse_autoscale(worker_thread_count_raw)
+    worker_thread_count = 0 if worker_bounds is not None else int(worker_thread_count_raw)
+    if worker_bounds is None and worker_thread_count <= 0:
         raise ValueError("Must have at least 1 worker thread.")
+    latency_queue: Optional[Queue[float]] = Queue() if worker_bounds is not None else None
 
-    _print_prefixed("Spinning up worker and result threads...")
-    worker_threads = [
-        Thread(target=_worker_thread_main, args=(work_queue, answer_queue))
-        for _ in range(worker_thread_count)
-    ]
-    result_thread = Thread(target=_result_thread_main, args=(answer_queue,))
-
-    for worker_thread in worker_threads:
+    def start_worker_thread() -> Thread:
+        worker_thread = Thread(target=_worker_thread_main, args=(work_queue, answer_queue, cache, latency_queue))
         worker_thread.start()
-    result_thread.start()
-    _print_prefixed("Threads ready.")
+        return worker_thread
 
+    autoscaler: Optional[Autoscaler] = None
+    if worker_bounds is not None:
+        autoscaler = Autoscaler(WorkerKind.THREAD, start_worker_thread, work_queue, latency_queue, _EXIT_FLAG,
+                                log, worker_bounds.min_workers, worker_bounds.max_workers)
+
+    log("Spinning up worker and result threads...")
+    result_thread = Thread(target=_result_thread_main, args=(answer_queue, metrics))
+    result_thread.start()
+    worker_threads: List[Thread] = []
+    if autoscaler is not None:
+        autoscaler.start()
+    else:
+        worker_threads = [start_worker_thread() for _ in range(worker_thread_count)]
+    log("Threads ready.")
+
+    flush()
     print("Enter numbers and press enter. Repeat as long as desired. Requests will be enqueued for asynchronous "
-          "calculation. Answers will be printed once calculated. Enter 'exit' to quit.")
+          "calculation. Answers will be printed once calculated. Enter a range (e.g. '100..200') or several numbers "
+          "(e.g. '5, 8, 13') to calculate them together. Enter 'metrics' (or 'metrics <file>') for timings. Enter "
+          "'exit' to quit.")
     try:
         while True:
             user_input = input()
             if user_input == "exit":
                 break
-            if not user_input.isnumeric() or int(user_input) <= 0:
-                _print_prefixed(f"Skipping invalid input '{user_input}'")
-                continue
-            requested_number = int(user_input)
-            work_queue.put_nowait(requested_number)
+            metrics_export = parse_metrics_command(user_input)
+            try:
+                if metrics_export is not None:
+                    log(export_metrics(metrics, metrics_export))
+                else:
+                    work_queue.put_nowait(TimedWork.now(parse_work_request(user_input)))
+            except ValueError:
+                log(f"Skipping invalid input '{user_input}'")
+            except OSError as e:
+                log(f"Could not export metrics: {e}")
     except KeyboardInterrupt:
         pass
 
-    _print_prefixed("Finishing outstanding calculations and stopping all threads...")
+    log("Finishing outstanding calculations and stopping all threads...")
+    if autoscaler is not None:
+        autoscaler.stop()
     for _ in range(worker_thread_count):
         work_queue.put_nowait(_EXIT_FLAG)
     for worker_thread in worker_threads:
         worker_thread.join()
     answer_queue.put_nowait(_EXIT_FLAG)
     result_thread.join()
-    _print_prefixed("All threads re-joined, exiting.")
+    log(f"All threads re-joined, exiting. Cache: {cache.stats}")
 
 
 # noinspection DuplicatedCode
-def _worker_thread_main(work_queue: Queue[WorkData], answer_queue: Queue[ResultData]) -> None:
-    _print_prefixed("Worker thread initialized.")
+def _worker_thread_main(
+        work_queue: Queue[WorkData], answer_queue: Queue[ResultData], cache: FibonacciCache,
+        latency_queue: Optional[Queue[float]] = None
+) -> None:
+    log_detail("Worker thread initialized.")
     while True:
         try:
             work = work_queue.get()
@@ -65,32 +98,33 @@ def _worker_thread_main(work_queue: Queue[WorkData], answer_queue: Queue[ResultD
                 if work == _EXIT_FLAG:
                     break
                 else:
-                    _print_prefixed(f"Unknown worker thread command '{work}', skipping.")
+                    log(f"Unknown worker thread command '{work}', skipping.")
                     continue
-            desired_fibonacci_number = work
-            _print_prefixed(f"Calculating Fibonacci({desired_fibonacci_number})... ({work_queue.qsize()} still in queue)")
-            start = datetime.now()
-            result = fibonacci(desired_fibonacci_number)
-            delta = datetime.now() - start
-            _print_prefixed(f"Done in {delta.total_seconds()} seconds.")
-            answer_queue.put_nowait(f"Fibonacci({desired_fibonacci_number}) is {result}")
+            queue_depth = work_queue.qsize()
+            timing = TaskTiming.taken(work, get_ident(), queue_depth)
+            log_detail("Calculating Fibonacci(%s)... (%d still in queue)", work.request, queue_depth)
+            result_count = 0
+            for desired_fibonacci_number, result in calculate(work.request, cache.fibonacci):
+                answer_queue.put_nowait((desired_fibonacci_number, result))
+                result_count += 1
+            answer_queue.put_nowait(timing.finish(result_count))
+            log_detail("Done in %s seconds.", timing.compute_seconds)
+            if latency_queue is not None:
+                latency_queue.put_nowait(timing.compute_seconds)
         except ValueError as e:
-            _print_prefixed(f"Failed! {e}")
+            log(f"Failed! {e}")
 
 
-def _result_thread_main(answer_queue: Queue[ResultData]) -> None:
-    _print_prefixed("Result thread initialized.")
+def _result_thread_main(answer_queue: Queue[ResultData], metrics: MetricsRing) -> None:
+    log_detail("Result thread initialized.")
     while True:
         result = answer_queue.get()
         if result == _EXIT_FLAG:
             break
-        truncated, remaining = result[:80], result[80:]
-        output = truncated if not remaining else f"{truncated}... ({len(remaining)} more digits)"
-        _print_prefixed(output)
-
-
-def _print_prefixed(message: str) -> None:
-    print(f"{str(get_ident()).rjust(10)} @ {datetime.now().strftime('%H:%M:%S.%f')[:-4]}  ||  {message}")
+        if isinstance(result, TaskTiming):
+            metrics.record(result)
+        elif is_enabled(Verbosity.NORMAL):
+            log(describe_result(*result))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+"""
+Runs Python scripts in a pool of already started interpreters instead of starting a new 'python' for every call.
+- 'WarmRunner.run' takes the same command as 'subprocess.run' (e.g. ["python", "fibonacci.py", "25"], or
+  ["python", "-m", "playground.parallel.fibonacci", "25"]) along with optional stdin text, and returns a
+  'subprocess.CompletedProcess' with the captured stdout and stderr.
+- Each worker process imports the 'preload' modules once on startup, then runs one script at a time as '__main__', with
+  'sys.argv', 'sys.stdin', 'sys.stdout' and 'sys.stderr' swapped in for the call. Scripts are compiled once per worker.
+  Modules a script imports stay imported for its next run; that is where most of the time is saved.
+- A script only suits the pool if it keeps to 'sys.stdin'/'sys.stdout' (their '.buffer' included) and leaves nothing
+  running when it returns.
+  Commands that do not have the shape above, interpreter options, scripts listed in 'cold' and scripts that killed their
+  worker (which is then replaced) are run with 'subprocess.run' instead.
+- Running this module benchmarks cold 'run' and 'Popen' calls against the warm pool.
+"""
+import importlib
+import io
+import os
+import runpy
+import sys
+import traceback
+import warnings
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from queue import Queue
+from statistics import median
+from subprocess import CompletedProcess, PIPE, STDOUT, Popen, run
+from threading import Lock
+from time import perf_counter
+from types import CodeType
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+_MODULE_FLAG = "-m"
+
+
+@dataclass(frozen=True)
+class _Job:
+    target: str  # Absolute script path, or a module name when 'is_module'
+    is_module: bool
+    args: Sequence[str]
+    input: str
+
+
+@dataclass(frozen=True)
+class _Outcome:
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+class WarmRunner:
+    def __init__(self, size: int = 2, preload: Iterable[str] = (), cold: Iterable[str] = ()):
+        if size <= 0:
+            raise ValueError(f"Must have at least 1 warm process, was {size}")
+        self._preload = tuple(preload)
+        self._cold: Set[str] = {_target_key(target) for target in cold}
+        self._context = get_context("spawn")  # The same on every platform, and no copied threads or locks
+        self._idle: Queue[Optional[Tuple[BaseProcess, Connection]]] = Queue()  # None once closed
+        self._lock = Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def __enter__(self) -> "WarmRunner":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def run(self, command: Sequence[str], input: Optional[str] = None) -> CompletedProcess:
+        with self._lock:
+            if self._closed:
+                raise ValueError("WarmRunner is closed")
+        job = self._parse_command(command, input or "")
+        if job is None:
+            return run(list(command), input=input, text=True, capture_output=True)
+
+        worker = self._idle.get()
+        if worker is None:
+            self._idle.put(None)  # For the next caller waiting
+            raise ValueError("WarmRunner is closed")
+        process, connection = worker
+        try:
+            connection.send(job)
+            outcome: _Outcome = connection.recv()
+        except (EOFError, OSError):
+            # The script took its interpreter down with it (os._exit, a crash, ...); it is not run warm again
+            with self._lock:
+                self._cold.add(job.target)
+            process.join()
+            with self._lock:
+                if not self._closed:
+                    self._idle.put(self._start_worker())
+            return run(list(command), input=input, text=True, capture_output=True)
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._idle.put((process, connection))
+        if closed:
+            _stop_worker(process, connection)  # 'close' has already stopped the idle ones
+        return CompletedProcess(list(command), outcome.returncode, outcome.stdout, outcome.stderr)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        while not self._idle.empty():
+            _stop_worker(*self._idle.get())
+        self._idle.put(None)  # Wakes callers waiting for a worker, which in flight calls no longer give back
+
+    def _start_worker(self) -> Tuple[BaseProcess, Connection]:
+        connection, worker_connection = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(worker_connection, self._preload), daemon=True)
+        process.start()
+        worker_connection.close()
+        return process, connection
+
+    def _parse_command(self, command: Sequence[str], stdin: str) -> Optional[_Job]:
+        # Only 'python script.py ...' and 'python -m module ...' are run warm
+        if len(command) < 2 or not _is_python(command[0]):
+            return None
+        if command[1] == _MODULE_FLAG:
+            if len(command) < 3:
+                return None
+            job = _Job(command[2], True, list(command[3:]), stdin)
+        elif command[1].endswith(".py") and Path(command[1]).is_file():
+            job = _Job(str(Path(command[1]).resolve()), False, list(command[2:]), stdin)
+        else:
+            return None
+        with self._lock:
+            return None if job.target in self._cold else job
+
+
+def _is_python(executable: str) -> bool:
+    name = Path(executable).name.lower()
+    return name in ("python", "python3", "python.exe", "python3.exe") or executable == sys.executable
+
+
+def _target_key(target: str) -> str:
+    return str(Path(target).resolve()) if target.endswith(".py") else target
+
+
+def _stop_worker(process: BaseProcess, connection: Connection) -> None:
+    try:
+        connection.send(None)
+    except OSError:
+        pass  # Already gone
+    connection.close()
+    process.join()
+
+
+def _worker_main(connection: Connection, preload: Sequence[str]) -> None:
+    # Running an already imported module as '__main__' is expected here, it is how preloaded modules are used
+    warnings.filterwarnings(
+        "ignore", message=".* found in sys.modules after import of package", category=RuntimeWarning
+    )
+    for module in preload:
+        importlib.import_module(module)
+    compiled: Dict[str, Tuple[float, CodeType]] = {}
+    while True:
+        job: Optional[_Job] = connection.recv()
+        if job is None:
+            break
+        connection.send(_run_job(job, compiled))
+
+
+def _run_job(job: _Job, compiled: Dict[str, Tuple[float, CodeType]]) -> _Outcome:
+    # Text streams over bytes, as scripts may also use their '.buffer'
+    stdin = io.TextIOWrapper(io.BytesIO(job.input.encode()), encoding="utf-8")
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", newline="\n", write_through=True)
+    stderr = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", newline="\n", write_through=True)
+    saved = sys.argv, sys.stdin, sys.stdout, sys.stderr, list(sys.path)
+    sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+    returncode = 0
+    try:
+        if job.is_module:
+            sys.argv = [job.target, *job.args]
+            runpy.run_module(job.target, run_name="__main__", alter_sys=True)
+        else:
+            sys.argv = [job.target, *job.args]
+            sys.path.insert(0, os.path.dirname(job.target))
+            exec(_compile(job.target, compiled), {"__name__": "__main__", "__file__": job.target})
+    except SystemExit as e:
+        returncode = _exit_code(e)
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.argv, sys.stdin, sys.stdout, sys.stderr, sys.path[:] = saved
+    return _Outcome(returncode, _text(stdout), _text(stderr))
+
+
+def _text(stream: io.TextIOWrapper) -> str:
+    stream.flush()
+    return stream.buffer.getvalue().decode("utf-8", errors="replace")
+
+
+def _compile(path: str, compiled: Dict[str, Tuple[float, CodeType]]) -> CodeType:
+    modified = os.path.getmtime(path)
+    cached = compiled.get(path)
+    if cached is None or cached[0] != modified:
+        with open(path, "rb") as source:
+            cached = compiled[path] = (modified, compile(source.read(), path, "exec"))
+    return cached[1]
+
+
+def _exit_code(exit_request: SystemExit) -> int:
+    # Mirrors the interpreter: no code is success, a message is printed and counts as failure
+    if exit_request.code is None:
+        return 0
+    if isinstance(exit_request.code, int):
+        return exit_request.code
+    print(exit_request.code, file=sys.stderr)
+    return 1
+
+
+def _main():
+    parser = ArgumentParser(description="Benchmarks cold subprocess calls against a pool of warm interpreters")
+    parser.add_argument("-n", "--runs", type=int, default=50, help="calls per approach (default: 50)")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="warm processes (default: 2)")
+    parser.add_argument("number", nargs="?", default="25", help="Fibonacci number to ask for (default: 25)")
+    args = parser.parse_args()
+
+    script = str(Path(__file__).with_name("fibonacci.py"))
+    python = sys.executable
+    approaches = {
+        "run, argument": lambda: run([python, script, args.number], text=True, capture_output=True).stdout,
+        "run, stdin": lambda: run([python, script], input=args.number, text=True, capture_output=True).stdout,
+        "Popen, argument": lambda: Popen(
+            [python, script, args.number], text=True, stdout=PIPE, stdin=PIPE, stderr=STDOUT
+        ).communicate()[0],
+    }
+    started = perf_counter()
+    with WarmRunner(args.workers, preload=["argparse", "enum"]) as runner:
+        runner.run([python, script, "1"])  # Waits for a worker to start, and compiles the script
+        startup = perf_counter() - started
+        approaches["warm, argument"] = lambda: runner.run([python, script, args.number]).stdout
+        approaches["warm, stdin"] = lambda: runner.run([python, script], input=args.number).stdout
+
+        print(f"Warm pool of {args.workers} started and ran its first call in {startup * 1000:.1f} ms")
+        print(f"{'approach':>16}  {'median ms':>10}  {'mean ms':>10}  {'calls/s':>8}")
+        expected: Optional[str] = None
+        for name, call in approaches.items():
+            timings: List[float] = []
+            for _ in range(args.runs):
+                start = perf_counter()
+                output = call()
+                timings.append(perf_counter() - start)
+            expected = expected or output
+            if output != expected:
+                raise RuntimeError(f"'{name}' printed '{output.strip()}'")
+            mean = sum(timings) / len(timings)
+            print(f"{name:>16}  {median(timings) * 1000:>10.2f}  {mean * 1000:>10.2f}  {1 / mean:>8.1f}")
+
+
+if __name__ == "__main__":
+    _main()
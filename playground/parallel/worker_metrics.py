@@ -0,0 +1,180 @@
+"""
+Per-task timing for the worker demos, kept in a fixed size in-memory ring buffer and exported on demand.
+- The input loop wraps each request in a 'TimedWork' stamped with the time it was queued.
+- A worker records when it took the item, how deep the queue still was, and when it finished. It sends this to the
+  result side as a 'TaskTiming' on the same queue as the results, so the time that message spends in transit is the
+  result transfer time.
+- The result side completes each 'TaskTiming' and stores it in a 'MetricsRing'. The ring can be written out as JSON
+  lines (one task per line) or summarised in the Prometheus text format: queue wait, compute and transfer time
+  quantiles, the latest queue depth, and each worker's utilisation over the tasks still in the ring.
+- Entering 'metrics' in a demo prints the Prometheus summary; 'metrics <path>' writes it to a file instead, or the raw
+  tasks as JSON lines when the path ends in '.jsonl'.
+- Times come from 'time.perf_counter_ns'. It is a system wide monotonic clock on Linux and Windows, so stamps taken in
+  different processes can be compared.
+"""
+import json
+from array import array
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter_ns
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from playground.parallel.worker_requests import WorkRequest
+
+METRICS_COMMAND = "metrics"
+_JSON_LINES_SUFFIX = ".jsonl"
+_FIELDS = ("enqueued_ns", "dequeued_ns", "finished_ns", "received_ns", "queue_depth", "worker", "result_count")
+_QUANTILES = (0.5, 0.9, 0.99)
+_NANOSECONDS = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class TimedWork:
+    request: WorkRequest
+    enqueued_ns: int
+
+    @classmethod
+    def now(cls, request: WorkRequest) -> "TimedWork":
+        return cls(request, perf_counter_ns())
+
+
+@dataclass
+class TaskTiming:
+    worker: int
+    enqueued_ns: int
+    dequeued_ns: int
+    queue_depth: int
+    finished_ns: int = 0
+    result_count: int = 0
+    received_ns: int = 0
+
+    @classmethod
+    def taken(cls, work: TimedWork, worker: int, queue_depth: int) -> "TaskTiming":
+        return cls(worker, work.enqueued_ns, perf_counter_ns(), queue_depth)
+
+    def finish(self, result_count: int) -> "TaskTiming":
+        self.finished_ns = perf_counter_ns()
+        self.result_count = result_count
+        return self
+
+    @property
+    def compute_seconds(self) -> float:
+        return (self.finished_ns - self.dequeued_ns) / _NANOSECONDS
+
+
+@dataclass(frozen=True)
+class MetricsExport:
+    destination: str  # Empty to print the Prometheus summary, otherwise the file to write
+
+
+class MetricsRing:
+    # One preallocated int64 column per field rather than a deque of objects: recording a task writes seven integers
+    # and allocates nothing, and the oldest tasks are overwritten once the ring is full.
+    def __init__(self, capacity: int = 4096):
+        if capacity <= 0:
+            raise ValueError(f"Capacity must be at least 1, was {capacity}")
+        self._capacity = capacity
+        self._columns: Dict[str, array] = {field: array("q", bytes(8 * capacity)) for field in _FIELDS}
+        self._next = 0
+        self._recorded = 0
+        self._lock = Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def recorded(self) -> int:
+        return self._recorded
+
+    def record(self, timing: TaskTiming) -> None:
+        if not timing.received_ns:
+            timing.received_ns = perf_counter_ns()
+        with self._lock:
+            slot = self._next
+            for field in _FIELDS:
+                self._columns[field][slot] = getattr(timing, field)
+            self._next = (slot + 1) % self._capacity
+            self._recorded += 1
+
+    def tasks(self) -> List[Dict[str, int]]:
+        # Oldest first
+        with self._lock:
+            count = min(self._recorded, self._capacity)
+            first = (self._next - count) % self._capacity
+            slots = [(first + offset) % self._capacity for offset in range(count)]
+            return [{field: self._columns[field][slot] for field in _FIELDS} for slot in slots]
+
+    def write_jsonl(self, output: TextIO) -> None:
+        for task in self.tasks():
+            task["queue_wait_ns"] = task["dequeued_ns"] - task["enqueued_ns"]
+            task["compute_ns"] = task["finished_ns"] - task["dequeued_ns"]
+            task["transfer_ns"] = task["received_ns"] - task["finished_ns"]
+            output.write(json.dumps(task) + "\n")
+
+    def prometheus_text(self) -> str:
+        tasks = self.tasks()
+        lines: List[str] = []
+        for name, description, durations in (
+                ("queue_wait", "Time tasks spent in the work queue",
+                 [task["dequeued_ns"] - task["enqueued_ns"] for task in tasks]),
+                ("compute", "Time workers spent calculating a task",
+                 [task["finished_ns"] - task["dequeued_ns"] for task in tasks]),
+                ("result_transfer", "Time from a worker finishing a task to the result side receiving it",
+                 [task["received_ns"] - task["finished_ns"] for task in tasks]),
+        ):
+            lines.extend(_summary_lines(f"fibonacci_task_{name}_seconds", description, durations))
+
+        lines.append("# HELP fibonacci_tasks_recorded_total Tasks recorded, including those since overwritten")
+        lines.append("# TYPE fibonacci_tasks_recorded_total counter")
+        lines.append(f"fibonacci_tasks_recorded_total {self._recorded}")
+        if tasks:
+            lines.append("# HELP fibonacci_work_queue_depth Items left in the work queue when the latest task was "
+                         "taken")
+            lines.append("# TYPE fibonacci_work_queue_depth gauge")
+            lines.append(f"fibonacci_work_queue_depth {tasks[-1]['queue_depth']}")
+            lines.append("# HELP fibonacci_worker_utilisation Share of the time covered by the ring each worker spent "
+                         "calculating")
+            lines.append("# TYPE fibonacci_worker_utilisation gauge")
+            for worker, utilisation in _utilisation(tasks).items():
+                lines.append(f'fibonacci_worker_utilisation{{worker="{worker}"}} {utilisation:.4f}')
+        return "\n".join(lines) + "\n"
+
+
+def parse_metrics_command(user_input: str) -> Optional[MetricsExport]:
+    command, _, destination = user_input.strip().partition(" ")
+    return MetricsExport(destination.strip()) if command == METRICS_COMMAND else None
+
+
+def export_metrics(ring: MetricsRing, export: MetricsExport) -> str:
+    # Returns the text to print: the summary itself, or a note saying where it went
+    if not export.destination:
+        return ring.prometheus_text()
+    with open(export.destination, "w", encoding="utf-8") as output:
+        if export.destination.endswith(_JSON_LINES_SUFFIX):
+            ring.write_jsonl(output)
+        else:
+            output.write(ring.prometheus_text())
+    return f"Wrote metrics of the last {min(ring.recorded, ring.capacity)} tasks to '{export.destination}'"
+
+
+def _summary_lines(metric: str, description: str, durations_ns: List[int]) -> Iterator[str]:
+    yield f"# HELP {metric} {description}"
+    yield f"# TYPE {metric} summary"
+    ordered = sorted(durations_ns)
+    for quantile in _QUANTILES:
+        if ordered:
+            value = f"{ordered[min(int(quantile * len(ordered)), len(ordered) - 1)] / _NANOSECONDS:.9f}"
+        else:
+            value = "NaN"
+        yield f'{metric}{{quantile="{quantile}"}} {value}'
+    yield f"{metric}_sum {sum(ordered) / _NANOSECONDS:.9f}"
+    yield f"{metric}_count {len(ordered)}"
+
+
+def _utilisation(tasks: List[Dict[str, int]]) -> Dict[int, float]:
+    window_ns = max(task["finished_ns"] for task in tasks) - min(task["dequeued_ns"] for task in tasks)
+    busy_ns: Dict[int, int] = {}
+    for task in tasks:
+        busy_ns[task["worker"]] = busy_ns.get(task["worker"], 0) + task["finished_ns"] - task["dequeued_ns"]
+    return {worker: busy / window_ns if window_ns else 1.0 for worker, busy in busy_ns.items()}
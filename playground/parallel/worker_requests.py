@@ -0,0 +1,64 @@
+"""
+Work requests shared by the worker scripts.
+- A line of user input is either a single positive number ('25'), an inclusive range ('10000..10100') or several numbers
+  separated by commas and/or spaces ('5, 8, 13').
+- Ranges and lists become a single 'FibonacciBatch' work item, calculated in one sweep by 'calculate': a range with
+  'fibonacci_range', never materialised, and a list with 'fibonacci_many'.
+"""
+from dataclasses import dataclass
+from typing import Callable, Iterator, Sequence, Tuple, Union
+
+from playground.parallel.fibonacci import fibonacci, fibonacci_many, fibonacci_range
+
+_RANGE_SEPARATOR = ".."
+
+
+@dataclass(frozen=True)
+class FibonacciBatch:
+    numbers: Sequence[int]  # A range for '..' input, so even a long range is cheap to put on a queue
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __str__(self) -> str:
+        if isinstance(self.numbers, range):
+            return f"{self.numbers.start}{_RANGE_SEPARATOR}{self.numbers.stop - 1}"
+        return ", ".join(str(number) for number in self.numbers)
+
+
+WorkRequest = Union[int, FibonacciBatch]
+
+
+def parse_work_request(user_input: str) -> WorkRequest:
+    user_input = user_input.strip()
+    if _RANGE_SEPARATOR in user_input:
+        first, _, last = user_input.partition(_RANGE_SEPARATOR)
+        first, last = _parse_number(first.strip()), _parse_number(last.strip())
+        if last < first:
+            raise ValueError(f"Range must not end before it starts, was '{user_input}'")
+        return FibonacciBatch(range(first, last + 1))
+
+    numbers = [_parse_number(part) for part in user_input.replace(",", " ").split()]
+    if not numbers:
+        raise ValueError("Must provide at least one number")
+    return numbers[0] if len(numbers) == 1 else FibonacciBatch(tuple(numbers))
+
+
+def calculate(request: WorkRequest, single: Callable[[int], int] = fibonacci) -> Iterator[Tuple[int, int]]:
+    # Yields (n, F(n)) pairs; a batch is produced lazily in ascending order, so its results can be passed on one at a
+    # time instead of being held all together
+    if isinstance(request, FibonacciBatch):
+        numbers = request.numbers
+        if isinstance(numbers, range):
+            # Already in order, so stepped through without 'fibonacci_many' sorting it into a list first
+            yield from zip(numbers, fibonacci_range(numbers.start, numbers.stop))
+        else:
+            yield from fibonacci_many(numbers)
+    else:
+        yield request, single(request)
+
+
+def _parse_number(raw: str) -> int:
+    if not raw.isnumeric() or int(raw) <= 0:
+        raise ValueError(f"Must provide integers greater than 0, was '{raw}'")
+    return int(raw)